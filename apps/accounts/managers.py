@@ -85,7 +85,10 @@ class CustomUserManager(BaseUserManager):
         return user
 
     def get_queryset(self):
-        return GetOrNoneQuerySet(self.model, using=self._db)
+        # Deleted accounts waiting to be purged are left out
+        return GetOrNoneQuerySet(self.model, using=self._db).filter(
+            deleted_at__isnull=True
+        )
 
     def get_or_none(self, **kwargs):
         return self.get_queryset().get_or_none(**kwargs)
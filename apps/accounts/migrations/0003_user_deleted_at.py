@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0002_alter_user_access_alter_user_refresh"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0003_user_deleted_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="broadcasts_synced_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="notifications_read_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:50
+
+from django.db import migrations, models
+
+# Counts the unread entries of each inbox, kept from now on by apps/profiles/inbox.py
+BACKFILL_SQL = """
+UPDATE accounts_user u SET unread_notifications = (
+    SELECT count(*) FROM profiles_inboxentry e
+    WHERE e.user_id = u.id AND NOT e.is_read
+        AND (u.notifications_read_at IS NULL OR e.created_at > u.notifications_read_at)
+);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0004_user_inbox_watermarks"),
+        ("profiles", "0005_inboxentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="unread_notifications",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0005_user_unread_notifications"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["updated_at"], name="user_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0006_user_updated_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="inbox_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
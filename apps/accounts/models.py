@@ -34,6 +34,18 @@ class User(AbstractBaseUser, PermissionsMixin):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Set when the account is deleted, until it's purged (see apps/common/purge.py)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Notification inbox watermarks (see apps/profiles/inbox.py): notifications up to
+    # notifications_read_at are read, broadcasts up to broadcasts_synced_at are in it
+    notifications_read_at = models.DateTimeField(null=True, blank=True, editable=False)
+    broadcasts_synced_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Badge counter of the inbox's unread notifications
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped by every change of the inbox or its archive, the version of their listings
+    inbox_version = models.PositiveIntegerField(default=0, editable=False)
+
     # Profile Fields
     bio = models.CharField(max_length=200, null=True, blank=True)
     city = models.ForeignKey(
@@ -53,6 +65,10 @@ class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         verbose_name = _("User")
         verbose_name_plural = _("Users")
+        indexes = [
+            # The latest profile change versions the posts lists (see posts_version)
+            models.Index(fields=["updated_at"], name="user_updated_idx"),
+        ]
 
     def __str__(self):
         return self.full_name
@@ -32,8 +32,8 @@ auth_router = Router(tags=["Auth"])
     response={201: RegisterResponseSchema},
 )
 async def register(request, data: RegisterUserSchema):
-    # Check for existing user
-    existing_user = await User.objects.aget_or_none(email=data.email)
+    # Check for existing user (including a deleted one that isn't purged yet)
+    existing_user = await User._base_manager.filter(email=data.email).aexists()
     if existing_user:
         raise RequestError(
             err_code=ErrorCode.INVALID_ENTRY,
@@ -4,6 +4,7 @@ from ninja.responses import Response
 from ninja.errors import ValidationError, AuthenticationError
 from apps.common.error import ErrorCode
 from apps.common.exceptions import RequestError, request_errors, validation_errors
+from apps.common.microcache import response_cache
 from apps.common.schemas import ResponseSchema
 
 from apps.general.views import general_router
@@ -13,7 +14,19 @@ from apps.feed.views import feed_router
 from apps.chat.views import chats_router
 
 
-api = NinjaAPI(
+class SocialnetAPI(NinjaAPI):
+    def create_response(self, request, *args, **kwargs):
+        response = super().create_response(request, *args, **kwargs)
+        # ETag of a conditional view (see apps/common/etags.py)
+        etag = getattr(request, "etag", None)
+        if etag and response.status_code == 200:
+            response["ETag"] = etag
+        # Anonymous response cache of a public view (see apps/common/microcache.py)
+        response_cache.store(request, response)
+        return response
+
+
+api = SocialnetAPI(
     title=settings.SITE_NAME,
     description="""
         A Social Networking API built with Django Ninja
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.chat"
+
+    def ready(self):
+        from apps.chat.utils import connect_signals
+
+        connect_signals()
@@ -1,4 +1,3 @@
-from django.conf import settings
 from apps.chat.models import Chat, Message
 from apps.accounts.models import User
 from apps.chat.schemas import MessageSchema
@@ -7,8 +6,9 @@ from apps.chat.schemas import MessageSchema
 from apps.chat.socket_schemas import SocketMessageSchema
 from apps.common.consumers import BaseConsumer
 from apps.common.error import ErrorCode
+from apps.common.realtime import enqueue
 from uuid import UUID
-import websockets, os, json
+import json
 
 
 class ChatConsumer(BaseConsumer):
@@ -33,7 +33,6 @@ class ChatConsumer(BaseConsumer):
 
     async def receive(self, text_data):
         user = self.scope["user"]
-        user_id = user.id if isinstance(user, User) else None
 
         # Validate entry
         data, validated = await self.validate_entry(text_data, SocketMessageSchema)
@@ -41,7 +40,7 @@ class ChatConsumer(BaseConsumer):
             return await self.send_error_message(data)
 
         status = data.status
-        if status == "DELETED" and user != settings.SOCKET_SECRET:
+        if status == "DELETED":  # Published by the delete endpoint itself
             return await self.send_error_message(
                 {
                     "type": ErrorCode.INVALID_ENTRY,
@@ -50,32 +49,31 @@ class ChatConsumer(BaseConsumer):
                 },
             )
         message_data = {"id": str(data.id), "status": data.status}
-        if status != "DELETED":
-            message = await Message.objects.select_related(
-                "sender", "sender__avatar", "file"
-            ).aget_or_none(id=data.id)
-            if not message:
-                return await self.send_error_message(
-                    {
-                        "type": ErrorCode.NON_EXISTENT,
-                        "message": "Invalid message ID",
-                    }
-                )
-            if message.sender_id != user_id:
-                return await self.send_error_message(
-                    {
-                        "type": ErrorCode.INVALID_OWNER,
-                        "message": "Message isn't yours",
-                    }
-                )
-            data = message_data | {
-                "chat_id": str(message.chat_id),
-                "created_at": str(message.created_at),
-                "updated_at": str(message.updated_at),
-            }
-            message_data = data | MessageSchema.from_orm(message).dict(
-                exclude={"id", "chat_id", "created_at", "updated_at"},
+        message = await Message.objects.select_related(
+            "sender", "sender__avatar", "file"
+        ).aget_or_none(id=data.id)
+        if not message:
+            return await self.send_error_message(
+                {
+                    "type": ErrorCode.NON_EXISTENT,
+                    "message": "Invalid message ID",
+                }
+            )
+        if message.sender_id != user.id:
+            return await self.send_error_message(
+                {
+                    "type": ErrorCode.INVALID_OWNER,
+                    "message": "Message isn't yours",
+                }
             )
+        data = message_data | {
+            "chat_id": str(message.chat_id),
+            "created_at": str(message.created_at),
+            "updated_at": str(message.updated_at),
+        }
+        message_data = data | MessageSchema.from_orm(message).dict(
+            exclude={"id", "chat_id", "created_at", "updated_at"},
+        )
         await self.channel_layer.group_send(
             self.room_group_name, {"type": "chat_message", "message": message_data}
         )
@@ -97,23 +95,22 @@ class ChatConsumer(BaseConsumer):
 
     async def validate_chat_membership(self, id):
         user = self.scope["user"]
-        if user != settings.SOCKET_SECRET:
-            chat, obj_user = await self.get_objects(id)
-            if not chat and not obj_user:  # If no chat nor user
-                await self.send_error_message(
-                    {"type": "invalid_input", "message": "Invalid ID"}
-                )
-                return await self.close(code=1001)
-            if (
-                chat and user not in chat.users.all() and user.id != chat.owner_id
-            ):  # If chat but user is not a member
-                await self.send_error_message(
-                    {
-                        "type": "invalid_member",
-                        "message": "You're not a member of this chat",
-                    }
-                )
-                return await self.close(code=1001)
+        chat, obj_user = await self.get_objects(id)
+        if not chat and not obj_user:  # If no chat nor user
+            await self.send_error_message(
+                {"type": "invalid_input", "message": "Invalid ID"}
+            )
+            return await self.close(code=1001)
+        if (
+            chat and user not in chat.users.all() and user.id != chat.owner_id
+        ):  # If chat but user is not a member
+            await self.send_error_message(
+                {
+                    "type": "invalid_member",
+                    "message": "You're not a member of this chat",
+                }
+            )
+            return await self.close(code=1001)
         # Add group and channel name to channel layer
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
@@ -130,21 +127,8 @@ class ChatConsumer(BaseConsumer):
             await self.send(text_data=json.dumps(message))
 
 
-async def send_message_deletion_in_socket(
-    secured: bool, host: str, chat_id: UUID, message_id: UUID
-):
-    if os.environ.get("ENVIRONMENT") == "TESTING":
-        return
-    websocket_scheme = "wss://" if secured else "ws://"
-    uri = f"{websocket_scheme}{host}/api/v2/ws/chats/{chat_id}/"
-    chat_data = {
-        "id": str(message_id),
-        "status": "DELETED",
-    }
-    headers = [
-        ("Authorization", settings.SOCKET_SECRET),
-    ]
-    async with websockets.connect(uri, extra_headers=headers) as websocket:
-        # Send the message to the WebSocket server
-        await websocket.send(json.dumps(chat_data))
-        await websocket.close()
+def enqueue_message_deletion(chat_id: UUID, message_id: UUID):
+    # Sends the deletion to the chat's socket (see ChatConsumer), in the caller's
+    # transaction
+    message_data = {"id": str(message_id), "status": "DELETED"}
+    enqueue(f"chat_{chat_id}", {"type": "chat_message", "message": message_data})
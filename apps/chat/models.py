@@ -4,6 +4,8 @@ from django.db.models.signals import m2m_changed
 from apps.accounts.models import User
 from apps.chat.validators import validate_chat_users_m2m
 from apps.common.file_processors import FileProcessor
+from apps.common.managers import SoftDeleteManager
+from apps.common.purge import register_purge_steps
 
 from apps.common.models import BaseModel, File
 
@@ -20,6 +22,11 @@ class Chat(BaseModel):
     description = models.CharField(max_length=1000, null=True, blank=True)
     image = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True)
 
+    # Set when the chat is deleted, until it's purged (see apps/common/purge.py)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = SoftDeleteManager()
+
     def __str__(self):
         return str(self.id)
 
@@ -66,8 +73,9 @@ class Message(BaseModel):
     file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True)
 
     def save(self, *args, **kwargs):
-        if self._state.adding:
-            self.chat.save()  # So that chat updated_at can be updated
+        # So that chat updated_at can be updated, new and edited messages show in the
+        # chats list (and its ETag) as the latest message
+        self.chat.save()
         super().save(*args, **kwargs)
 
     @property
@@ -83,3 +91,28 @@ class Message(BaseModel):
 
     class Meta:
         get_latest_by = "created_at"
+
+
+class ChatReadState(models.Model):
+    """A chat member's unread messages counter (badge), kept by apps/chat/utils.py"""
+
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="read_states")
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="chat_read_states"
+    )
+    unread = models.PositiveIntegerField(default=0)
+    read_at = models.DateTimeField(null=True, blank=True)  # Last time the chat was read
+
+    def __str__(self):
+        return f"{self.chat_id} ------ {self.user_id}"
+
+    class Meta:
+        unique_together = ("user", "chat")
+
+
+@register_purge_steps(Chat)
+def get_chat_purge_steps(chat):
+    return [
+        ChatReadState.objects.filter(chat=chat),
+        Message.objects.filter(chat=chat),
+    ]
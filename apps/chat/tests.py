@@ -159,6 +159,9 @@ class TestChat(TestCase):
                         "per_page": 400,
                         "current_page": 1,
                         "last_page": 1,
+                        "last_page_estimated": False,
+                        "next_cursor": None,
+                        "prev_cursor": None,
                         "items": [
                             {
                                 "id": str(message.id),
@@ -1,12 +1,38 @@
+from django.db import connection, transaction
 from django.db.models import Q, Prefetch
+from django.db.models.signals import pre_delete
+from django.utils import timezone
 from apps.accounts.models import User
-from apps.chat.models import Chat, Message
+from apps.chat.models import Chat, ChatReadState, Message
 from apps.common.error import ErrorCode
 from apps.common.exceptions import RequestError
 from apps.common.models import File
+from apps.chat.consumers import enqueue_message_deletion
+from apps.profiles.utils import enqueue_badges
 from asgiref.sync import sync_to_async
 
 
+# Counts a new message as unread for every member of its chat but the sender
+ADD_UNREAD_MESSAGE_SQL = """
+    INSERT INTO chat_chatreadstate AS s (chat_id, user_id, unread)
+    SELECT %(chat_id)s, member_id, 1 FROM (
+        SELECT owner_id AS member_id FROM chat_chat WHERE id = %(chat_id)s
+        UNION SELECT user_id FROM chat_chat_users WHERE chat_id = %(chat_id)s
+    ) members
+    WHERE member_id <> %(sender_id)s
+    ON CONFLICT (user_id, chat_id) DO UPDATE SET unread = s.unread + 1
+    RETURNING user_id, unread
+"""
+
+# Uncounts a deleted message for the members who hadn't read the chat since it was sent
+REMOVE_UNREAD_MESSAGE_SQL = """
+    UPDATE chat_chatreadstate SET unread = unread - 1
+    WHERE chat_id = %(chat_id)s AND user_id <> %(sender_id)s AND unread > 0
+        AND (read_at IS NULL OR read_at < %(created_at)s)
+    RETURNING user_id, unread
+"""
+
+
 # Create file object
 async def create_file(file_type=None):
     file = None
@@ -22,6 +48,7 @@ def update_group_chat_users(instance, action, data):
             instance.users.add(*data)
         elif action == "remove":
             instance.users.remove(*data)
+            ChatReadState.objects.filter(chat=instance, user__in=data).delete()
         else:
             raise ValueError("Invalid Action")
 
@@ -49,12 +76,6 @@ async def get_chat_object(user, chat_id):
         await Chat.objects.filter(Q(owner=user) | Q(users__id=user.id))
         .select_related("owner", "owner__avatar", "image")
         .prefetch_related(
-            Prefetch(
-                "messages",
-                queryset=Message.objects.select_related(
-                    "sender", "sender__avatar", "file"
-                ).order_by("-created_at"),
-            ),
             Prefetch(
                 "users",
                 queryset=User.objects.select_related("avatar"),
@@ -129,3 +150,68 @@ async def usernames_to_add_and_remove_validations(
     if users_to_remove:
         await sync_to_async(update_group_chat_users)(chat, "remove", users_to_remove)
     return chat
+
+
+def count_unread_message(message, deleted=False):
+    # Moves the unread counters of the chat's members for a sent (or deleted) message,
+    # and their badges, in the caller's transaction. Returns the new counters by user.
+    params = {
+        "chat_id": message.chat_id,
+        "sender_id": message.sender_id,
+        "created_at": message.created_at,
+    }
+    sql = REMOVE_UNREAD_MESSAGE_SQL if deleted else ADD_UNREAD_MESSAGE_SQL
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        counts = dict(cursor.fetchall())
+    enqueue_chat_badges(message.chat_id, counts)
+    return counts
+
+
+def create_message(**fields):
+    # Creates the message, counted as unread for the chat's members, in one transaction
+    with transaction.atomic():
+        message = Message.objects.create(**fields)
+        count_unread_message(message)
+    return message
+
+
+def remove_message(message, with_chat=False):
+    # Deletes the message (or its whole chat), uncounted (see uncount_message) and sent
+    # to the chat's socket, in one transaction
+    with transaction.atomic():
+        enqueue_message_deletion(message.chat_id, message.id)
+        if with_chat:
+            message.chat.delete()  # Message deletes if chat gets deleted (CASCADE)
+        else:
+            message.delete()
+            message.chat.save()  # Like a new message, it may change the latest one
+
+
+def uncount_message(sender, instance, **kwargs):
+    # A message being deleted (on its own, with its chat or by a purge) is uncounted, in
+    # the deletion's transaction
+    count_unread_message(instance, deleted=True)
+
+
+def read_chat(user, chat_id):
+    # Clears the user's unread counter of the chat (and badge)
+    with transaction.atomic():
+        read = ChatReadState.objects.filter(
+            chat_id=chat_id, user=user, unread__gt=0
+        ).update(unread=0, read_at=timezone.now())
+        if read:
+            enqueue_chat_badges(chat_id, {user.id: 0})
+
+
+def enqueue_chat_badges(chat_id, counts):
+    badges = {
+        user_id: {"chats": [{"chat_id": str(chat_id), "unread": unread}]}
+        for user_id, unread in counts.items()
+    }
+    enqueue_badges(badges)
+
+
+# Connected in ChatConfig.ready
+def connect_signals():
+    pre_delete.connect(uncount_message, sender=Message)
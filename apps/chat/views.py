@@ -1,20 +1,24 @@
 from uuid import UUID
-from django.db.models import Q
+from django.db.models import Count, Max, Q
 from apps.accounts.models import User
-from apps.chat.consumers import send_message_deletion_in_socket
 from apps.chat.models import Chat, Message
 from apps.chat.utils import (
     create_file,
+    create_message,
     get_chat_object,
     get_chats_queryset,
     get_message_object,
+    read_chat,
+    remove_message,
     update_group_chat_users,
     usernames_to_add_and_remove_validations,
 )
 from apps.common.error import ErrorCode
 from apps.common.exceptions import RequestError
 from apps.common.file_types import ALLOWED_FILE_TYPES
-from apps.common.paginators import CustomPagination
+from apps.common.paginators import CustomPagination, EstimatedCount
+from apps.common.etags import conditional, get_auth_user
+from apps.common.purge import tombstone
 from apps.common.responses import CustomResponse
 from apps.common.schemas import ResponseSchema
 from apps.common.utils import AuthUser, set_dict_attr
@@ -34,6 +38,17 @@ from asgiref.sync import sync_to_async
 chats_router = Router(tags=["Chat"], auth=AuthUser())
 
 paginator = CustomPagination()
+messages_paginator = CustomPagination(count_strategy=EstimatedCount())
+
+
+async def chats_version(request, page=1):
+    user = await get_auth_user(request)
+    chat_ids = Chat.objects.filter(Q(owner=user) | Q(users__id=user.id)).values("id")
+    # New, edited and deleted messages update their chat (see Message.save)
+    chats = await Chat.objects.filter(id__in=chat_ids).aaggregate(
+        count=Count("id"), updated_at=Max("updated_at")
+    )
+    return [user.id, chats]
 
 
 @chats_router.get(
@@ -42,9 +57,11 @@ paginator = CustomPagination()
     description="""
         This endpoint retrieves a paginated list of the current user chats
         Only chats with type "GROUP" have name, image and description.
+        Send the ETag of a previous response as If-None-Match to get a 304 if nothing changed
     """,
     response=ChatsResponseSchema,
 )
+@conditional(chats_version)
 async def retrieve_user_chats(request, page: int = 1):
     user = await request.auth
     chats = await get_chats_queryset(user)
@@ -117,7 +134,7 @@ async def send_message(request, data: MessageCreateSchema):
     # Create Message
     file = await create_file(data.file_type)
     file_upload_status = True if file else False
-    message = await Message.objects.acreate(
+    message = await sync_to_async(create_message)(
         chat=chat, sender=user, text=data.text, file=file
     )
     message.file_upload_status = file_upload_status
@@ -129,15 +146,20 @@ async def send_message(request, data: MessageCreateSchema):
     summary="Retrieve messages from a Chat",
     description="""
         This endpoint retrieves all messages in a chat.
+        Pass the next_cursor or prev_cursor of a response as the cursor param to page by cursor (page is ignored then)
     """,
     response=ChatResponseSchema,
 )
-async def retrieve_messages(request, chat_id: UUID, page: int = 1):
+async def retrieve_messages(request, chat_id: UUID, page: int = 1, cursor: str = None):
     user = await request.auth
     chat = await get_chat_object(user, chat_id)
+    await sync_to_async(read_chat)(user, chat.id)
+    messages = Message.objects.filter(chat_id=chat.id).select_related(
+        "sender", "sender__avatar", "file"
+    )
 
-    paginator.page_size = 400
-    paginated_data = await paginator.paginate_queryset(chat.messages.all(), page)
+    messages_paginator.page_size = 400
+    paginated_data = await messages_paginator.paginate_queryset(messages, page, cursor)
     chat.lmessages = paginated_data["items"][:1]  # Latest message to be used in schema
     data = {"chat": chat, "messages": paginated_data, "users": chat.recipients}
     return CustomResponse.success(message="Messages fetched", data=data)
@@ -210,7 +232,8 @@ async def delete_group_chat(request, chat_id: UUID):
             err_msg="User owns no group chat with that ID",
             status_code=404,
         )
-    await chat.adelete()
+    # Hidden right away, its messages are purged in the background
+    await sync_to_async(tombstone)(chat)
     return CustomResponse.success(message="Group Chat Deleted")
 
 
@@ -262,16 +285,10 @@ async def delete_message(request, message_id: UUID):
     chat = message.chat
     messages_count = await chat.messages.acount()
 
-    # Send message deletion socket
-    await send_message_deletion_in_socket(
-        request.is_secure(), request.get_host(), chat.id, message.id
-    )
-
-    # Delete message and chat if its the last message in the dm being deleted
-    if messages_count == 1 and chat.ctype == "DM":
-        await chat.adelete()  # Message deletes if chat gets deleted (CASCADE)
-    else:
-        await message.adelete()
+    # Delete message and chat if its the last message in the dm being deleted, with
+    # the message deletion socket
+    with_chat = messages_count == 1 and chat.ctype == "DM"
+    await sync_to_async(remove_message)(message, with_chat)
     return CustomResponse.success(message="Message deleted")
 
 
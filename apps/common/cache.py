@@ -0,0 +1,94 @@
+from collections import OrderedDict
+from django.core.cache import caches
+import logging, os, threading, time
+
+logger = logging.getLogger(__name__)
+
+
+class LocalLRUCache:
+    """A bounded in-process cache. Least recently used keys are evicted first."""
+
+    def __init__(self, maxsize: int = 1000, timeout: int = 60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.data = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self.lock:
+            for key in keys:
+                item = self.data.get(key)
+                if not item:
+                    continue
+                if item[0] < now:
+                    del self.data[key]
+                    continue
+                self.data.move_to_end(key)
+                found[key] = item[1]
+        return found
+
+    def set_many(self, data):
+        expires_at = time.monotonic() + self.timeout
+        with self.lock:
+            for key, value in data.items():
+                self.data[key] = (expires_at, value)
+                self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+
+class TieredCache:
+    """A local LRU in front of a shared cache (Redis) of the `alias` in settings.CACHES.
+    Hot keys are served from process memory, the shared cache fills the other workers.
+    The shared cache is best effort: if it's down, only the local LRU is used."""
+
+    def __init__(
+        self,
+        alias: str,
+        prefix: str,
+        maxsize: int = 1000,
+        local_timeout: int = 60,
+        timeout: int = 600,
+    ):
+        self.alias = alias
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = LocalLRUCache(maxsize, local_timeout)
+
+    @property
+    def shared(self):
+        # Tests don't have a Redis server, they run on the local LRU alone
+        if os.environ.get("ENVIRONMENT") == "TESTING":
+            return None
+        return caches[self.alias]
+
+    def make_key(self, key):
+        return f"{self.prefix}:{key}"
+
+    async def get_many(self, keys):
+        keys = [self.make_key(key) for key in keys]
+        found = self.local.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        shared = self.shared
+        if missing and shared:
+            try:
+                from_shared = await shared.aget_many(missing)
+            except Exception as e:
+                logger.warning(f"Shared cache {self.alias} unavailable: {e}")
+                from_shared = {}
+            self.local.set_many(from_shared)
+            found |= from_shared
+        prefix_length = len(self.prefix) + 1
+        return {key[prefix_length:]: value for key, value in found.items()}
+
+    async def set_many(self, data):
+        data = {self.make_key(key): value for key, value in data.items()}
+        self.local.set_many(data)
+        shared = self.shared
+        if data and shared:
+            try:
+                await shared.aset_many(data, self.timeout)
+            except Exception as e:
+                logger.warning(f"Shared cache {self.alias} unavailable: {e}")
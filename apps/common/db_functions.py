@@ -0,0 +1,47 @@
+from django.db.models import F, FloatField, Func, JSONField, Value
+
+
+class JSONCounterIncrement(Func):
+    """
+    Adds `value` to the integer stored at `key` of a jsonb counter object in place,
+    e.g {"LIKE": 2} -> {"LIKE": 3}. Missing keys count from 0 and keys are dropped at 0.
+    Used in updates so the read-modify-write happens in one SQL statement.
+    """
+
+    output_field = JSONField()
+
+    def __init__(self, expression, key, value):
+        if isinstance(expression, str):
+            expression = F(expression)
+        super().__init__(expression, Value(key), Value(value))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        expression, key, value = self.source_expressions
+        sql, params = compiler.compile(expression)
+        key, value = key.value, value.value
+        # Keys that drop to 0 are removed to keep the object compact
+        template = (
+            f"CASE WHEN COALESCE(({sql} ->> %s)::int, 0) + %s = 0 "
+            f"THEN COALESCE({sql}, '{{}}') - %s "
+            f"ELSE jsonb_set(COALESCE({sql}, '{{}}'), ARRAY[%s], "
+            f"to_jsonb(COALESCE(({sql} ->> %s)::int, 0) + %s)) END"
+        )
+        return template, [
+            *params,
+            key,
+            value,
+            *params,
+            key,
+            *params,
+            key,
+            *params,
+            key,
+            value,
+        ]
+
+
+class AgeInHours(Func):
+    """Hours elapsed since a datetime expression, e.g AgeInHours("created_at")"""
+
+    template = "(EXTRACT(EPOCH FROM (STATEMENT_TIMESTAMP() - %(expressions)s)) / 3600)"
+    output_field = FloatField()
@@ -16,3 +16,4 @@ class ErrorCode:
     INVALID_VALUE = "invalid_value"
     NOT_ALLOWED = "not_allowed"
     INVALID_DATA_TYPE = "invalid_data_type"
+    CONFLICT = "conflict"
@@ -0,0 +1,49 @@
+from functools import wraps
+from django.http import HttpResponse
+from django.utils.http import parse_etags, quote_etag
+import asyncio, hashlib, inspect, json
+
+
+def make_etag(request, version) -> str:
+    # Strong ETag of the requested url (with its query) at `version`
+    data = json.dumps([request.get_full_path(), version], default=str)
+    return quote_etag(hashlib.sha1(data.encode()).hexdigest())
+
+
+def conditional(version):
+    """Conditional GET for a view. `version` is an async function called like the view
+    that returns a cheap version key of the response (e.g max updated_at and counters),
+    or None to skip. A request whose If-None-Match has the resulting ETag gets a 304
+    before the view runs. Otherwise the view runs and its response carries the ETag
+    (set by the api's create_response)."""
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key = await version(request, *args, **kwargs)
+            if key is not None:
+                etag = make_etag(request, key)
+                if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+                if etag in if_none_match or "*" in if_none_match:
+                    response = HttpResponse(status=304)
+                    response["ETag"] = etag
+                    return response
+                request.etag = etag
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+async def get_auth_user(request):
+    # Awaits the auth user (request.auth is a coroutine with async auth), leaving an
+    # awaitable of it in place so the view can still await request.auth
+    auth = request.auth
+    if not inspect.isawaitable(auth):
+        return auth
+    user = await auth
+    resolved = asyncio.get_running_loop().create_future()
+    resolved.set_result(user)
+    request.auth = resolved
+    return user
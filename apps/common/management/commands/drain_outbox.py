@@ -0,0 +1,53 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.common.realtime import drain, get_outbox_stats, lock_drain
+import asyncio, logging, time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATS_INTERVAL = 60  # Seconds between the logged outbox metrics
+
+
+class Command(BaseCommand):
+    help = "Sends the socket events of the outbox to the channel layer. Keep it running (more workers only stand by, one drains at a time)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Drain what's pending and exit"
+        )
+
+    def handle(self, **options) -> None:
+        asyncio.run(self.run(options["once"]))
+
+    async def run(self, once):
+        while not await sync_to_async(lock_drain)():
+            if once:
+                logger.info("Another worker is draining the outbox")
+                return
+            await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL * 10)
+
+        sent = failed = 0
+        max_lag, logged_at = 0, time.monotonic()
+        while True:
+            batch_sent, batch_failed, lag = await drain()
+            sent, failed = sent + batch_sent, failed + batch_failed
+            max_lag = max(max_lag, lag)
+            if once and batch_sent + batch_failed == 0:
+                break
+            if time.monotonic() - logged_at >= STATS_INTERVAL:
+                await self.log_stats(sent, failed, max_lag)
+                sent = failed = max_lag = 0
+                logged_at = time.monotonic()
+            if batch_sent < settings.OUTBOX_BATCH_SIZE:
+                # Caught up (or held back by retries), wait for new events
+                await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL)
+        await self.log_stats(sent, failed, max_lag)
+
+    async def log_stats(self, sent, failed, max_lag):
+        pending, age, given_up = await sync_to_async(get_outbox_stats)()
+        logger.info(
+            f"Sent {sent} outbox event(s) (max lag {max_lag:.2f}s), {failed} failed. "
+            f"{pending} pending (oldest {age:.2f}s), {given_up} given up on"
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from apps.common.purge import resume_stalled_purges
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Resumes purges of deleted posts, users and group chats that stalled. Run it periodically (e.g every 10 minutes)"
+
+    def handle(self, **options) -> None:
+        resumed = resume_stalled_purges()
+        logger.info(f"Resumed {resumed} stalled purge(s)")
@@ -28,3 +28,18 @@ class GetOrNoneManager(models.Manager):
 
     async def aget_or_none(self, **kwargs):
         return await self.get_queryset().aget_or_none(**kwargs)
+
+
+class SoftDeleteManager(GetOrNoneManager):
+    """Leaves out tombstoned (soft deleted) objects, which are waiting to be purged.
+    Objects whose `related` objects (e.g an author) are tombstoned are left out too."""
+
+    def __init__(self, related=()):
+        super().__init__()
+        self.related = related
+
+    def get_queryset(self):
+        tombstones = {"deleted_at__isnull": True}
+        for field in self.related:
+            tombstones[f"{field}__deleted_at__isnull"] = True
+        return super().get_queryset().filter(**tombstones)
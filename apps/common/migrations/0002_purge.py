@@ -0,0 +1,44 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:15
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("common", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Purge",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                        unique=True,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("target_type", models.CharField(max_length=100)),
+                ("target_id", models.UUIDField()),
+                ("step", models.IntegerField(default=0)),
+                ("deleted_count", models.IntegerField(default=0)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("completed_at", None)),
+                        fields=["updated_at"],
+                        name="purge_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
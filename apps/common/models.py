@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 from .managers import GetOrNoneManager
 
 
@@ -22,3 +23,53 @@ class File(BaseModel):
 
     def __str__(self):
         return str(self.id)
+
+
+class Purge(BaseModel):
+    """Removal of a tombstoned object and everything depending on it, in batches
+    (see apps/common/purge.py). Records how far it has gone."""
+
+    target_type = models.CharField(max_length=100)  # Model label, e.g feed.Post
+    target_id = models.UUIDField()
+    step = models.IntegerField(default=0)  # Steps completed
+    deleted_count = models.IntegerField(default=0)  # Rows deleted so far
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.target_type} {self.target_id} ------ {self.deleted_count}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(completed_at=None),
+                name="purge_pending_idx",
+            ),
+        ]
+
+
+class OutboxEvent(models.Model):
+    """A socket event to send to a channel layer group, stored in the transaction of
+    the change it's about and sent by the drain_outbox worker (see
+    apps/common/realtime.py). Deleted once sent."""
+
+    id = models.BigAutoField(primary_key=True)  # Events of a group are sent in order
+    group = models.CharField(max_length=200)
+    event = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)  # Failed sends so far
+    available_at = models.DateTimeField(default=timezone.now)  # Not retried before
+    last_error = models.TextField(blank=True, default="")
+    failed_at = models.DateTimeField(null=True, blank=True)  # Gave up on it
+
+    def __str__(self):
+        return f"{self.group} ------ {self.event.get('type')}"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["group", "id"],
+                condition=models.Q(failed_at=None),
+                name="outbox_pending_idx",
+            ),
+        ]
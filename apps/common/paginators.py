@@ -1,44 +1,283 @@
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 from ninja.pagination import PaginationBase
 from ninja import Schema
 from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
 from apps.common.error import ErrorCode
 
 from apps.common.exceptions import RequestError
-import math
+import base64, binascii, hashlib, json, math
+
+# COUNT STRATEGIES
+# Decide how the total (and thereby last_page) of a paginated queryset is gotten.
+# Each returns a tuple of (count, exact).
+
+
+class ExactCount:
+    """Runs a COUNT(*) on every request. Best for small querysets."""
+
+    async def count(self, queryset) -> Tuple[int, bool]:
+        return await queryset.acount(), True
+
+
+class CachedCount(ExactCount):
+    """Caches the exact count per filter (the queryset's sql) for `timeout` seconds.
+    A count served from the cache may be stale, so it's reported as not exact."""
+
+    def __init__(self, timeout: int = 60):
+        self.timeout = timeout
+
+    @staticmethod
+    def cache_key(queryset):
+        sql = str(queryset.order_by().query)
+        return f"pagination-count:{hashlib.md5(sql.encode()).hexdigest()}"
+
+    async def count(self, queryset) -> Tuple[int, bool]:
+        key = self.cache_key(queryset)
+        count = await cache.aget(key)
+        if count is not None:
+            return count, False
+        count, exact = await super().count(queryset)
+        await cache.aset(key, count, self.timeout)
+        return count, exact
+
+
+class EstimatedCount(CachedCount):
+    """Uses the postgres planner estimate for huge tables (e.g feed_post, chat_message).
+    Unfiltered querysets read the table's reltuples, filtered ones are EXPLAINed.
+    Only filtered by the default manager (e.g leaving out the few tombstoned rows
+    waiting to be purged) counts as unfiltered.
+    Estimates below `threshold` are small enough to be counted (and cached) exactly.
+    """
+
+    def __init__(self, threshold: int = 10000, timeout: int = 60):
+        self.threshold = threshold
+        super().__init__(timeout)
+
+    @staticmethod
+    def is_unfiltered(queryset) -> bool:
+        query = queryset.query
+        if query.distinct:
+            return False
+        default_query = queryset.model._default_manager.all().query
+        return not query.where or query.where == default_query.where
+
+    @classmethod
+    def estimate(cls, queryset) -> int:
+        queryset = queryset.order_by()
+        query = queryset.query
+        connection = connections[queryset.db]
+        with connection.cursor() as cursor:
+            if cls.is_unfiltered(queryset):
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                if row and row[0] >= 0:  # -1 means the table was never analyzed
+                    return row[0]
+            sql, params = query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]["Plan"]["Plan Rows"])
+
+    async def count(self, queryset) -> Tuple[int, bool]:
+        estimate = await sync_to_async(self.estimate)(queryset)
+        if estimate < self.threshold:
+            return await super().count(queryset)
+        return estimate, False
 
 
 class CustomPagination(PaginationBase):
     page_size = 50  # Set the default page size here
+    count_strategy = ExactCount()
 
     class Output(Schema):
         items: List[Any]  # `items` is a default attribute
         total: int
         per_page: int
 
-    async def paginate_queryset(self, queryset, current_page):
+    def __init__(self, *, count_strategy=None, **kwargs):
+        if count_strategy:
+            self.count_strategy = count_strategy
+        super().__init__(**kwargs)
+
+    async def paginate_queryset(self, queryset, current_page, cursor=None):
+        # A cursor (gotten from a previous response) takes precedence over the page number
+        if cursor:
+            return await self.paginate_queryset_by_cursor(queryset, cursor)
+
         if current_page < 1:
             raise RequestError(
                 err_code=ErrorCode.INVALID_PAGE, err_msg="Invalid Page", status_code=404
             )
         page_size = self.page_size
-        async_queryset = await sync_to_async(list)(queryset)
-        queryset_count = await queryset.acount()
-        items = async_queryset[
-            (current_page - 1) * page_size : current_page * page_size
-        ]
-        if queryset_count > 0 and not items:
+        ordering = self.get_ordering(queryset)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+
+        # LIMIT/OFFSET in the database. The extra row tells if there's a next page.
+        offset = (current_page - 1) * page_size
+        items = await sync_to_async(list)(queryset[offset : offset + page_size + 1])
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        if current_page > 1 and not items:
             raise RequestError(
                 err_code=ErrorCode.INVALID_PAGE,
                 err_msg="Page number is out of range",
                 status_code=400,
             )
 
+        if current_page == 1 and not has_next:
+            # Everything fits in the first page, no need to count
+            queryset_count, exact = len(items), True
+        else:
+            queryset_count, exact = await self.count_strategy.count(queryset)
         last_page = math.ceil(queryset_count / page_size)
         last_page = 1 if last_page == 0 else last_page
+
+        # Correct a stale or estimated total with what this page proves
+        if not has_next and last_page != current_page:
+            last_page, exact = current_page, True
+        elif has_next and last_page <= current_page:
+            last_page = current_page + 1
+
+        # Cursors let the client switch to keyset paging from any numbered page
+        next_cursor, prev_cursor = None, None
+        if ordering and items:
+            if has_next:
+                next_cursor = self.encode_cursor(items[-1], ordering, "next")
+            if current_page > 1:
+                prev_cursor = self.encode_cursor(items[0], ordering, "prev")
         return {
             "items": items,
             "per_page": page_size,
             "current_page": current_page,
             "last_page": last_page,
+            "last_page_estimated": not exact,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
+        }
+
+    async def paginate_queryset_by_cursor(self, queryset, cursor=None):
+        # Keyset pagination. Only page_size + 1 rows are fetched from the database,
+        # the extra row tells if there's another page in that direction.
+        # No cursor means the first page.
+        ordering = self.get_ordering(queryset)
+        if not ordering:
+            raise RequestError(
+                err_code=ErrorCode.INVALID_PAGE,
+                err_msg="Cursor not supported here",
+                status_code=400,
+            )
+        direction, values = self.parse_cursor(cursor, ordering)
+        fetch_ordering = ordering
+        if direction == "prev":
+            # Walk backwards with the ordering reversed, the page order is restored later
+            fetch_ordering = [self.reverse_order(field) for field in ordering]
+        if values:
+            queryset = queryset.filter(self.keyset_filter(fetch_ordering, values))
+        queryset = queryset.order_by(*fetch_ordering)
+        try:
+            items = await sync_to_async(list)(queryset[: self.page_size + 1])
+        except (ValidationError, ValueError):
+            # Cursor values that can't be cast to the ordering fields
+            raise RequestError(
+                err_code=ErrorCode.INVALID_PAGE,
+                err_msg="Invalid Cursor",
+                status_code=400,
+            )
+        return self.cursor_page(items, ordering, direction, first_page=not cursor)
+
+    def cursor_page(self, items, ordering, direction, first_page=False):
+        # Builds a keyset page from at most page_size + 1 rows fetched in `direction`
+        page_size = self.page_size
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if direction == "prev":
+            items.reverse()
+
+        next_cursor, prev_cursor = None, None
+        if items:
+            if direction == "prev" or has_more:
+                next_cursor = self.encode_cursor(items[-1], ordering, "next")
+            if (direction == "next" and not first_page) or (
+                direction == "prev" and has_more
+            ):
+                prev_cursor = self.encode_cursor(items[0], ordering, "prev")
+        return {
+            "items": items,
+            "per_page": page_size,
+            "current_page": None,
+            "last_page": None,
+            "last_page_estimated": None,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor,
         }
+
+    @staticmethod
+    def get_ordering(queryset) -> Optional[List[str]]:
+        # Returns the queryset ordering with a unique tie breaker ("id") appended.
+        # Querysets ordered by expressions can't be paged by cursor.
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not ordering:
+            ordering = ["-created_at"]
+        if not all(isinstance(field, str) for field in ordering):
+            return None
+        if not any(field.lstrip("-") in ("id", "pk") for field in ordering):
+            ordering.append("-id" if ordering[-1].startswith("-") else "id")
+        return ordering
+
+    @staticmethod
+    def reverse_order(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        # Lexicographic "comes after" filter, e.g for ("-created_at", "-id"):
+        # created_at < x OR (created_at = x AND id < y)
+        condition = Q()
+        equals = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equals, **{f"{name}__{lookup}": value})
+            equals[name] = value
+        return condition
+
+    @staticmethod
+    def encode_cursor(obj, ordering, direction):
+        values = [getattr(obj, field.lstrip("-")) for field in ordering]
+        data = json.dumps({"d": direction, "v": values}, default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    @classmethod
+    def parse_cursor(cls, cursor, ordering):
+        # No cursor means the first page
+        if not cursor:
+            return "next", None
+        return cls.decode_cursor(cursor, ordering)
+
+    @staticmethod
+    def decode_cursor(cursor, ordering):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            direction, values = data["d"], data["v"]
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            direction, values = None, []
+        if (
+            direction not in ("next", "prev")
+            or not isinstance(values, list)
+            or len(values) != len(ordering)
+        ):
+            raise RequestError(
+                err_code=ErrorCode.INVALID_PAGE,
+                err_msg="Invalid Cursor",
+                status_code=400,
+            )
+        return direction, values
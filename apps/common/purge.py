@@ -0,0 +1,90 @@
+from datetime import timedelta
+from django.apps import apps
+from django.db import transaction
+from django.utils import timezone
+from apps.common.models import Purge
+from apps.common.tasks import run_in_background
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Deleting a post, user or group chat tombstones it (sets deleted_at, which hides it
+# from its model's default manager) and returns right away. A purge then deletes its
+# dependents in batches of PURGE_BATCH_SIZE, one short transaction each, and the object
+# itself last, so no request collects a whole cascade or holds its locks for long.
+
+PURGE_BATCH_SIZE = 500
+
+# Model label -> function returning the querysets to purge for an object, in order.
+# Dependents of dependents come first, so each batch's own cascade stays small. A step
+# can also be a (queryset, delete) pair, for objects whose deletion takes more than
+# their signals: delete(obj) is called for each one (e.g to take a purged user's
+# reactions off notifications other users' reactions are coalesced in).
+purge_steps = {}
+
+
+def register_purge_steps(model):
+    def register(func):
+        purge_steps[model._meta.label] = func
+        return func
+
+    return register
+
+
+def tombstone(obj, **updates):
+    # Hides the object and schedules its purge. Returns the purge.
+    model = type(obj)
+    with transaction.atomic():
+        model._base_manager.filter(pk=obj.pk).update(
+            deleted_at=timezone.now(), **updates
+        )
+        purge = Purge.objects.create(target_type=model._meta.label, target_id=obj.pk)
+    run_in_background(run_purge, purge.id)
+    return purge
+
+
+def run_purge(purge_id):
+    # Continues a purge from its last completed step
+    purge = Purge.objects.get(id=purge_id)
+    model = apps.get_model(purge.target_type)
+    obj = model._base_manager.filter(pk=purge.target_id).first()
+    steps = purge_steps[purge.target_type](obj) if obj else []
+    for step in steps[purge.step :]:
+        queryset, delete = step if isinstance(step, tuple) else (step, None)
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.values_list("pk", flat=True)[:PURGE_BATCH_SIZE])
+                if not ids:
+                    break
+                batch = queryset.model._base_manager.filter(pk__in=ids)
+                if delete:
+                    for obj in batch:
+                        delete(obj)
+                    deleted = len(ids)  # Their cascades aren't counted
+                else:
+                    # Deleted through the collector, so signals (e.g counters) still run
+                    deleted, _ = batch.delete()
+                purge.deleted_count += deleted
+                purge.save(update_fields=["deleted_count", "updated_at"])
+        purge.step += 1
+        purge.save(update_fields=["step", "updated_at"])
+    if obj:
+        deleted, _ = obj.delete()
+        purge.deleted_count += deleted
+    purge.completed_at = timezone.now()
+    purge.save(update_fields=["deleted_count", "completed_at", "updated_at"])
+    logger.info(
+        f"Purged {purge.target_type} {purge.target_id}: {purge.deleted_count} row(s)"
+    )
+
+
+def resume_stalled_purges(stalled_after=timedelta(minutes=10)):
+    # Runs the purges that stopped making progress (e.g their worker was restarted)
+    purge_ids = list(
+        Purge.objects.filter(
+            completed_at=None, updated_at__lt=timezone.now() - stalled_after
+        ).values_list("id", flat=True)
+    )
+    for purge_id in purge_ids:
+        run_purge(purge_id)
+    return len(purge_ids)
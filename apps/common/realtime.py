@@ -0,0 +1,160 @@
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from apps.common.models import OutboxEvent
+import logging, os
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 300  # Seconds a failed event waits at most before it's retried again
+DRAIN_LOCK = 7340  # Advisory lock id held by the worker draining the outbox
+
+# REST views and admin hooks publish socket events to the channel layer groups the
+# consumers listen on, in the same shapes the consumers send to their clients, instead
+# of connecting to our own websocket endpoints to have them relayed.
+# They don't send them: events are written to the outbox (OutboxEvent) in the
+# transaction of the change they're about, so a change is never committed without its
+# events nor the other way round, and a slow or down channel layer holds up no request.
+# The drain_outbox worker sends them in batches, oldest first. A failed send is retried
+# with a backoff and holds back the group's later events, so each group gets its events
+# in order. Delivery is at least once (an event sent just before the worker died is
+# sent again). The events of a batch about the same notification are squashed into
+# the latest one, so a busy coalesced notification isn't sent once per action.
+
+
+def get_layer():
+    # Tests have no Redis, they publish to (and can listen on) the in-memory layer
+    if os.environ.get("ENVIRONMENT") == "TESTING":
+        return get_channel_layer("testing")
+    return get_channel_layer()
+
+
+def enqueue_many(events):
+    # Writes (group, event) pairs to the outbox, in the caller's transaction if any
+    OutboxEvent.objects.bulk_create(
+        [OutboxEvent(group=group, event=event) for group, event in events]
+    )
+
+
+def enqueue(group: str, event: dict):
+    enqueue_many([(group, event)])
+
+
+def get_pending_events(now, batch_size):
+    # The events due to be sent, but not the ones after a group's event waiting to be
+    # retried
+    held_back = OutboxEvent.objects.filter(
+        group=OuterRef("group"),
+        id__lt=OuterRef("id"),
+        failed_at=None,
+        available_at__gt=now,
+    )
+    return list(
+        OutboxEvent.objects.filter(failed_at=None, available_at__lte=now)
+        .exclude(Exists(held_back))
+        .order_by("id")[:batch_size]
+    )
+
+
+def get_notification_key(event):
+    # The group and notification of a notification event, None for other events
+    data = event.event.get("notification_data")
+    if event.event.get("type") != "notification_message" or not data:
+        return None
+    return event.group, data["id"]
+
+
+def squash_events(events):
+    """Keeps the latest of a batch's events about the same notification to the same
+    group, in place of the earlier ones (a coalesced notification changes with every
+    action on its object), with the CREATED status if the notification is new to the
+    group. Returns the events to send and, by the id of each, the ones it superseded
+    (settled along with it)."""
+    latest, superseded = {}, {}
+    for event in events:
+        key = get_notification_key(event)
+        if key is None:
+            continue
+        if key in latest:
+            previous = latest[key]
+            superseded[event.id] = superseded.pop(previous.id, []) + [previous]
+        latest[key] = event
+    for event in latest.values():
+        earlier = superseded.get(event.id)
+        data = event.event["notification_data"]
+        if earlier and earlier[0].event["notification_data"]["status"] == "CREATED":
+            if data["status"] == "UPDATED":
+                data["status"] = "CREATED"
+    squashed = {e.id for earlier in superseded.values() for e in earlier}
+    return [e for e in events if e.id not in squashed], superseded
+
+
+def get_retry_delay(attempts):
+    # Doubles with each failed send, up to MAX_RETRY_DELAY seconds
+    delay = settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, MAX_RETRY_DELAY))
+
+
+def settle_events(sent, failed, now):
+    # Deletes the sent events and reschedules the failed ones (given up on after
+    # OUTBOX_MAX_ATTEMPTS, kept for inspection)
+    with transaction.atomic():
+        OutboxEvent.objects.filter(id__in=[event.id for event in sent]).delete()
+        for event in failed:
+            event.attempts += 1
+            event.available_at = now + get_retry_delay(event.attempts)
+            if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                event.failed_at = now
+            event.save(
+                update_fields=["attempts", "available_at", "last_error", "failed_at"]
+            )
+
+
+async def drain(batch_size=None):
+    """Sends a batch of the outbox's events to the channel layer. Returns the events
+    sent, the ones that failed and the lag (seconds from being written to being sent)
+    of the oldest one sent."""
+    now = timezone.now()
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    events = await sync_to_async(get_pending_events)(now, batch_size)
+    events, superseded = squash_events(events)
+    layer = get_layer()
+    sent, failed, blocked = [], [], set()
+    for event in events:
+        if event.group in blocked:  # An earlier one of the group failed
+            continue
+        try:
+            await layer.group_send(event.group, event.event)
+        except Exception as e:
+            logger.warning(f"Sending outbox event {event.id} failed: {e!r}")
+            event.last_error = repr(e)
+            failed.append(event)
+            blocked.add(event.group)
+        else:
+            sent += [event, *superseded.get(event.id, [])]
+    await sync_to_async(settle_events)(sent, failed, timezone.now())
+    oldest = min((event.created_at for event in sent), default=None)
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0
+    return len(sent), len(failed), lag
+
+
+def lock_drain():
+    # One worker drains at a time, or a group's events could be sent out of order by
+    # two. Held until its db connection closes. Returns whether it was acquired.
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [DRAIN_LOCK])
+        return cursor.fetchone()[0]
+
+
+def get_outbox_stats():
+    # Events waiting to be sent, age in seconds of the oldest of them, and events
+    # given up on
+    pending = OutboxEvent.objects.filter(failed_at=None)
+    oldest = pending.order_by("id").values_list("created_at", flat=True).first()
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0
+    failed = OutboxEvent.objects.exclude(failed_at=None).count()
+    return pending.count(), age, failed
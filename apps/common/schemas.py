@@ -1,3 +1,4 @@
+from typing import Optional
 from ninja import Field, Schema as _Schema
 from apps.common.schema_examples import user_data
 
@@ -26,8 +27,11 @@ class ErrorResponseSchema(ResponseSchema):
 
 class PaginatedResponseDataSchema(Schema):
     per_page: int
-    current_page: int
-    last_page: int
+    current_page: Optional[int]
+    last_page: Optional[int]
+    last_page_estimated: Optional[bool]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
 
 
 class UserDataSchema(Schema):
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.core.cache import caches
+import asyncio, copy, logging, os, time
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical lookups (same key) into one call.
+    The first caller runs it, callers arriving while it's in flight await its result
+    (each gets a deep copy, so views can't mutate each other's objects). For reads only:
+    a write must not act on a result fetched before it started.
+    With `shared`, a Redis lock extends this across workers: one worker runs the call
+    and the others pick its result from the shared cache.
+    """
+
+    registry = {}  # name -> instance, for metrics
+
+    def __init__(
+        self, name: str, shared: bool = None, lock_timeout: float = 5, wait: float = 1
+    ):
+        self.name = name
+        self.shared = settings.SINGLE_FLIGHT_SHARED if shared is None else shared
+        self.lock_timeout = lock_timeout
+        self.wait = wait  # Seconds to wait for another worker's result
+        self.in_flight = {}
+        self.metrics = {"calls": 0, "coalesced": 0, "coalesced_shared": 0}
+        SingleFlight.registry[name] = self
+
+    async def do(self, key, func, *args, **kwargs):
+        self.metrics["calls"] += 1
+        future = self.in_flight.get(key)
+        if future:
+            self.metrics["coalesced"] += 1
+            # Shielded so a cancelled request doesn't cancel the others waiting
+            return copy.deepcopy(await asyncio.shield(future))
+
+        coroutine = func(*args, **kwargs)
+        if self.shared and os.environ.get("ENVIRONMENT") != "TESTING":
+            coroutine = self.do_shared(key, coroutine)
+        # Awaited here rather than in a task of its own, which would never run while
+        # the loop's thread is blocked (e.g a view run by async_to_sync). The others
+        # get its outcome through the future.
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await coroutine
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved, in case nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self.in_flight.pop(key, None)
+
+    async def do_shared(self, key, coroutine):
+        cache = caches["shared"]
+        lock_key = f"single-flight:{self.name}:{key}:lock"
+        result_key = f"single-flight:{self.name}:{key}:result"
+        started = time.time()
+        acquired = await self.call_cache(cache.aadd(lock_key, 1, self.lock_timeout))
+        if acquired is MISSING or acquired:
+            try:
+                result = await coroutine
+                await self.call_cache(
+                    cache.aset(result_key, (time.time(), result), self.lock_timeout)
+                )
+                return result
+            finally:
+                if acquired is True:
+                    await self.call_cache(cache.adelete(lock_key))
+
+        # Another worker has it in flight. Wait for a result produced after this
+        # lookup started, or run it here if the lock goes away without one.
+        deadline = started + self.wait
+        while time.time() < deadline:
+            await asyncio.sleep(0.01)
+            produced = await self.call_cache(cache.aget(result_key))
+            if produced and produced is not MISSING and produced[0] >= started:
+                self.metrics["coalesced_shared"] += 1
+                coroutine.close()
+                return produced[1]
+            if not await self.call_cache(cache.ahas_key(lock_key)):
+                break
+        return await coroutine
+
+    @staticmethod
+    async def call_cache(awaitable):
+        # The shared cache is best effort, lookups go on without it
+        try:
+            return await awaitable
+        except Exception as e:
+            logger.warning(f"Single flight shared cache unavailable: {e}")
+            return MISSING
+
+    @classmethod
+    def get_metrics(cls):
+        return {name: dict(flight.metrics) for name, flight in cls.registry.items()}
@@ -1,4 +1,3 @@
-from django.conf import settings
 from apps.accounts.auth import Authentication
 
 
@@ -18,15 +17,10 @@ class SocketAuthMiddleware:
         if not token:
             error["message"] = "Auth bearer not set"
         else:
-            if (
-                token == settings.SOCKET_SECRET
-            ):  # If the app is making the connection itself
-                scope["user"] = token
-            else:
-                user = await Authentication.decodeAuthorization(token[7:])
-                scope["user"] = user
-                if not user:
-                    error["message"] = "Auth token is invalid or expired"
+            user = await Authentication.decodeAuthorization(token[7:])
+            scope["user"] = user
+            if not user:
+                error["message"] = "Auth token is invalid or expired"
 
         scope["error"] = error
         return await self.app(scope, receive, send)
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connections
+import logging, os
+
+logger = logging.getLogger(__name__)
+
+# Shared worker threads for work that shouldn't hold up a response (e.g timeline fan-out)
+executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="socialnet-task")
+
+
+def run_task(func, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        # Each worker thread has its own db connections, don't leave them open
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Runs a sync function in a worker thread and returns immediately.
+    Tests run it inline so its effects can be asserted right away."""
+    if os.environ.get("ENVIRONMENT") == "TESTING":
+        return func(*args, **kwargs)
+    executor.submit(run_task, func, *args, **kwargs)
@@ -1,3 +1,67 @@
+from asgiref.sync import sync_to_async
 from django.test import TestCase
+from django.utils import timezone
+from unittest import mock
+from apps.common.models import OutboxEvent
+from apps.common.realtime import drain, enqueue_many
+import os
 
-# Create your tests here.
+
+class TestOutbox(TestCase):
+    os.environ["ENVIRONMENT"] = "TESTING"
+
+    async def test_drain_outbox(self):
+        events = [("a", {"n": 1}), ("a", {"n": 2}), ("b", {"n": 3})]
+        await sync_to_async(enqueue_many)(events)
+        layer = mock.Mock()
+        layer.group_send = mock.AsyncMock(side_effect=[Exception("Down"), None])
+
+        # A failed send is retried later and holds back the group's later events
+        with mock.patch("apps.common.realtime.get_layer", return_value=layer):
+            self.assertEqual(await drain(), (1, 1, mock.ANY))
+            layer.group_send.assert_awaited_with("b", {"n": 3})
+            failed = await OutboxEvent.objects.order_by("id").afirst()
+            self.assertEqual(failed.attempts, 1)
+            self.assertEqual(failed.last_error, "Exception('Down')")
+            self.assertGreater(failed.available_at, timezone.now())
+            self.assertEqual(await drain(), (0, 0, 0))
+
+            # Then they're sent in order
+            await OutboxEvent.objects.aupdate(available_at=timezone.now())
+            layer.group_send = mock.AsyncMock()
+            self.assertEqual(await drain(), (2, 0, mock.ANY))
+            self.assertEqual(
+                layer.group_send.await_args_list,
+                [mock.call("a", {"n": 1}), mock.call("a", {"n": 2})],
+            )
+        self.assertFalse(await OutboxEvent.objects.aexists())
+
+    async def test_drain_squashes_notification_events(self):
+        def notification_event(status, actor_count):
+            data = {"id": "n1", "status": status, "actor_count": actor_count}
+            return {"type": "notification_message", "notification_data": data}
+
+        badge = {"type": "badge_message", "badges": {"notifications": 1}}
+        events = [
+            ("a", notification_event("CREATED", 1)),
+            ("a", badge),
+            ("a", notification_event("UPDATED", 2)),
+            ("b", notification_event("UPDATED", 3)),
+            ("a", notification_event("UPDATED", 3)),
+        ]
+        await sync_to_async(enqueue_many)(events)
+        layer = mock.Mock()
+        layer.group_send = mock.AsyncMock()
+
+        # Only the latest of a notification's events to a group is sent, as new to it
+        with mock.patch("apps.common.realtime.get_layer", return_value=layer):
+            self.assertEqual(await drain(), (5, 0, mock.ANY))
+        self.assertEqual(
+            layer.group_send.await_args_list,
+            [
+                mock.call("a", badge),
+                mock.call("b", notification_event("UPDATED", 3)),
+                mock.call("a", notification_event("CREATED", 3)),
+            ],
+        )
+        self.assertFalse(await OutboxEvent.objects.aexists())
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FeedConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.feed"
+
+    def ready(self):
+        from apps.feed.timeline import connect_signals
+
+        connect_signals()
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from apps.feed.ranking import compute_scores
+import logging, time
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FETCH_SQL = """
+    SELECT id, EXTRACT(EPOCH FROM created_at)::float8, reactions_count, comments_count, replies_count
+    FROM feed_post WHERE id > %s ORDER BY id LIMIT %s
+"""
+UPDATE_SQL = """
+    UPDATE feed_post p SET score = s.score, changed_at = to_timestamp(%s)
+    FROM unnest(%s::uuid[], %s::float8[]) AS s(id, score)
+    WHERE p.id = s.id
+"""
+
+
+class Command(BaseCommand):
+    help = "Recomputes the decayed engagement scores of all posts. Run it periodically (e.g every 10 minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50000)
+
+    def handle(self, **options) -> None:
+        batch_size = options["batch_size"]
+        started = time.monotonic()
+        now = time.time()
+        last_id = "00000000-0000-0000-0000-000000000000"
+        total = 0
+        with connection.cursor() as cursor:
+            while True:
+                # Keyset over the primary key, one SELECT and one UPDATE per batch
+                cursor.execute(FETCH_SQL, [last_id, batch_size])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                ids, created_at, reactions, comments, replies = zip(*rows)
+                scores = compute_scores(
+                    np.array(created_at, dtype=np.float64),
+                    np.array(reactions, dtype=np.int64),
+                    np.array(comments, dtype=np.int64),
+                    np.array(replies, dtype=np.int64),
+                    now,
+                )
+                cursor.execute(UPDATE_SQL, [now, list(ids), scores.tolist()])
+                total += len(ids)
+                last_id = ids[-1]
+        logger.info(
+            f"Rescored {total} post(s) in {time.monotonic() - started:.2f} seconds"
+        )
@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand
+from django.db.models import (
+    Count,
+    F,
+    IntegerField,
+    JSONField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from apps.feed.models import Comment, Post, Reaction, Reply
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (model, counter field, source model, source foreign key)
+COUNTERS = [
+    (Post, "reactions_count", Reaction, "post"),
+    (Post, "comments_count", Comment, "post"),
+    (Post, "replies_count", Reply, "comment__post"),
+    (Comment, "reactions_count", Reaction, "comment"),
+    (Comment, "replies_count", Reply, "comment"),
+    (Reply, "reactions_count", Reaction, "reply"),
+]
+
+# Per reaction type counts, e.g {"LIKE": 2, "LOVE": 1}
+BREAKDOWN_SQL = """
+    SELECT COALESCE(jsonb_object_agg(rtype, total), '{{}}') FROM (
+        SELECT rtype, COUNT(*) AS total FROM feed_reaction
+        WHERE {target}_id = feed_{target}.id GROUP BY rtype
+    ) counts
+"""
+
+
+def actual_count(source_model, source_field):
+    # Subquery counting the source rows of the outer object
+    counts = (
+        source_model.objects.filter(**{source_field: OuterRef("pk")})
+        .order_by()
+        .values(source_field)
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(
+        Subquery(counts, output_field=IntegerField()),
+        Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def actual_breakdown(model):
+    sql = BREAKDOWN_SQL.format(target=model._meta.model_name)
+    return RawSQL(sql, [], output_field=JSONField())
+
+
+class Command(BaseCommand):
+    help = "Verifies (and rebuilds) the denormalized engagement counters of posts, comments and replies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report counters that don't match the source tables",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, **options) -> None:
+        check = options["check"]
+        batch_size = options["batch_size"]
+        mismatched_total = 0
+        counters = [
+            (model, field, actual_count(source_model, source_field))
+            for model, field, source_model, source_field in COUNTERS
+        ] + [
+            (model, "reactions_breakdown", actual_breakdown(model))
+            for model in (Post, Comment, Reply)
+        ]
+        for model, field, actual in counters:
+            mismatched_ids = list(
+                model.objects.annotate(actual=actual)
+                .exclude(**{field: F("actual")})
+                .values_list("id", flat=True)
+            )
+            mismatched_total += len(mismatched_ids)
+            logger.info(
+                f"{model.__name__}.{field}: {len(mismatched_ids)} mismatched row(s)"
+            )
+            if check:
+                continue
+            for i in range(0, len(mismatched_ids), batch_size):
+                model.objects.filter(id__in=mismatched_ids[i : i + batch_size]).update(
+                    **{field: actual}
+                )
+
+        if check and mismatched_total:
+            raise SystemExit(1)
+        logger.info("Counters rebuilt" if not check else "Counters verified")
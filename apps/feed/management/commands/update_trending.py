@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from apps.feed.trending import roll_up_trending
+import logging, time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Rolls the engagement buckets up into the trending posts. Run it periodically (e.g every minute)"
+
+    def handle(self, **options) -> None:
+        started = time.monotonic()
+        roll_up_trending()
+        logger.info(
+            f"Updated trending posts in {time.monotonic() - started:.2f} seconds"
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.3 on 2026-10-16 20:49
+
+from django.db import migrations, models
+
+BACKFILL_COUNTERS_SQL = """
+UPDATE feed_post p SET
+    reactions_count = (SELECT COUNT(*) FROM feed_reaction r WHERE r.post_id = p.id),
+    comments_count = (SELECT COUNT(*) FROM feed_comment c WHERE c.post_id = p.id);
+UPDATE feed_comment c SET
+    reactions_count = (SELECT COUNT(*) FROM feed_reaction r WHERE r.comment_id = c.id),
+    replies_count = (SELECT COUNT(*) FROM feed_reply rp WHERE rp.comment_id = c.id);
+UPDATE feed_reply rp SET
+    reactions_count = (SELECT COUNT(*) FROM feed_reaction r WHERE r.reply_id = rp.id);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="reactions_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="replies_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="comments_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="reactions_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="reply",
+            name="reactions_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.3 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+BACKFILL_BREAKDOWN_SQL = """
+UPDATE feed_{target} t SET reactions_breakdown = b.breakdown
+FROM (
+    SELECT {target}_id, jsonb_object_agg(rtype, total) AS breakdown
+    FROM (
+        SELECT {target}_id, rtype, COUNT(*) AS total FROM feed_reaction
+        WHERE {target}_id IS NOT NULL GROUP BY {target}_id, rtype
+    ) counts
+    GROUP BY {target}_id
+) b
+WHERE b.{target}_id = t.id;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0002_engagement_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="reactions_breakdown",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="reactions_breakdown",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="reply",
+            name="reactions_breakdown",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.RunSQL(
+            "".join(
+                BACKFILL_BREAKDOWN_SQL.format(target=target)
+                for target in ("post", "comment", "reply")
+            ),
+            migrations.RunSQL.noop,
+        ),
+    ]
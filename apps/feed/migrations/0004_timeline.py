@@ -0,0 +1,75 @@
+# Generated by Django 4.2.3 on 2026-10-16 20:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Materialize the timelines of existing posts (their authors and accepted friends)
+BACKFILL_TIMELINE_SQL = """
+INSERT INTO feed_timeline (user_id, post_id, post_created_at)
+SELECT p.author_id, p.id, p.created_at FROM feed_post p
+UNION
+SELECT CASE WHEN f.requester_id = p.author_id THEN f.requestee_id ELSE f.requester_id END,
+    p.id, p.created_at
+FROM feed_post p JOIN profiles_friend f
+    ON f.status = 'ACCEPTED' AND p.author_id IN (f.requester_id, f.requestee_id)
+ON CONFLICT DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("feed", "0003_reactions_breakdown"),
+        ("profiles", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Timeline",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("post_created_at", models.DateTimeField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="feed.post",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-post_created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-post_created_at", "-id"],
+                        name="timeline_user_created_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="timeline",
+            constraint=models.UniqueConstraint(
+                fields=("user", "post"), name="unique_user_post_timeline"
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_TIMELINE_SQL, migrations.RunSQL.noop),
+    ]
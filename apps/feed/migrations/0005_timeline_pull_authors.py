@@ -0,0 +1,52 @@
+# Generated by Django 4.2.3 on 2026-10-16 20:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0002_alter_user_access_alter_user_refresh"),
+        ("feed", "0004_timeline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PullAuthor",
+            fields=[
+                (
+                    "author",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name="timeline",
+            options={"ordering": ["-post_created_at", "-post_id"]},
+        ),
+        migrations.RemoveIndex(
+            model_name="timeline",
+            name="timeline_user_created_idx",
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"], name="post_author_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="timeline",
+            index=models.Index(
+                fields=["user", "-post_created_at", "-post"],
+                name="timeline_user_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.3 on 2026-10-16 21:00
+
+from django.db import migrations, models
+
+BACKFILL_SCORES_SQL = """
+UPDATE feed_post p SET replies_count = (
+    SELECT COUNT(*) FROM feed_reply rp
+    JOIN feed_comment c ON c.id = rp.comment_id WHERE c.post_id = p.id
+);
+UPDATE feed_post SET score = (
+    1 + reactions_count * 1 + comments_count * 3 + replies_count * 2
+) / POWER(EXTRACT(EPOCH FROM (NOW() - created_at)) / 3600 + 2, 1.5);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0005_timeline_pull_authors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="replies_count",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="score",
+            field=models.FloatField(default=0.35355339059327373, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["-score", "-id"], name="post_score_idx"),
+        ),
+        migrations.RunSQL(BACKFILL_SCORES_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.3 on 2026-10-16 21:30
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+TABLES = ["feed_post", "feed_comment", "feed_reply"]
+
+# search_vector is set from text by a trigger. Rows saved with search_vector (a full
+# save writes it as NULL) get it recomputed too, while counter updates don't touch it.
+SEARCH_VECTOR_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION feed_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('english', COALESCE(NEW.text, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+SEARCH_VECTOR_TRIGGER_SQL = """
+CREATE TRIGGER {table}_search_vector_trigger
+BEFORE INSERT OR UPDATE OF text, search_vector ON {table}
+FOR EACH ROW EXECUTE FUNCTION feed_search_vector_update();
+"""
+
+CREATE_TRIGGERS_SQL = SEARCH_VECTOR_FUNCTION_SQL + "".join(
+    SEARCH_VECTOR_TRIGGER_SQL.format(table=table)
+    # Writing search_vector fires the trigger, which fills it for existing rows
+    + f"UPDATE {table} SET search_vector = NULL;\n"
+    for table in TABLES
+)
+
+DROP_TRIGGERS_SQL = "".join(
+    f"DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};\n"
+    for table in TABLES
+) + "DROP FUNCTION IF EXISTS feed_search_vector_update();"
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0006_post_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="reply",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(CREATE_TRIGGERS_SQL, DROP_TRIGGERS_SQL),
+        migrations.AddIndex(
+            model_name="post",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="post_search_vector_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="comment_search_vector_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reply",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="reply_search_vector_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 4.2.3 on 2026-10-16 21:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0007_search_vectors"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EngagementBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("minute", models.DateTimeField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="feed.post",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["minute"], name="engagement_bucket_minute_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="TrendingPost",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("window", models.CharField(max_length=10)),
+                ("position", models.IntegerField()),
+                ("engagement", models.IntegerField()),
+                ("growth", models.IntegerField()),
+                (
+                    "post",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="feed.post",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["window", "position"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="engagementbucket",
+            constraint=models.UniqueConstraint(
+                fields=("post", "minute"), name="unique_post_minute_engagement_bucket"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="trendingpost",
+            constraint=models.UniqueConstraint(
+                fields=("window", "position"),
+                name="unique_window_position_trending_post",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0009_post_deleted_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="changed_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(fields=["changed_at"], name="post_changed_idx"),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Reactions whose post, comment or reply was deleted before they cascaded with it
+DELETE_ORPHAN_REACTIONS_SQL = """
+DELETE FROM feed_reaction
+WHERE post_id IS NULL AND comment_id IS NULL AND reply_id IS NULL;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0010_post_changed_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="reaction",
+            name="post",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reactions",
+                to="feed.post",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="reaction",
+            name="comment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reactions",
+                to="feed.comment",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="reaction",
+            name="reply",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="reactions",
+                to="feed.reply",
+            ),
+        ),
+        migrations.RunSQL(DELETE_ORPHAN_REACTIONS_SQL, migrations.RunSQL.noop),
+    ]
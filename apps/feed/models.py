@@ -1,8 +1,17 @@
 from autoslug import AutoSlugField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_save, post_delete
 from apps.accounts.models import User
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from apps.common.db_functions import JSONCounterIncrement
 from apps.common.file_processors import FileProcessor
+from apps.common.managers import SoftDeleteManager
+from apps.common.purge import register_purge_steps
+from apps.feed.ranking import INITIAL_SCORE, score_expression
 
 from apps.common.models import BaseModel, File
 
@@ -29,6 +38,28 @@ class Post(BaseModel):
     slug = AutoSlugField(_("slug"), populate_from=slugify_three_fields, unique=True)
     image = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True)
 
+    # Denormalized counters, kept in sync by signals below
+    reactions_count = models.IntegerField(default=0, editable=False)
+    reactions_breakdown = models.JSONField(default=dict, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)
+    replies_count = models.IntegerField(default=0, editable=False)
+
+    # Engagement score with recency decay (see apps/feed/ranking.py). Updated with the
+    # counters and recomputed periodically by the rescore_posts command.
+    score = models.FloatField(default=INITIAL_SCORE, editable=False)
+
+    # Last change of the post's card or of its place in the lists (edits, counters,
+    # score, deletion). The latest one versions the lists (see posts_version).
+    changed_at = models.DateTimeField(auto_now=True)
+
+    # Full-text search of text, set by a database trigger (see apps/feed/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Set when the post is deleted, until it's purged (see apps/common/purge.py)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = SoftDeleteManager(related=["author"])
+
     def __str__(self):
         return f"{self.author.full_name} ------ {self.text[:10]}..."
 
@@ -45,6 +76,16 @@ class Post(BaseModel):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Recent posts of an author (timeline backfills and pulled authors)
+            models.Index(
+                fields=["author", "-created_at", "-id"],
+                name="post_author_created_idx",
+            ),
+            models.Index(fields=["-score", "-id"], name="post_score_idx"),
+            models.Index(fields=["changed_at"], name="post_changed_idx"),
+            GinIndex(fields=["search_vector"], name="post_search_vector_idx"),
+        ]
 
 
 class Comment(BaseModel):
@@ -52,10 +93,19 @@ class Comment(BaseModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     text = models.TextField()
     slug = AutoSlugField(_("slug"), populate_from=slugify_three_fields, unique=True)
+    reactions_count = models.IntegerField(default=0, editable=False)
+    reactions_breakdown = models.JSONField(default=dict, editable=False)
+    replies_count = models.IntegerField(default=0, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f"{self.author.full_name} ------ {self.text[:10]}..."
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=["search_vector"], name="comment_search_vector_idx"),
+        ]
+
 
 class Reply(BaseModel):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -64,31 +114,37 @@ class Reply(BaseModel):
     )
     text = models.TextField()
     slug = AutoSlugField(_("slug"), populate_from=slugify_three_fields, unique=True)
+    reactions_count = models.IntegerField(default=0, editable=False)
+    reactions_breakdown = models.JSONField(default=dict, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f"{self.author.full_name} ------ {self.text[:10]}..."
 
     class Meta:
         verbose_name_plural = "Replies"
+        indexes = [
+            GinIndex(fields=["search_vector"], name="reply_search_vector_idx"),
+        ]
 
 
 class Reaction(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     rtype = models.CharField(max_length=20, choices=REACTION_CHOICES)
     post = models.ForeignKey(
-        Post, related_name="reactions", on_delete=models.SET_NULL, null=True, blank=True
+        Post, related_name="reactions", on_delete=models.CASCADE, null=True, blank=True
     )
     comment = models.ForeignKey(
         Comment,
         related_name="reactions",
-        on_delete=models.SET_NULL,
+        on_delete=models.CASCADE,
         null=True,
         blank=True,
     )
     reply = models.ForeignKey(
         Reply,
         related_name="reactions",
-        on_delete=models.SET_NULL,
+        on_delete=models.CASCADE,
         null=True,
         blank=True,
     )
@@ -113,6 +169,13 @@ class Reaction(BaseModel):
     def __str__(self):
         return f"{self.user.full_name} ------ {self.rtype}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rtype so a change can be moved between breakdown keys
+        instance.loaded_rtype = instance.__dict__.get("rtype")
+        return instance
+
     @property
     def targeted_obj(self):
         # Return object the reaction object is targeted to (post, comment, or reply)
@@ -120,3 +183,197 @@ class Reaction(BaseModel):
         if not obj:
             obj = self.comment if self.comment else self.reply
         return obj
+
+
+class Timeline(models.Model):
+    """Materialized home timeline. One row per post per user it was fanned out to,
+    ordered like posts (created_at, id) so a page is a single index range scan."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="timeline_entries"
+    )
+    post_created_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user.full_name} ------ {self.post_id}"
+
+    class Meta:
+        ordering = ["-post_created_at", "-post_id"]
+        indexes = [
+            models.Index(
+                fields=["user", "-post_created_at", "-post"],
+                name="timeline_user_created_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_user_post_timeline",
+            ),
+        ]
+
+
+class PullAuthor(models.Model):
+    """Authors with too many friends to fan out to. Their posts aren't written into
+    friends' timelines, they are merged in when a timeline is read."""
+
+    author = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.author.full_name
+
+
+class EngagementBucket(models.Model):
+    """Engagement (reactions, comments and replies) of a post within a minute.
+    Written on every engagement and read only by the trending roll-up (see
+    apps/feed/trending.py), which deletes buckets once they are out of every window."""
+
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    minute = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.post_id} ------ {self.minute}: {self.count}"
+
+    class Meta:
+        indexes = [models.Index(fields=["minute"], name="engagement_bucket_minute_idx")]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "minute"],
+                name="unique_post_minute_engagement_bucket",
+            ),
+        ]
+
+
+class TrendingPost(models.Model):
+    """Top posts of a trending window, as of the last roll-up"""
+
+    window = models.CharField(max_length=10)
+    position = models.IntegerField()
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    engagement = models.IntegerField()  # Within the window
+    growth = models.IntegerField()  # Over the window before it
+
+    def __str__(self):
+        return f"{self.window} ------ {self.position}. {self.post_id}"
+
+    class Meta:
+        ordering = ["window", "position"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["window", "position"],
+                name="unique_window_position_trending_post",
+            ),
+        ]
+
+
+@register_purge_steps(Post)
+def get_post_purge_steps(post):
+    # Out of timelines first, where it's hidden but still takes a page's place
+    return [
+        Timeline.objects.filter(post=post),
+        Reaction.objects.filter(reply__comment__post=post),
+        Reaction.objects.filter(comment__post=post),
+        Reaction.objects.filter(post=post),
+        Reply.objects.filter(comment__post=post),
+        Comment.objects.filter(post=post),
+        EngagementBucket.objects.filter(post=post),
+    ]
+
+
+def get_counter_target(instance):
+    # Returns the model, id and counter field an engagement object counts towards
+    if isinstance(instance, Comment):
+        return Post, instance.post_id, "comments_count"
+    if isinstance(instance, Reply):
+        return Comment, instance.comment_id, "replies_count"
+    for model in (Post, Comment, Reply):
+        obj_id = getattr(instance, f"{model.__name__.lower()}_id")
+        if obj_id:
+            return model, obj_id, "reactions_count"
+    return None, None, None
+
+
+def update_engagement_counter(instance, value, **extra_updates):
+    model, obj_id, field = get_counter_target(instance)
+    if model:
+        # Single UPDATE ... SET field = field + value, so concurrent writes don't race
+        updates = {field: F(field) + value} if value else {}
+        if model is Post:
+            updates["changed_at"] = timezone.now()
+            if value:
+                updates["score"] = score_expression(**{field: value})
+        model._base_manager.filter(id=obj_id).update(**updates, **extra_updates)
+
+
+def update_post_replies_counter(post_filter, value):
+    # Replies count towards the score of their comment's post
+    if value:
+        Post._base_manager.filter(**post_filter).update(
+            replies_count=F("replies_count") + value,
+            score=score_expression(replies_count=value),
+            changed_at=timezone.now(),
+        )
+
+
+def increment_engagement_counter(sender, instance, created, **kwargs):
+    if created:
+        update_engagement_counter(instance, 1)
+        if sender is Reply:
+            update_post_replies_counter({"comments": instance.comment_id}, 1)
+
+
+def decrement_engagement_counter(sender, instance, origin=None, **kwargs):
+    # Skip cascades from a deleted post or comment, the counted object is gone too
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Post, Comment) and origin_model is not sender:
+        return
+    if sender is Reply:
+        update_engagement_counter(instance, -1)
+        update_post_replies_counter({"comments": instance.comment_id}, -1)
+    else:
+        # The comment's replies go with it
+        update_engagement_counter(instance, -1)
+        update_post_replies_counter({"id": instance.post_id}, -instance.replies_count)
+
+
+def update_reaction_counters(sender, instance, created, **kwargs):
+    # Count the reaction and its type, or move it to the new type if it changed
+    rtype = instance.rtype
+    loaded_rtype = getattr(instance, "loaded_rtype", None)
+    breakdown = None
+    if created:
+        breakdown = JSONCounterIncrement("reactions_breakdown", rtype, 1)
+    elif loaded_rtype and loaded_rtype != rtype:
+        breakdown = JSONCounterIncrement(
+            JSONCounterIncrement("reactions_breakdown", loaded_rtype, -1), rtype, 1
+        )
+    if breakdown:
+        update_engagement_counter(
+            instance, 1 if created else 0, reactions_breakdown=breakdown
+        )
+    instance.loaded_rtype = rtype
+
+
+def decrement_reaction_counters(sender, instance, origin=None, **kwargs):
+    # Skip cascades from a deleted post, comment or reply, the reacted object is gone too
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Post, Comment, Reply):
+        return
+    rtype = getattr(instance, "loaded_rtype", None) or instance.rtype
+    update_engagement_counter(
+        instance,
+        -1,
+        reactions_breakdown=JSONCounterIncrement("reactions_breakdown", rtype, -1),
+    )
+
+
+for model in (Comment, Reply):
+    post_save.connect(increment_engagement_counter, sender=model)
+    post_delete.connect(decrement_engagement_counter, sender=model)
+post_save.connect(update_reaction_counters, sender=Reaction)
+post_delete.connect(decrement_reaction_counters, sender=Reaction)
@@ -0,0 +1,34 @@
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.db.models.functions import Power
+from apps.common.db_functions import AgeInHours
+import numpy as np
+
+# Engagement ranking of posts (the "top" ordering), with a gravity decay:
+# score = (1 + weighted counts) / (age in hours + AGE_OFFSET_HOURS) ** GRAVITY
+# New posts start at INITIAL_SCORE, so posts without engagement rank by recency.
+WEIGHTS = {"reactions_count": 1, "comments_count": 3, "replies_count": 2}
+GRAVITY = 1.5
+AGE_OFFSET_HOURS = 2
+INITIAL_SCORE = 1 / AGE_OFFSET_HOURS**GRAVITY
+
+
+def score_expression(**deltas):
+    # Score of a post in SQL. `deltas` are counter changes made in the same UPDATE,
+    # since the right side of a SET sees the values from before the UPDATE.
+    engagement = 1
+    for field, weight in WEIGHTS.items():
+        engagement += (F(field) + deltas.get(field, 0)) * weight
+    decay = Power(AgeInHours("created_at") + AGE_OFFSET_HOURS, GRAVITY)
+    return ExpressionWrapper(engagement / decay, output_field=FloatField())
+
+
+def compute_scores(created_at, reactions, comments, replies, now):
+    # Vectorized score_expression over numpy arrays. Times are epoch seconds.
+    engagement = (
+        1
+        + reactions * WEIGHTS["reactions_count"]
+        + comments * WEIGHTS["comments_count"]
+        + replies * WEIGHTS["replies_count"]
+    )
+    age_hours = np.maximum(now - created_at, 0) / 3600
+    return engagement / (age_hours + AGE_OFFSET_HOURS) ** GRAVITY
@@ -14,6 +14,23 @@ from datetime import datetime
 from typing import Any, Optional, Dict, List
 
 from apps.feed.models import REACTION_CHOICES
+from apps.feed.search import highlight
+
+
+class PostOrder(str, Enum):
+    LATEST = "latest"
+    TOP = "top"
+
+
+class TrendingWindow(str, Enum):
+    HOUR = "1h"
+    DAY = "24h"
+
+
+class SearchType(str, Enum):
+    POSTS = "posts"
+    COMMENTS = "comments"
+    REPLIES = "replies"
 
 
 class PostSchema(Schema):
@@ -21,12 +38,22 @@ class PostSchema(Schema):
     text: str
     slug: str = Field(..., example="john-doe-d10dde64-a242-4ed0-bd75-4c759644b3a6")
     reactions_count: int = 0
+    reactions_breakdown: Dict[str, int] = Field({}, example={"LIKE": 2, "LOVE": 1})
     comments_count: int = 0
     image: Optional[str] = Field(..., example="https://img.url", alias="get_image")
     created_at: datetime
     updated_at: datetime
 
 
+class TrendingResponseDataSchema(Schema):
+    window: str
+    posts: List[PostSchema]
+
+
+class TrendingResponseSchema(ResponseSchema):
+    data: TrendingResponseDataSchema
+
+
 class PostInputSchema(Schema):
     text: str
     file_type: Optional[str] = Field(None, example="image/jpeg")
@@ -79,6 +106,7 @@ class ReactionInputSchema(Schema):
 
 class ReactionsResponseDataSchema(PaginatedResponseDataSchema):
     reactions: List[ReactionSchema] = Field(..., alias="items")
+    reactions_breakdown: Dict[str, int] = Field(..., example={"LIKE": 2, "LOVE": 1})
 
 
 class ReactionsResponseSchema(ResponseSchema):
@@ -97,6 +125,7 @@ class ReplySchema(Schema):
     slug: str
     text: str
     reactions_count: int = 0
+    reactions_breakdown: Dict[str, int] = Field({}, example={"LIKE": 2, "LOVE": 1})
 
 
 class CommentSchema(ReplySchema):
@@ -116,8 +145,12 @@ class CommentInputSchema(Schema):
     text: str
 
 
+class CommentWithReplyPreviewsSchema(CommentSchema):
+    replies: Optional[List[ReplySchema]] = Field(None, alias="reply_previews")
+
+
 class CommentsResponseDataSchema(PaginatedResponseDataSchema):
-    comments: List[CommentSchema] = Field(..., alias="items")
+    comments: List[CommentWithReplyPreviewsSchema] = Field(..., alias="items")
 
 
 class CommentsResponseSchema(ResponseSchema):
@@ -134,3 +167,25 @@ class CommentWithRepliesResponseSchema(ResponseSchema):
 
 class ReplyResponseSchema(ResponseSchema):
     data: ReplySchema
+
+
+# SEARCH
+class SearchResultSchema(Schema):
+    author: UserDataSchema
+    slug: str
+    text: str
+    snippet: str = Field(..., example="A nice new <mark>platform</mark>")
+    rank: float
+    created_at: datetime
+
+    @staticmethod
+    def resolve_snippet(obj):
+        return highlight(obj.snippet)
+
+
+class SearchResponseDataSchema(PaginatedResponseDataSchema):
+    results: List[SearchResultSchema] = Field(..., alias="items")
+
+
+class SearchResponseSchema(ResponseSchema):
+    data: SearchResponseDataSchema
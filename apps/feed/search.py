@@ -0,0 +1,45 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Replace
+import html
+
+# Full-text search of posts, comments and replies. Each has a search_vector column
+# (tsvector of text) with a GIN index, kept up to date by a database trigger on insert
+# and text updates (see migration 0007_search_vectors), so searching is an index scan.
+SEARCH_CONFIG = "english"  # Must match the config used by the trigger
+
+# ts_headline doesn't escape the text, so matches are marked with control characters
+# (taken out of the text first) and turned into <mark> tags once the text is escaped
+START_SEL, STOP_SEL = "\x02", "\x03"
+
+
+def search_queryset(queryset, q):
+    # Matches of the web search style query `q` (e.g: "nice platform" -"new"),
+    # best ranked first with highlighted snippets of the text
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type="websearch")
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            # Ranks are float4, cast so cursor values compare exactly when paging
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField()),
+            snippet=SearchHeadline(
+                Replace(
+                    Replace("text", Value(START_SEL), Value("")),
+                    Value(STOP_SEL),
+                    Value(""),
+                ),
+                query,
+                config=SEARCH_CONFIG,
+                start_sel=START_SEL,
+                stop_sel=STOP_SEL,
+                max_fragments=2,
+            ),
+        )
+        .order_by("-rank", "-id")
+    )
+
+
+def highlight(snippet):
+    # The snippet as safe HTML: escaped, with the matches wrapped in <mark></mark>
+    snippet = html.escape(snippet)
+    return snippet.replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
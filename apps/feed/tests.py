@@ -1,10 +1,32 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.core.management import call_command
 from django.test.client import AsyncClient
 from unittest import mock
-from apps.feed.models import Post, Reaction, Comment, Reply
+from apps.feed.models import (
+    EngagementBucket,
+    Post,
+    PullAuthor,
+    Reaction,
+    Comment,
+    Reply,
+    Timeline,
+)
+from apps.feed.trending import roll_up_trending
+from apps.feed.utils import react
+from datetime import timedelta
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.profiles.coalescing import withdraw
+from apps.profiles.models import Friend, Notification
+from apps.profiles.utils import get_notification_group
+from apps.common.microcache import response_cache
+from apps.common.realtime import drain
+from apps.common.models import Purge
 from apps.common.utils import TestUtil
 from apps.common.error import ErrorCode
-import uuid, os
+import asyncio, uuid, os
 
 
 class TestFeed(TestCase):
@@ -13,6 +35,9 @@ class TestFeed(TestCase):
     reactions_url = "/api/v2/feed/reactions/"
     comment_url = "/api/v2/feed/comments/"
     reply_url = "/api/v2/feed/replies/"
+    timeline_url = "/api/v2/feed/timeline/"
+    search_url = "/api/v2/feed/search/"
+    trending_url = "/api/v2/feed/trending/"
 
     maxDiff = None
 
@@ -24,6 +49,7 @@ class TestFeed(TestCase):
         verified_user = TestUtil.verified_user()
         another_verified_user = TestUtil.another_verified_user()
         self.verified_user = verified_user
+        self.another_verified_user = another_verified_user
 
         # post
         post = Post.objects.create(
@@ -66,12 +92,16 @@ class TestFeed(TestCase):
                     "per_page": 50,
                     "current_page": 1,
                     "last_page": 1,
+                    "last_page_estimated": False,
+                    "next_cursor": None,
+                    "prev_cursor": None,
                     "posts": [
                         {
                             "author": mock.ANY,
                             "text": post.text,
                             "slug": post.slug,
                             "reactions_count": mock.ANY,
+                            "reactions_breakdown": mock.ANY,
                             "comments_count": mock.ANY,
                             "image": None,
                             "created_at": mock.ANY,
@@ -82,6 +112,351 @@ class TestFeed(TestCase):
             },
         )
 
+    async def test_retrieve_posts_conditionally(self):
+        post = self.post
+        for url in (self.posts_url, f"{self.posts_url}{post.slug}/"):
+            response = await self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+
+            # Unchanged
+            response = await self.client.get(url, **{"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+            # Changed counters
+            await Reaction.objects.acreate(
+                user=self.another_verified_user, rtype="WOW", post=post
+            )
+            response = await self.client.get(url, **{"If-None-Match": etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response["ETag"], etag)
+            await Reaction.objects.filter(user=self.another_verified_user).adelete()
+
+    @mock.patch("apps.common.microcache.AnonymousResponseCache.timeout", 5)
+    async def test_retrieve_post_anonymously_cached(self):
+        self.addCleanup(response_cache.cache.local.data.clear)
+        url = f"{self.posts_url}{self.post.slug}/"
+        response = await self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("Authorization", response["Vary"])
+        data = response.json()
+
+        # Served from the cache while fresh, even after a change
+        await Post.objects.filter(id=self.post.id).aupdate(text="Changed text")
+        response = await self.client.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.json(), data)
+        response = await self.client.get(url, **{"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        # Authenticated requests always run the view
+        response = await self.client.get(url, **self.bearer)
+        self.assertFalse(response.has_header("X-Cache"))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertEqual(response.json()["data"]["text"], "Changed text")
+
+        # Stale, served while another worker refreshes it
+        for _, entry in response_cache.cache.local.data.values():
+            entry["fresh_until"] = 0
+        with mock.patch.object(response_cache, "acquire", return_value=False):
+            response = await self.client.get(url)
+        self.assertEqual(response["X-Cache"], "STALE")
+        self.assertEqual(response.json(), data)
+
+        # Stale, refreshed by the request that finds it
+        response = await self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["data"]["text"], "Changed text")
+
+    @mock.patch("apps.feed.views.paginator.page_size", 2)
+    async def test_retrieve_posts_by_cursor(self):
+        for i in range(3):
+            await Post.objects.acreate(author=self.verified_user, text=f"Post {i}")
+        slugs = [
+            slug
+            async for slug in Post.objects.order_by("-created_at").values_list(
+                "slug", flat=True
+            )
+        ]
+
+        # Numbered page returns a cursor to continue from
+        response = await self.client.get(self.posts_url, content_type=self.content_type)
+        data = response.json()["data"]
+        self.assertEqual([post["slug"] for post in data["posts"]], slugs[:2])
+        self.assertIsNone(data["prev_cursor"])
+        self.assertEqual(data["last_page"], 2)
+        self.assertFalse(data["last_page_estimated"])
+
+        # Test for next page by cursor
+        response = await self.client.get(
+            f"{self.posts_url}?cursor={data['next_cursor']}",
+            content_type=self.content_type,
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([post["slug"] for post in data["posts"]], slugs[2:])
+        self.assertIsNone(data["current_page"])
+        self.assertIsNone(data["next_cursor"])
+
+        # Test for previous page by cursor
+        response = await self.client.get(
+            f"{self.posts_url}?cursor={data['prev_cursor']}",
+            content_type=self.content_type,
+        )
+        data = response.json()["data"]
+        self.assertEqual([post["slug"] for post in data["posts"]], slugs[:2])
+        self.assertIsNone(data["prev_cursor"])
+
+        # Test for invalid cursor
+        response = await self.client.get(
+            f"{self.posts_url}?cursor=invalid", content_type=self.content_type
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            {
+                "status": "failure",
+                "code": ErrorCode.INVALID_PAGE,
+                "message": "Invalid Cursor",
+            },
+        )
+
+    async def test_retrieve_top_posts(self):
+        post = self.post  # Has a reaction and a comment with a reply
+        new_post = await Post.objects.acreate(author=self.verified_user, text="New")
+
+        response = await self.client.get(
+            f"{self.posts_url}?order=top", content_type=self.content_type
+        )
+        self.assertEqual(response.status_code, 200)
+        slugs = [p["slug"] for p in response.json()["data"]["posts"]]
+        self.assertEqual(slugs, [post.slug, new_post.slug])
+
+        # Periodic rescoring decays the scores without changing the ranking here
+        await post.arefresh_from_db()
+        score = post.score
+        self.assertEqual(post.replies_count, 1)
+        await sync_to_async(call_command)("rescore_posts")
+        await post.arefresh_from_db()
+        self.assertAlmostEqual(post.score, score, places=3)
+        response = await self.client.get(
+            f"{self.posts_url}?order=top", content_type=self.content_type
+        )
+        slugs = [p["slug"] for p in response.json()["data"]["posts"]]
+        self.assertEqual(slugs, [post.slug, new_post.slug])
+
+    async def test_retrieve_trending_posts(self):
+        post = self.post
+        new_post = await Post.objects.acreate(
+            author=self.another_verified_user, text="New"
+        )
+
+        # Engagements are counted as they happen, a change of reaction type isn't
+        for rtype in ("LIKE", "LOVE"):
+            await self.client.post(
+                f"{self.reactions_url}POST/{new_post.slug}/",
+                {"rtype": rtype},
+                content_type=self.content_type,
+                **self.bearer,
+            )
+        response = await self.client.post(
+            f"{self.posts_url}{new_post.slug}/comments/",
+            {"text": "Trending"},
+            content_type=self.content_type,
+            **self.bearer,
+        )
+        await self.client.post(
+            f"{self.comment_url}{response.json()['data']['slug']}/",
+            {"text": "Indeed"},
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+        await self.client.post(
+            f"{self.reactions_url}REPLY/{self.reply.slug}/",
+            {"rtype": "LIKE"},
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+
+        # The list is only updated by the roll-up
+        response = await self.client.get(self.trending_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"], {"window": "1h", "posts": []})
+
+        await sync_to_async(call_command)("update_trending")
+        for window in ("1h", "24h"):
+            response = await self.client.get(f"{self.trending_url}?window={window}")
+            data = response.json()["data"]
+            self.assertEqual(data["window"], window)
+            slugs = [p["slug"] for p in data["posts"]]
+            self.assertEqual(slugs, [new_post.slug, post.slug])
+
+        # Buckets expire once they are out of every window
+        await sync_to_async(roll_up_trending)(timezone.now() + timedelta(days=3))
+        self.assertFalse(await EngagementBucket.objects.aexists())
+        response = await self.client.get(self.trending_url)
+        self.assertEqual(response.json()["data"]["posts"], [])
+
+    async def test_retrieve_timeline(self):
+        post = self.post
+        other_user = self.another_verified_user
+
+        # Accepting a friendship backfills each other's posts
+        friend = await Friend.objects.acreate(
+            requester=self.verified_user, requestee=other_user, status="ACCEPTED"
+        )
+        response = await self.client.post(
+            self.posts_url,
+            {"text": "Friends only"},
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+        new_post_slug = response.json()["data"]["slug"]
+
+        response = await self.client.get(
+            self.timeline_url, content_type=self.content_type, **self.other_user_bearer
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [new_post_slug, post.slug])
+        self.assertIsNone(data["next_cursor"])
+        self.assertIsNone(data["prev_cursor"])
+
+        response = await self.client.get(
+            self.timeline_url, content_type=self.content_type, **self.bearer
+        )
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [new_post_slug])
+
+        # A tombstoned post waiting to be purged is left out, the page refilled
+        hidden = Post._base_manager.filter(slug=new_post_slug)
+        await hidden.aupdate(deleted_at=timezone.now())
+        with mock.patch("apps.feed.views.paginator.page_size", 1):
+            response = await self.client.get(
+                self.timeline_url, **self.other_user_bearer
+            )
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [post.slug])
+        self.assertIsNone(data["next_cursor"])
+        await hidden.aupdate(deleted_at=None)
+
+        # Ending the friendship removes each other's posts
+        await friend.adelete()
+        response = await self.client.get(
+            self.timeline_url, content_type=self.content_type, **self.other_user_bearer
+        )
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [new_post_slug])
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    @mock.patch("apps.feed.views.paginator.page_size", 1)
+    async def test_retrieve_timeline_with_pulled_authors(self):
+        other_user = self.another_verified_user
+        await Friend.objects.acreate(
+            requester=self.verified_user, requestee=other_user, status="ACCEPTED"
+        )
+        self.assertTrue(await PullAuthor.objects.filter(author=other_user).aexists())
+        response = await self.client.post(
+            self.posts_url,
+            {"text": "Pulled, not fanned out"},
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+        new_post_slug = response.json()["data"]["slug"]
+        self.assertFalse(
+            await Timeline.objects.filter(
+                user=self.verified_user, post__slug=new_post_slug
+            ).aexists()
+        )
+
+        # The pulled post is merged with the materialized timeline at read time
+        await Timeline.objects.acreate(
+            user=self.verified_user,
+            post=self.post,
+            post_created_at=self.post.created_at,
+        )
+        response = await self.client.get(
+            self.timeline_url, content_type=self.content_type, **self.bearer
+        )
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [new_post_slug])
+        self.assertIsNone(data["prev_cursor"])
+
+        response = await self.client.get(
+            f"{self.timeline_url}?cursor={data['next_cursor']}",
+            content_type=self.content_type,
+            **self.bearer,
+        )
+        data = response.json()["data"]
+        self.assertEqual([p["slug"] for p in data["posts"]], [self.post.slug])
+        self.assertIsNone(data["next_cursor"])
+        self.assertIsNotNone(data["prev_cursor"])
+
+    @mock.patch("apps.feed.views.paginator.page_size", 1)
+    async def test_search(self):
+        post = self.post
+        other_post = await Post.objects.acreate(
+            author=self.another_verified_user, text="A new platform, a new platform"
+        )
+
+        # Best match first, with highlighted snippets
+        response = await self.client.get(
+            f"{self.search_url}?q=new platform", content_type=self.content_type
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual([r["slug"] for r in data["results"]], [other_post.slug])
+        self.assertIn("<mark>platform</mark>", data["results"][0]["snippet"])
+        self.assertIsNone(data["prev_cursor"])
+
+        # The text is escaped, only the highlights are HTML
+        await Comment.objects.acreate(
+            post=post, author=self.verified_user, text="Rockets & stars <3"
+        )
+        response = await self.client.get(f"{self.search_url}?q=rockets&type=comments")
+        snippet = response.json()["data"]["results"][0]["snippet"]
+        # The headline's fragment ends at "stars", the & is in it
+        self.assertIn("<mark>Rockets</mark> &amp; stars", snippet)
+        self.assertNotIn("<", snippet.replace("<mark>", "").replace("</mark>", ""))
+
+        response = await self.client.get(
+            f"{self.search_url}?q=new platform&cursor={data['next_cursor']}",
+            content_type=self.content_type,
+        )
+        data = response.json()["data"]
+        self.assertEqual([r["slug"] for r in data["results"]], [post.slug])
+        self.assertIsNone(data["next_cursor"])
+
+        # Edited text is searchable
+        post.text = "Renamed"
+        await post.asave()
+        response = await self.client.get(
+            f"{self.search_url}?q=renamed", content_type=self.content_type
+        )
+        data = response.json()["data"]
+        self.assertEqual([r["slug"] for r in data["results"]], [post.slug])
+
+        # Test for comments and replies
+        response = await self.client.get(
+            f"{self.search_url}?q=comment&type=comments", content_type=self.content_type
+        )
+        data = response.json()["data"]
+        self.assertEqual([r["slug"] for r in data["results"]], [self.comment.slug])
+        response = await self.client.get(
+            f"{self.search_url}?q=replies&type=replies", content_type=self.content_type
+        )
+        data = response.json()["data"]
+        self.assertEqual([r["slug"] for r in data["results"]], [self.reply.slug])
+
+        # Test for empty query
+        response = await self.client.get(
+            f"{self.search_url}?q= ", content_type=self.content_type
+        )
+        self.assertEqual(response.status_code, 400)
+
     async def test_create_post(self):
         post_dict = {"text": "My new Post"}
         response = await self.client.post(
@@ -100,6 +475,7 @@ class TestFeed(TestCase):
                     "created_at": mock.ANY,
                     "updated_at": mock.ANY,
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                     "comments_count": 0,
                     "file_upload_data": None,
                 },
@@ -138,6 +514,7 @@ class TestFeed(TestCase):
                     "text": post.text,
                     "slug": post.slug,
                     "reactions_count": mock.ANY,
+                    "reactions_breakdown": mock.ANY,
                     "comments_count": mock.ANY,
                     "image": None,
                     "created_at": mock.ANY,
@@ -146,6 +523,20 @@ class TestFeed(TestCase):
             },
         )
 
+        # Cached cards are replaced once the post's counters or its author change
+        user = self.verified_user
+        user.first_name = "Renamed"
+        await user.asave()
+        await Reaction.objects.acreate(
+            user=self.another_verified_user, rtype="WOW", post=post
+        )
+        response = await self.client.get(
+            f"{self.posts_url}{post.slug}/", content_type=self.content_type
+        )
+        data = response.json()["data"]
+        self.assertEqual(data["author"]["name"], user.full_name)
+        self.assertEqual(data["reactions_breakdown"], {"LIKE": 1, "WOW": 1})
+
     async def test_update_post(self):
         post_dict = {"text": "Post Text Updated"}
         post = self.post
@@ -203,6 +594,7 @@ class TestFeed(TestCase):
                     "created_at": mock.ANY,
                     "updated_at": mock.ANY,
                     "reactions_count": mock.ANY,
+                    "reactions_breakdown": mock.ANY,
                     "comments_count": mock.ANY,
                     "file_upload_data": None,
                 },
@@ -258,6 +650,16 @@ class TestFeed(TestCase):
             },
         )
 
+        # The post is hidden right away and purged with its dependents in batches
+        self.assertFalse(await Post.objects.filter(id=post.id).aexists())
+        purge = await Purge.objects.aget(target_id=post.id)
+        self.assertIsNotNone(purge.completed_at)
+        self.assertEqual(purge.step, 7)
+        self.assertFalse(await Post._base_manager.filter(id=post.id).aexists())
+        self.assertFalse(await Comment.objects.filter(post_id=post.id).aexists())
+        self.assertFalse(await Reply.objects.filter(id=self.reply.id).aexists())
+        self.assertFalse(await Reaction.objects.filter(id=self.reaction.id).aexists())
+
     async def test_retrieve_reactions(self):
         post = self.post
         user = self.verified_user
@@ -306,6 +708,10 @@ class TestFeed(TestCase):
                     "per_page": 50,
                     "current_page": 1,
                     "last_page": 1,
+                    "last_page_estimated": False,
+                    "next_cursor": None,
+                    "prev_cursor": None,
+                    "reactions_breakdown": {"LIKE": 1},
                     "reactions": [
                         {
                             "id": str(reaction.id),
@@ -386,6 +792,83 @@ class TestFeed(TestCase):
             },
         )
 
+        # Changing the reaction type moves it in the breakdown
+        await post.arefresh_from_db()
+        self.assertEqual(post.reactions_count, 1)
+        self.assertEqual(post.reactions_breakdown, {"LOVE": 1})
+
+    def test_react_round_trips(self):
+        post = Post.objects.get(id=self.post.id)
+        user = self.another_verified_user
+
+        # New reaction: one upsert each for the reaction, counters and notification, a
+        # read of the notification and one insert of its socket events (plus a savepoint
+        # and its release for the reaction's and the notification's transactions)
+        with self.assertNumQueries(9):
+            reaction, created, notification_id = react(user, post, "LIKE")
+        self.assertTrue(created)
+        notification = Notification.objects.get(id=notification_id)
+        self.assertEqual(notification.ntype, "REACTION")
+        self.assertEqual(notification.post_slug, post.slug)
+        self.assertEqual(notification.target_text, post.text)
+        self.assertEqual(list(notification.receivers.all()), [self.verified_user])
+
+        # Same type again changes nothing, a new type only moves the breakdown
+        with self.assertNumQueries(3):
+            _, created, notification_id = react(user, post, "LIKE")
+        self.assertFalse(created)
+        self.assertIsNone(notification_id)
+        with self.assertNumQueries(4):
+            changed_reaction, created, _ = react(user, post, "WOW")
+        self.assertFalse(created)
+        self.assertEqual(changed_reaction.id, reaction.id)
+
+        post.refresh_from_db()
+        self.assertEqual(post.reactions_count, 2)
+        self.assertEqual(post.reactions_breakdown, {"LIKE": 1, "WOW": 1})
+        self.assertEqual(Notification.objects.filter(sender=user, post=post).count(), 1)
+
+    def test_reaction_notifications_coalesced(self):
+        post = Post.objects.get(id=self.post.id)
+        reactors = [self.another_verified_user] + [
+            User.objects.create_user(
+                first_name="Reactor",
+                last_name=f"Number{i}",
+                email=f"reactor{i}@example.com",
+                password=f"reactor{i}password",
+            )
+            for i in range(2)
+        ]
+        reactions = [react(user, post, "LIKE")[0] for user in reactors]
+
+        # One notification in the author's inbox, by the latest reactor
+        notification = Notification.objects.get(ntype="REACTION", post=post)
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual(notification.recent_actors, [u.id for u in reactors[::-1]])
+        self.assertEqual(
+            notification.message,
+            f"{reactors[2].full_name} and 2 others reacted to your post",
+        )
+        self.assertEqual(self.verified_user.inbox.count(), 1)
+        self.verified_user.refresh_from_db()
+        self.assertEqual(self.verified_user.unread_notifications, 1)
+
+        # Taking the latest reaction back recounts it from the others
+        notification, status = withdraw("REACTION", reactions[2])
+        self.assertEqual(status, "UPDATED")
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.sender_id, reactors[1].id)
+        self.assertEqual(
+            notification.message,
+            f"{reactors[1].full_name} and 1 other reacted to your post",
+        )
+
+        # Going with its post, it's taken off the unread counter too
+        post.delete()
+        self.verified_user.refresh_from_db()
+        self.assertEqual(self.verified_user.unread_notifications, 0)
+
     async def test_delete_reaction(self):
         reaction = self.reaction
 
@@ -470,6 +953,9 @@ class TestFeed(TestCase):
                     "per_page": 50,
                     "current_page": 1,
                     "last_page": 1,
+                    "last_page_estimated": False,
+                    "next_cursor": None,
+                    "prev_cursor": None,
                     "comments": [
                         {
                             "author": {
@@ -480,13 +966,73 @@ class TestFeed(TestCase):
                             "slug": comment.slug,
                             "text": comment.text,
                             "reactions_count": await comment.reactions.acount(),
+                            "reactions_breakdown": {},
                             "replies_count": await comment.replies.acount(),
+                            "replies": None,
                         }
                     ],
                 },
             },
         )
 
+        # Test for inlined reply previews, latest first
+        new_reply = await Reply.objects.acreate(
+            author=user, comment=comment, text="Newer reply"
+        )
+        response = await self.client.get(
+            f"{self.posts_url}{post.slug}/comments/?replies=1",
+            content_type=self.content_type,
+        )
+        self.assertEqual(response.status_code, 200)
+        [comment_data] = response.json()["data"]["comments"]
+        self.assertEqual(
+            comment_data["replies"],
+            [
+                {
+                    "author": mock.ANY,
+                    "slug": new_reply.slug,
+                    "text": new_reply.text,
+                    "reactions_count": 0,
+                    "reactions_breakdown": {},
+                }
+            ],
+        )
+        response = await self.client.get(
+            f"{self.posts_url}{post.slug}/comments/?replies=5",
+            content_type=self.content_type,
+        )
+        [comment_data] = response.json()["data"]["comments"]
+        self.assertEqual(
+            [reply["slug"] for reply in comment_data["replies"]],
+            [new_reply.slug, self.reply.slug],
+        )
+
+    def test_engagement_counters(self):
+        post = Post.objects.get(id=self.post.id)
+        comment = Comment.objects.get(id=self.comment.id)
+        self.assertEqual(post.reactions_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(comment.replies_count, 1)
+
+        # Deleting a reply decrements its comment's counter
+        self.reply.delete()
+        comment.refresh_from_db()
+        self.assertEqual(comment.replies_count, 0)
+
+        self.assertEqual(post.reactions_breakdown, {"LIKE": 1})
+
+        # Rebuild counters that drifted from the source tables
+        Post.objects.filter(id=post.id).update(
+            reactions_count=10, comments_count=0, reactions_breakdown={"SAD": 3}
+        )
+        with self.assertRaises(SystemExit):
+            call_command("sync_engagement_counters", "--check")
+        call_command("sync_engagement_counters")
+        post.refresh_from_db()
+        self.assertEqual(post.reactions_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.reactions_breakdown, {"LIKE": 1})
+
     async def test_create_comment(self):
         post = self.post
         user = self.verified_user
@@ -532,11 +1078,69 @@ class TestFeed(TestCase):
                     "slug": mock.ANY,
                     "text": comment_data["text"],
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                     "replies_count": 0,
                 },
             },
         )
 
+    async def test_comment_notification_published(self):
+        # Listen as the post's author (the receiver) and as the comment's author
+        channel_layer = get_channel_layer("testing")
+        user = self.another_verified_user
+        channels = {}
+        for receiver in (self.verified_user, user):
+            group = get_notification_group(receiver.id)
+            channels[receiver] = await channel_layer.new_channel()
+            await channel_layer.group_add(group, channels[receiver])
+            self.addCleanup(
+                async_to_sync(channel_layer.group_discard), group, channels[receiver]
+            )
+
+        response = await self.client.post(
+            f"{self.posts_url}{self.post.slug}/comments/",
+            {"text": "Published comment"},
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+        comment_slug = response.json()["data"]["slug"]
+        notification = await Notification.objects.aget(comment__slug=comment_slug)
+
+        # Written to the outbox with the comment, sent by the worker
+        self.assertEqual(await drain(), (2, 0, mock.ANY))
+        self.assertEqual(
+            await channel_layer.receive(channels[self.verified_user]),
+            {
+                "type": "badge_message",
+                "badges": {"status": "BADGES", "notifications": 1},
+            },
+        )
+        self.assertEqual(
+            await channel_layer.receive(channels[self.verified_user]),
+            {
+                "type": "notification_message",
+                "notification_data": {
+                    "id": str(notification.id),
+                    "status": "CREATED",
+                    "ntype": "COMMENT",
+                    "sender": {
+                        "name": user.full_name,
+                        "username": user.username,
+                        "avatar": user.get_avatar,
+                    },
+                    "message": f"{user.full_name} commented on your post",
+                    "post_slug": self.post.slug,
+                    "comment_slug": comment_slug,
+                    "reply_slug": None,
+                    "target_text": "Published comment",
+                    "actor_count": 1,
+                    "is_read": False,
+                },
+            },
+        )
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(channel_layer.receive(channels[user]), 0.05)
+
     async def test_retrieve_comment_with_replies(self):
         reply = self.reply
         comment = reply.comment
@@ -576,12 +1180,16 @@ class TestFeed(TestCase):
                         "slug": comment.slug,
                         "text": comment.text,
                         "reactions_count": await comment.reactions.acount(),
+                        "reactions_breakdown": {},
                         "replies_count": await comment.replies.acount(),
                     },
                     "replies": {
                         "per_page": 50,
                         "current_page": 1,
                         "last_page": 1,
+                        "last_page_estimated": False,
+                        "next_cursor": None,
+                        "prev_cursor": None,
                         "items": [
                             {
                                 "author": {
@@ -592,6 +1200,7 @@ class TestFeed(TestCase):
                                 "slug": reply.slug,
                                 "text": reply.text,
                                 "reactions_count": 0,
+                                "reactions_breakdown": {},
                             }
                         ],
                     },
@@ -644,10 +1253,30 @@ class TestFeed(TestCase):
                     "slug": mock.ANY,
                     "text": reply_data["text"],
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                 },
             },
         )
 
+        # The comment's author is notified, with the slugs stored on the notification
+        response = await self.client.post(
+            f"{self.comment_url}{comment.slug}/",
+            data=reply_data,
+            content_type=self.content_type,
+            **self.other_user_bearer,
+        )
+        reply_slug = response.json()["data"]["slug"]
+        notification = await Notification.objects.aget(reply__slug=reply_slug)
+        self.assertEqual(
+            [
+                notification.post_slug,
+                notification.comment_slug,
+                notification.reply_slug,
+                notification.target_text,
+            ],
+            [self.post.slug, comment.slug, reply_slug, reply_data["text"]],
+        )
+
     async def test_update_comment(self):
         comment = self.comment
         user = self.verified_user
@@ -710,6 +1339,7 @@ class TestFeed(TestCase):
                     "slug": mock.ANY,
                     "text": comment_data["text"],
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                     "replies_count": mock.ANY,
                 },
             },
@@ -802,6 +1432,7 @@ class TestFeed(TestCase):
                     "slug": reply.slug,
                     "text": reply.text,
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                 },
             },
         )
@@ -868,6 +1499,7 @@ class TestFeed(TestCase):
                     "slug": mock.ANY,
                     "text": reply_data["text"],
                     "reactions_count": 0,
+                    "reactions_breakdown": {},
                 },
             },
         )
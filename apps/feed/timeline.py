@@ -0,0 +1,222 @@
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Case, F, Q, When
+from django.db.models.signals import post_delete, post_save
+from apps.common.error import ErrorCode
+from apps.common.exceptions import RequestError
+from apps.common.paginators import CustomPagination
+from apps.common.tasks import run_in_background
+from apps.feed.models import Post, PullAuthor, Timeline
+from apps.profiles.models import Friend
+import heapq
+
+# Timelines are hybrid. Posts of most authors are pushed (fanned out on write) into
+# their friends' materialized timelines. Authors with TIMELINE_FANOUT_THRESHOLD or
+# more friends are pulled instead: their recent posts are merged in at read time,
+# so a single post never writes more than TIMELINE_FANOUT_THRESHOLD rows.
+
+# Rows written per INSERT when fanning out
+FANOUT_BATCH_SIZE = 1000
+
+# Timeline order, on posts. Entries are ordered the same by (post_created_at, post_id)
+TIMELINE_ORDERING = ["-created_at", "-id"]
+ENTRY_FIELDS = {"created_at": "post_created_at", "id": "post_id"}
+
+
+def get_friend_ids(user_id):
+    return (
+        Friend.objects.filter(Q(requester_id=user_id) | Q(requestee_id=user_id))
+        .filter(status="ACCEPTED")
+        .annotate(
+            friend_id=Case(
+                When(requester_id=user_id, then=F("requestee_id")),
+                When(requestee_id=user_id, then=F("requester_id")),
+            )
+        )
+        .values_list("friend_id", flat=True)
+    )
+
+
+def is_pulled(author_id):
+    return PullAuthor.objects.filter(author_id=author_id).exists()
+
+
+def insert_timeline_entries(entries):
+    Timeline.objects.bulk_create(
+        entries, batch_size=FANOUT_BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out_post(post):
+    # Write the post into the author's timeline and, unless the author is pulled,
+    # into each accepted friend's timeline
+    user_ids = [post.author_id]
+    if not is_pulled(post.author_id):
+        user_ids += get_friend_ids(post.author_id)
+    insert_timeline_entries(
+        Timeline(user_id=user_id, post_id=post.id, post_created_at=post.created_at)
+        for user_id in user_ids
+    )
+
+
+def backfill_timeline(user_id, author_id):
+    # Copy the author's recent posts into a friend's timeline
+    posts = Post.objects.filter(author_id=author_id).values_list("id", "created_at")[
+        : settings.TIMELINE_BACKFILL_SIZE
+    ]
+    insert_timeline_entries(
+        Timeline(user_id=user_id, post_id=post_id, post_created_at=created_at)
+        for post_id, created_at in posts
+    )
+
+
+def update_fanout_mode(author_id):
+    # Switch the author to pull at the threshold, and back to push only below half of it
+    # so a friendship made and ended around the threshold doesn't flip the mode every time
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    friends_count = get_friend_ids(author_id).count()
+    if friends_count >= threshold:
+        PullAuthor.objects.get_or_create(author_id=author_id)
+    elif friends_count < threshold // 2 and is_pulled(author_id):
+        PullAuthor.objects.filter(author_id=author_id).delete()
+        for friend_id in get_friend_ids(author_id).iterator():
+            backfill_timeline(friend_id, author_id)
+
+
+def start_friendship_timelines(requester_id, requestee_id):
+    for author_id, user_id in (
+        (requester_id, requestee_id),
+        (requestee_id, requester_id),
+    ):
+        update_fanout_mode(author_id)
+        if not is_pulled(author_id):
+            backfill_timeline(user_id, author_id)
+
+
+def end_friendship_timelines(requester_id, requestee_id):
+    # Remove each user's posts from the other's timeline
+    Timeline.objects.filter(
+        Q(user_id=requester_id, post__author_id=requestee_id)
+        | Q(user_id=requestee_id, post__author_id=requester_id)
+    ).delete()
+    update_fanout_mode(requester_id)
+    update_fanout_mode(requestee_id)
+
+
+def backfill_friends_timelines(sender, instance, **kwargs):
+    if instance.status == "ACCEPTED":
+        run_in_background(
+            start_friendship_timelines, instance.requester_id, instance.requestee_id
+        )
+
+
+def clear_friends_timelines(sender, instance, **kwargs):
+    if instance.status == "ACCEPTED":
+        run_in_background(
+            end_friendship_timelines, instance.requester_id, instance.requestee_id
+        )
+
+
+# Connected in FeedConfig.ready, profiles models import feed models
+def connect_signals():
+    post_save.connect(backfill_friends_timelines, sender=Friend)
+    post_delete.connect(clear_friends_timelines, sender=Friend)
+
+
+# READING
+def entry_field(field):
+    name = field.lstrip("-")
+    return field.replace(name, ENTRY_FIELDS[name])
+
+
+def get_timeline_post_ids(user_id, direction, values, limit):
+    # Returns up to `limit` post ids of the user's timeline after the cursor values,
+    # with the cursor values of the last one. The materialized entries and the stream
+    # of each pulled friend are fetched (all in `direction` order, `limit` rows at
+    # most) and k-way merged.
+    ordering = TIMELINE_ORDERING
+    if direction == "prev":
+        ordering = [CustomPagination.reverse_order(field) for field in ordering]
+    entry_ordering = [entry_field(field) for field in ordering]
+    descending = ordering[0].startswith("-")
+
+    entries = Timeline.objects.filter(user_id=user_id)
+    if values:
+        entries = entries.filter(CustomPagination.keyset_filter(entry_ordering, values))
+    streams = [
+        list(
+            entries.order_by(*entry_ordering).values_list("post_created_at", "post_id")[
+                :limit
+            ]
+        )
+    ]
+
+    pulled_ids = list(
+        PullAuthor.objects.filter(author_id__in=get_friend_ids(user_id)).values_list(
+            "author_id", flat=True
+        )
+    )
+    if pulled_ids:
+        author_streams = []
+        for author_id in pulled_ids:
+            posts = Post.objects.filter(author_id=author_id)
+            if values:
+                posts = posts.filter(CustomPagination.keyset_filter(ordering, values))
+            author_streams.append(
+                posts.order_by(*ordering).values_list("created_at", "id", "author_id")[
+                    :limit
+                ]
+            )
+        # One round trip for all pulled authors, each limited by its own index range scan
+        pulled = defaultdict(list)
+        for created_at, post_id, author_id in author_streams[0].union(
+            *author_streams[1:], all=True
+        ):
+            pulled[author_id].append((created_at, post_id))
+        for stream in pulled.values():
+            stream.sort(reverse=descending)
+            streams.append(stream)
+
+    post_ids, last = [], None
+    for last in heapq.merge(*streams, reverse=descending):
+        # A post can be both materialized and pulled if its author's mode changed
+        if last[1] not in post_ids:
+            post_ids.append(last[1])
+        if len(post_ids) == limit:
+            break
+    return post_ids, last
+
+
+def get_timeline_posts(user_id, direction, values, limit):
+    # Returns up to `limit` posts of the user's timeline after the cursor values.
+    # Tombstoned posts whose entries aren't purged yet are left out, and the page is
+    # refilled with the ones after them.
+    found = []
+    while True:
+        post_ids, last = get_timeline_post_ids(user_id, direction, values, limit)
+        posts = Post.objects.select_related(
+            "author", "author__avatar", "image"
+        ).in_bulk(post_ids)
+        found += [posts[post_id] for post_id in post_ids if post_id in posts]
+        if len(post_ids) < limit or len(found) >= limit:
+            return found[:limit]
+        values = list(last)  # Go on after the last one
+
+
+async def paginate_timeline(paginator, user_id, cursor=None):
+    direction, values = paginator.parse_cursor(cursor, TIMELINE_ORDERING)
+    try:
+        posts = await sync_to_async(get_timeline_posts)(
+            user_id, direction, values, paginator.page_size + 1
+        )
+    except (ValidationError, ValueError):
+        raise RequestError(
+            err_code=ErrorCode.INVALID_PAGE,
+            err_msg="Invalid Cursor",
+            status_code=400,
+        )
+    return paginator.cursor_page(
+        posts, TIMELINE_ORDERING, direction, first_page=not cursor
+    )
@@ -0,0 +1,88 @@
+from datetime import timedelta
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from apps.feed.models import Comment, EngagementBucket, Post, Reply, TrendingPost
+
+# Trending posts are the posts whose engagement grew the most within a window, i.e
+# engagement in the window minus engagement in the window before it. Engagements are
+# counted into per-minute buckets as they happen, and the update_trending command
+# periodically rolls the buckets up into the top TRENDING_SIZE posts of each window,
+# so reads never aggregate reactions or comments.
+TRENDING_WINDOWS = {"1h": timedelta(hours=1), "24h": timedelta(hours=24)}
+TRENDING_SIZE = 50
+
+# Buckets are kept for the largest window and the one before it
+BUCKET_RETENTION = 2 * max(TRENDING_WINDOWS.values())
+
+RECORD_ENGAGEMENT_SQL = """
+    INSERT INTO feed_engagementbucket (post_id, minute, count) VALUES (%s, %s, 1)
+    ON CONFLICT (post_id, minute) DO UPDATE SET count = feed_engagementbucket.count + 1
+"""
+
+
+def get_engaged_post_id(obj):
+    # The post a reacted to, commented or replied object belongs to
+    if isinstance(obj, Post):
+        return obj.id
+    if isinstance(obj, Comment):
+        return obj.post_id
+    if isinstance(obj, Reply):
+        return obj.comment.post_id
+    return None
+
+
+def record_engagement(post_id):
+    # Counts an engagement of the post in the current minute's bucket, in one statement
+    minute = timezone.now().replace(second=0, microsecond=0)
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_ENGAGEMENT_SQL, [post_id, minute])
+
+
+def get_top_posts(window, now):
+    start = now - TRENDING_WINDOWS[window]
+    previous_start = start - TRENDING_WINDOWS[window]
+    return (
+        EngagementBucket.objects.filter(minute__gte=previous_start)
+        .values("post_id")
+        .annotate(
+            engagement=Sum("count", filter=Q(minute__gte=start), default=0),
+            previous=Sum("count", filter=Q(minute__lt=start), default=0),
+        )
+        .annotate(growth=F("engagement") - F("previous"))
+        .filter(engagement__gt=0, growth__gt=0)
+        .order_by("-growth", "-engagement", "post_id")[:TRENDING_SIZE]
+    )
+
+
+def roll_up_trending(now=None):
+    # Replaces the trending posts of every window and drops the expired buckets
+    now = now or timezone.now()
+    for window in TRENDING_WINDOWS:
+        trending_posts = [
+            TrendingPost(
+                window=window,
+                position=position,
+                post_id=top_post["post_id"],
+                engagement=top_post["engagement"],
+                growth=top_post["growth"],
+            )
+            for position, top_post in enumerate(get_top_posts(window, now), 1)
+        ]
+        with transaction.atomic():
+            TrendingPost.objects.filter(window=window).delete()
+            TrendingPost.objects.bulk_create(trending_posts)
+    EngagementBucket.objects.filter(minute__lt=now - BUCKET_RETENTION).delete()
+
+
+async def get_trending_posts(window):
+    # Deleted posts stay in the list until its next roll-up, leave them out
+    trending_posts = (
+        TrendingPost.objects.filter(
+            window=window,
+            post__deleted_at__isnull=True,
+            post__author__deleted_at__isnull=True,
+        )
+        .select_related("post", "post__author", "post__author__avatar", "post__image")
+    )
+    return [trending_post.post async for trending_post in trending_posts]
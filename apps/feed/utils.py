@@ -1,8 +1,23 @@
+from collections import defaultdict
 from typing import Literal
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from apps.common.cache import TieredCache
 from apps.common.error import ErrorCode
 from apps.common.exceptions import RequestError
-from apps.feed.models import Comment, Post, Reaction, Reply
+from apps.common.singleflight import SingleFlight
+from apps.feed.models import (
+    Comment,
+    Post,
+    Reaction,
+    Reply,
+    update_reaction_counters,
+)
+from apps.feed.schemas import PostSchema
+from apps.profiles.coalescing import notify
+import hashlib, json, uuid
 
 reaction_focus = {"POST": Post, "COMMENT": Comment, "REPLY": Reply}
 
@@ -22,6 +37,9 @@ async def get_reaction_focus_object(focus, slug):
     related = ["author"]  # Related object to preload
     if focus_model == Comment:
         related.append("post")  # Also preload post object for comment
+    elif focus_model == Reply:
+        # Also preload comment and its post for reply
+        related += ["comment", "comment__post"]
     obj = await focus_model.objects.select_related(*related).aget_or_none(slug=slug)
     if not obj:
         raise RequestError(
@@ -32,15 +50,28 @@ async def get_reaction_focus_object(focus, slug):
     return obj
 
 
-async def get_post_object(slug, object_type: Literal["simple", "detailed"] = "simple"):
+# Concurrent identical lookups of hot posts and comments share one query. Only for
+# reads (coalesce=True): a write must not get an object fetched before it started.
+post_lookups = SingleFlight("post_lookups")
+comment_lookups = SingleFlight("comment_lookups")
+
+
+async def get_post_object(
+    slug, object_type: Literal["simple", "detailed"] = "simple", coalesce=False
+):
     # object_type simple fetches the post object without prefetching related objects because they aren't needed
     # detailed fetches the post object with the related objects because they are needed
+    if coalesce:
+        return await post_lookups.do(
+            (slug, object_type), fetch_post_object, slug, object_type
+        )
+    return await fetch_post_object(slug, object_type)
+
 
+async def fetch_post_object(slug, object_type):
     post = Post.objects
     if object_type == "detailed":
-        post = post.select_related("author", "author__avatar", "image").annotate(
-            reactions_count=Count("reactions"), comments_count=Count("comments")
-        )
+        post = post.select_related("author", "author__avatar", "image")
     post = await post.aget_or_none(slug=slug)
     if not post:
         raise RequestError(
@@ -51,6 +82,110 @@ async def get_post_object(slug, object_type: Literal["simple", "detailed"] = "si
     return post
 
 
+# Pre-serialized post cards (PostSchema data) shared by the post list and detail endpoints
+post_cards = TieredCache("shared", "post-card", maxsize=2000)
+
+
+# Fields of a post (and its author) post_card_version reads, with the ones posts are
+# ordered and paged by. Enough to load for computing versions of posts.
+POST_CARD_VERSION_FIELDS = [
+    "id",
+    "created_at",
+    "updated_at",
+    "score",
+    "reactions_count",
+    "comments_count",
+    "reactions_breakdown",
+    "author",
+    "author__updated_at",
+]
+
+
+def post_card_version(post):
+    # Everything rendered on the card that can change. An edited post, new counts
+    # or an updated author profile make a new key, so no stale card is ever served.
+    parts = (
+        post.updated_at,
+        post.reactions_count,
+        post.comments_count,
+        json.dumps(post.reactions_breakdown, sort_keys=True),
+        post.author.updated_at,
+    )
+    return hashlib.md5(str(parts).encode()).hexdigest()
+
+
+async def get_post_cards(posts):
+    # Posts need their author, author__avatar and image preloaded
+    keys = [f"{post.id}:{post_card_version(post)}" for post in posts]
+    cards = await post_cards.get_many(keys)
+    missing = {
+        key: PostSchema.from_orm(post).dict(by_alias=True)
+        for key, post in zip(keys, posts)
+        if key not in cards
+    }
+    if missing:
+        await post_cards.set_many(missing)
+    cards |= missing
+    return [cards[key] for key in keys]
+
+
+# Creates the reaction or changes its type in one statement. The old type (null when
+# created) is read with the row locked, so counters move exactly one change at a time.
+# A reaction inserted concurrently isn't in the statement's snapshot, so the statement
+# changes nothing then and is run again to see it.
+UPSERT_REACTION_SQL = """
+    WITH existing AS (
+        SELECT rtype FROM feed_reaction WHERE user_id = %(user_id)s AND {field}_id = %(obj_id)s
+        FOR UPDATE
+    )
+    INSERT INTO feed_reaction AS r (id, created_at, updated_at, user_id, {field}_id, rtype)
+    VALUES (%(id)s, %(now)s, %(now)s, %(user_id)s, %(obj_id)s, %(rtype)s)
+    ON CONFLICT (user_id, {field}_id) DO UPDATE SET
+        rtype = EXCLUDED.rtype,
+        updated_at = CASE WHEN r.rtype = EXCLUDED.rtype THEN r.updated_at ELSE EXCLUDED.updated_at END
+    WHERE EXISTS (SELECT 1 FROM existing)
+    RETURNING r.id, r.created_at, r.updated_at, (SELECT rtype FROM existing)
+"""
+
+def react(user, obj, rtype):
+    # Creates the reaction of the user to obj (a post, comment or reply) or changes its type,
+    # updates the counters and, for a new reaction, notifies the author. One transaction.
+    # Returns the reaction, whether it was created and the id of the notification of a
+    # new reaction (its receiver's badge is queued with it).
+    field = type(obj).__name__.lower()
+    params = {"user_id": user.id, "obj_id": obj.id, "rtype": rtype}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for _ in range(3):
+            params |= {"id": uuid.uuid4(), "now": timezone.now()}
+            cursor.execute(UPSERT_REACTION_SQL.format(field=field), params)
+            row = cursor.fetchone()
+            if row:
+                break
+        else:
+            raise RequestError(
+                err_code=ErrorCode.CONFLICT,
+                err_msg="Reaction changed concurrently, try again",
+                status_code=409,
+            )
+        reaction_id, created_at, updated_at, loaded_rtype = row
+        reaction = Reaction(
+            id=reaction_id,
+            user=user,
+            rtype=rtype,
+            created_at=created_at,
+            updated_at=updated_at,
+            **{field: obj},
+        )
+        reaction.loaded_rtype = loaded_rtype
+        created = loaded_rtype is None
+        update_reaction_counters(Reaction, reaction, created)
+
+        notification_id = None
+        if created and obj.author_id != user.id:
+            notification_id, _ = notify(user, "REACTION", obj, created_at)
+    return reaction, created, notification_id
+
+
 async def get_reactions_queryset(focus, slug, rtype=None):
     focus_obj = await get_reaction_focus_object(focus, slug)
     focus_obj_field = f"{focus.lower()}_id"  # Field to filter reactions by (e.g post_id, comment_id, reply_id)
@@ -58,15 +193,19 @@ async def get_reactions_queryset(focus, slug, rtype=None):
     if rtype:
         filter["rtype"] = rtype  # Filter by reaction type if the query param is present
     reactions = Reaction.objects.filter(**filter).select_related("user", "user__avatar")
-    return reactions
+    return focus_obj, reactions
 
 
-async def get_comment_object(slug):
-    comment = (
-        await Comment.objects.select_related("author", "author__avatar", "post")
-        .annotate(replies_count=Count("replies"), reactions_count=Count("reactions"))
-        .aget_or_none(slug=slug)
-    )
+async def get_comment_object(slug, coalesce=False):
+    if coalesce:
+        return await comment_lookups.do(slug, fetch_comment_object, slug)
+    return await fetch_comment_object(slug)
+
+
+async def fetch_comment_object(slug):
+    comment = await Comment.objects.select_related(
+        "author", "author__avatar", "post"
+    ).aget_or_none(slug=slug)
     if not comment:
         raise RequestError(
             err_code=ErrorCode.NON_EXISTENT,
@@ -76,11 +215,32 @@ async def get_comment_object(slug):
     return comment
 
 
+async def set_reply_previews(comments, count):
+    # Sets the first `count` replies (latest first, as the comment's replies are paged)
+    # of each comment as its reply_previews. One windowed query for all the comments.
+    replies = (
+        Reply.objects.filter(comment_id__in=[comment.id for comment in comments])
+        .select_related("author", "author__avatar")
+        .annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F("comment_id"),
+                order_by=[F("created_at").desc(), F("id").desc()],
+            )
+        )
+        .filter(row_number__lte=count)
+        .order_by("comment_id", "row_number")
+    )
+    previews = defaultdict(list)
+    async for reply in replies:
+        previews[reply.comment_id].append(reply)
+    for comment in comments:
+        comment.reply_previews = previews[comment.id]
+
+
 async def get_reply_object(slug):
-    reply = (
-        await Reply.objects.select_related("author", "author__avatar")
-        .annotate(reactions_count=Count("reactions"))
-        .aget_or_none(slug=slug)
+    reply = await Reply.objects.select_related("author", "author__avatar").aget_or_none(
+        slug=slug
     )
     if not reply:
         raise RequestError(
@@ -1,17 +1,35 @@
 from uuid import UUID
-from django.db.models import Count
-from ninja import Path
+from django.db.models import Max
+from django.utils import timezone
+from ninja import Path, Query
+from apps.accounts.models import User
 from apps.common.file_types import ALLOWED_IMAGE_TYPES
-from apps.common.paginators import CustomPagination
+from apps.common.paginators import CustomPagination, EstimatedCount
+from asgiref.sync import sync_to_async
 from apps.feed.utils import (
     get_comment_object,
+    get_post_cards,
     get_post_object,
     get_reaction_focus_object,
     get_reactions_queryset,
     get_reply_object,
+    post_card_version,
+    POST_CARD_VERSION_FIELDS,
+    react,
+    set_reply_previews,
 )
-from apps.profiles.models import Notification
-from apps.profiles.utils import send_notification_in_socket
+from apps.profiles.coalescing import notify_action, withdraw_action
+from apps.feed.search import search_queryset
+from apps.feed.trending import (
+    get_engaged_post_id,
+    get_trending_posts,
+    record_engagement,
+)
+from apps.feed.timeline import fan_out_post, paginate_timeline
+from apps.common.etags import conditional
+from apps.common.microcache import cache_anonymous
+from apps.common.purge import tombstone
+from apps.common.tasks import run_in_background
 from .models import Post, Comment, Reply, Reaction
 from apps.common.models import File
 from apps.common.error import ErrorCode
@@ -27,35 +45,138 @@ from .schemas import (
     CommentsResponseSchema,
     PostInputResponseSchema,
     PostInputSchema,
+    PostOrder,
     PostResponseSchema,
     PostsResponseSchema,
     ReactionInputSchema,
     ReactionResponseSchema,
     ReactionsResponseSchema,
     ReplyResponseSchema,
+    SearchResponseSchema,
+    SearchType,
+    TrendingResponseSchema,
+    TrendingWindow,
 )
 
 feed_router = Router(tags=["Feed"])
 
-paginator = CustomPagination()
+paginator = CustomPagination(count_strategy=EstimatedCount())
+
+# Most replies that can be inlined per comment when retrieving comments
+MAX_REPLY_PREVIEWS = 10
+
+
+def get_posts_queryset(order):
+    posts = Post.objects.select_related("author", "author__avatar", "image")
+    # Top ranks posts by engagement with recency decay (see apps/feed/ranking.py)
+    return posts.order_by("-score" if order == PostOrder.TOP else "-created_at")
+
+
+async def posts_version(request, page=1, cursor=None, order=PostOrder.LATEST):
+    # Any change to a card or to the lists' order moves the latest Post.changed_at,
+    # and any author profile change the latest User.updated_at. Two index lookups,
+    # every page and order shares them (the ETag also covers the URL).
+    posts = await Post._base_manager.aaggregate(changed_at=Max("changed_at"))
+    authors = await User._base_manager.aaggregate(updated_at=Max("updated_at"))
+    return [posts["changed_at"], authors["updated_at"]]
+
+
+async def post_version(request, slug):
+    post = (
+        await Post.objects.select_related("author")
+        .only(*POST_CARD_VERSION_FIELDS)
+        .aget_or_none(slug=slug)
+    )
+    return post_card_version(post) if post else None
 
 
 @feed_router.get(
     "/posts/",
     summary="Retrieve Latest Posts",
-    description="This endpoint retrieves paginated responses of latest posts",
+    description="""
+        This endpoint retrieves paginated responses of latest posts (or top posts with order=top)
+        Send the ETag of a previous response as If-None-Match to get a 304 if nothing changed
+        Pass the next_cursor or prev_cursor of a response as the cursor param to page by cursor (page is ignored then)
+    """,
     response=PostsResponseSchema,
 )
-async def retrieve_posts(request, page: int = 1):
-    posts = (
-        Post.objects.select_related("author", "author__avatar", "image")
-        .annotate(reactions_count=Count("reactions"), comments_count=Count("comments"))
-        .order_by("-created_at")
-    )
-    paginated_data = await paginator.paginate_queryset(posts, page)
+@cache_anonymous
+@conditional(posts_version)
+async def retrieve_posts(
+    request, page: int = 1, cursor: str = None, order: PostOrder = PostOrder.LATEST
+):
+    posts = get_posts_queryset(order)
+    paginated_data = await paginator.paginate_queryset(posts, page, cursor)
+    paginated_data["items"] = await get_post_cards(paginated_data["items"])
     return CustomResponse.success(message="Posts fetched", data=paginated_data)
 
 
+@feed_router.get(
+    "/timeline/",
+    summary="Retrieve Timeline",
+    description="""
+        This endpoint retrieves the latest posts of the user and their friends
+        Pass the next_cursor or prev_cursor of a response as the cursor param to get the other pages
+    """,
+    response=PostsResponseSchema,
+    auth=AuthUser(),
+)
+async def retrieve_timeline(request, cursor: str = None):
+    user = await request.auth
+    paginated_data = await paginate_timeline(paginator, user.id, cursor)
+    paginated_data["items"] = await get_post_cards(paginated_data["items"])
+    return CustomResponse.success(message="Timeline fetched", data=paginated_data)
+
+
+@feed_router.get(
+    "/trending/",
+    summary="Retrieve Trending Posts",
+    description="""
+        This endpoint retrieves the posts whose engagement grew the most within the last hour (or day with window=24h)
+        The list is refreshed periodically, not on every request
+    """,
+    response=TrendingResponseSchema,
+)
+async def retrieve_trending_posts(
+    request, window: TrendingWindow = TrendingWindow.HOUR
+):
+    posts = await get_trending_posts(window.value)
+    data = {"window": window.value, "posts": await get_post_cards(posts)}
+    return CustomResponse.success(message="Trending posts fetched", data=data)
+
+
+@feed_router.get(
+    "/search/",
+    summary="Search Posts, Comments or Replies",
+    description="""
+        This endpoint retrieves the posts (or comments or replies with type) matching q, best matches first
+        q supports web search syntax e.g: "nice platform" -new
+        snippet is the matching text as safe HTML (escaped), with the matches wrapped in <mark></mark>
+        Pass the next_cursor or prev_cursor of a response as the cursor param to get the other pages
+    """,
+    response=SearchResponseSchema,
+)
+async def search_feed(
+    request, q: str, type: SearchType = SearchType.POSTS, cursor: str = None
+):
+    if not q.strip():
+        raise RequestError(
+            err_code=ErrorCode.INVALID_VALUE,
+            err_msg="Enter a search query",
+            status_code=400,
+        )
+    model = {
+        SearchType.POSTS: Post,
+        SearchType.COMMENTS: Comment,
+        SearchType.REPLIES: Reply,
+    }[type]
+    results = search_queryset(
+        model.objects.select_related("author", "author__avatar"), q
+    )
+    paginated_data = await paginator.paginate_queryset_by_cursor(results, cursor)
+    return CustomResponse.success(message="Search results fetched", data=paginated_data)
+
+
 @feed_router.post(
     "/posts/",
     summary="Create Post",
@@ -77,6 +198,8 @@ async def create_post(request, data: PostInputSchema):
 
     data["author"] = await request.auth
     post = await Post.objects.acreate(**data)
+    # Write the post into friends' timelines without holding up the response
+    await sync_to_async(run_in_background)(fan_out_post, post)
     post.image_upload_status = image_upload_status
     return CustomResponse.success(message="Post created", data=post, status_code=201)
 
@@ -84,12 +207,18 @@ async def create_post(request, data: PostInputSchema):
 @feed_router.get(
     "/posts/{slug}/",
     summary="Retrieve Single Post",
-    description="This endpoint retrieves a single post",
+    description="""
+        This endpoint retrieves a single post
+        Send the ETag of a previous response as If-None-Match to get a 304 if nothing changed
+    """,
     response={200: PostResponseSchema, 404: ErrorResponseSchema},
 )
+@cache_anonymous
+@conditional(post_version)
 async def retrieve_post(request, slug: str):
-    post = await get_post_object(slug, "detailed")
-    return CustomResponse.success(message="Post Detail fetched", data=post)
+    post = await get_post_object(slug, "detailed", coalesce=True)
+    [card] = await get_post_cards([post])
+    return CustomResponse.success(message="Post Detail fetched", data=card)
 
 
 @feed_router.put(
@@ -122,7 +251,8 @@ async def update_post(request, slug: str, data: PostInputSchema):
 
     post = set_dict_attr(post, data)
     post.image_upload_status = image_upload_status
-    await post.asave()
+    # Only save edited fields so concurrent counter updates aren't overwritten
+    await post.asave(update_fields=[*data, "updated_at"])
     return CustomResponse.success(message="Post updated", data=post)
 
 
@@ -140,7 +270,8 @@ async def delete_post(request, slug: str):
             err_code=ErrorCode.INVALID_OWNER,
             err_msg="This Post isn't yours",
         )
-    await post.adelete()
+    # Hidden right away, its comments, replies and reactions are purged in the background
+    await sync_to_async(tombstone)(post, changed_at=timezone.now())
     return CustomResponse.success(message="Post deleted")
 
 
@@ -159,6 +290,7 @@ slug_query = Path(..., description="Enter the slug of the post or comment or rep
     """,
     response=ReactionsResponseSchema,
 )
+@cache_anonymous
 async def retrieve_reactions(
     request,
     focus: str = focus_query,
@@ -166,8 +298,10 @@ async def retrieve_reactions(
     reaction_type: str = None,
     page: int = 1,
 ):
-    reactions = await get_reactions_queryset(focus, slug, reaction_type)
+    focus_obj, reactions = await get_reactions_queryset(focus, slug, reaction_type)
     paginated_data = await paginator.paginate_queryset(reactions, page)
+    # Facet counts of every reaction type, regardless of the reaction_type filter
+    paginated_data["reactions_breakdown"] = focus_obj.reactions_breakdown
     return CustomResponse.success(message="Reactions fetched", data=paginated_data)
 
 
@@ -193,45 +327,13 @@ async def create_reaction(
 ):
     user = await request.auth
     obj = await get_reaction_focus_object(focus, slug)
-
-    data = data.dict()
-    data["user"] = user
-    rtype = data.pop("rtype").value
-    obj_field = focus.lower()  # Focus object field (e.g post, comment, reply)
-    data[obj_field] = obj
-
-    reaction = await Reaction.objects.select_related(
-        "user", "user__avatar"
-    ).aget_or_none(**data)
-    if reaction:
-        reaction.rtype = rtype
-        await reaction.asave()
-    else:
-        data["rtype"] = rtype
-        reaction = await Reaction.objects.acreate(**data)
-
-    # Create and Send Notification
-    if obj.author_id != user.id:
-        ndata = {obj_field: obj}
-        notification, created = await Notification.objects.select_related(
-            "sender",
-            "sender__avatar",
-            "post",
-            "comment",
-            "comment__post",
-            "reply",
-            "reply__comment",
-            "reply__comment__post",
-        ).aget_or_create(sender=user, ntype="REACTION", **ndata)
-        if created:
-            await notification.receivers.aadd(obj.author)
-
-            # Send to websocket
-            await send_notification_in_socket(
-                request.is_secure(),
-                request.get_host(),
-                notification,
-            )
+    rtype = data.rtype.value
+    reaction, created, _ = await sync_to_async(react)(user, obj, rtype)
+    if created:
+        # Count towards trending posts (changing a reaction's type doesn't)
+        await sync_to_async(run_in_background)(
+            record_engagement, get_engaged_post_id(obj)
+        )
 
     return CustomResponse.success(
         message="Reaction created", data=reaction, status_code=201
@@ -265,24 +367,8 @@ async def remove_reaction(request, id: UUID):
             status_code=401,
         )
 
-    # Remove Reaction Notification
-    targeted_obj = reaction.targeted_obj
-    targeted_field = f"{targeted_obj.__class__.__name__.lower()}_id"  # (post_id, comment_id or reply_id)
-    data = {
-        "sender": user,
-        "ntype": "REACTION",
-        targeted_field: targeted_obj.id,
-    }
-
-    notification = await Notification.objects.aget_or_none(**data)
-    if notification:
-        # Send to websocket and delete notification
-        await send_notification_in_socket(
-            request.is_secure(), request.get_host(), notification, status="DELETED"
-        )
-        await notification.adelete()
-
-    await reaction.adelete()
+    # Delete it and take it off its notification, which is sent to socket
+    await withdraw_action("REACTION", reaction)
     return CustomResponse.success(message="Reaction deleted")
 
 
@@ -294,17 +380,26 @@ async def remove_reaction(request, id: UUID):
     summary="Retrieve Post Comments",
     description="""
         This endpoint retrieves comments of a particular post.
+        Pass the next_cursor or prev_cursor of a response as the cursor param to page by cursor (page is ignored then)
+        Pass replies to include that number of each comment's latest replies (null otherwise)
     """,
     response=CommentsResponseSchema,
 )
-async def retrieve_comments(request, slug: str, page: int = 1):
-    post = await get_post_object(slug)
-    comments = (
-        Comment.objects.filter(post_id=post.id)
-        .select_related("author", "author__avatar")
-        .annotate(replies_count=Count("replies"), reactions_count=Count("reactions"))
+@cache_anonymous
+async def retrieve_comments(
+    request,
+    slug: str,
+    page: int = 1,
+    cursor: str = None,
+    replies: int = Query(0, ge=0, le=MAX_REPLY_PREVIEWS),
+):
+    post = await get_post_object(slug, coalesce=True)
+    comments = Comment.objects.filter(post_id=post.id).select_related(
+        "author", "author__avatar"
     )
-    paginated_data = await paginator.paginate_queryset(comments, page)
+    paginated_data = await paginator.paginate_queryset(comments, page, cursor)
+    if replies:
+        await set_reply_previews(paginated_data["items"], replies)
     return CustomResponse.success(message="Comments Fetched", data=paginated_data)
 
 
@@ -320,21 +415,11 @@ async def retrieve_comments(request, slug: str, page: int = 1):
 async def create_comment(request, slug: str, data: CommentInputSchema):
     user = await request.auth
     post = await get_post_object(slug)
-    comment = await Comment.objects.acreate(post=post, author=user, text=data.text)
-
-    # Create and Send Notification
-    if user.id != post.author_id:
-        notification = await Notification.objects.acreate(
-            sender=user, ntype="COMMENT", comment=comment
-        )
-        await notification.receivers.aadd(post.author_id)
 
-        # Send to websocket
-        await send_notification_in_socket(
-            request.is_secure(),
-            request.get_host(),
-            notification,
-        )
+    # Create and notify (coalesced with the post's other recent comments) to socket
+    comment = Comment(post=post, author=user, text=data.text)
+    await notify_action(user, "COMMENT", comment)
+    await sync_to_async(run_in_background)(record_engagement, post.id)
 
     return CustomResponse.success(
         message="Comment Created", data=comment, status_code=201
@@ -350,11 +435,9 @@ async def create_comment(request, slug: str, data: CommentInputSchema):
     response=CommentWithRepliesResponseSchema,
 )
 async def retrieve_comment_with_replies(request, slug: str, page: int = 1):
-    comment = await get_comment_object(slug)
-    replies = (
-        Reply.objects.filter(comment_id=comment.id)
-        .annotate(reactions_count=Count("reactions"))
-        .select_related("author", "author__avatar")
+    comment = await get_comment_object(slug, coalesce=True)
+    replies = Reply.objects.filter(comment_id=comment.id).select_related(
+        "author", "author__avatar"
     )
     paginated_data = await paginator.paginate_queryset(replies, page)
     data = {"comment": comment, "replies": paginated_data}
@@ -373,21 +456,11 @@ async def retrieve_comment_with_replies(request, slug: str, page: int = 1):
 async def create_reply(request, slug: str, data: CommentInputSchema):
     user = await request.auth
     comment = await get_comment_object(slug)
-    reply = await Reply.objects.acreate(author=user, comment=comment, text=data.text)
-
-    # Create and Send Notification
-    if user.id != comment.author_id:
-        notification = await Notification.objects.acreate(
-            sender=user, ntype="REPLY", reply=reply
-        )
-        await notification.receivers.aadd(comment.author)
 
-        # Send to websocket
-        await send_notification_in_socket(
-            request.is_secure(),
-            request.get_host(),
-            notification,
-        )
+    # Create and notify (coalesced with the comment's recent replies) to socket
+    reply = Reply(author=user, comment=comment, text=data.text)
+    await notify_action(user, "REPLY", reply)
+    await sync_to_async(run_in_background)(record_engagement, comment.post_id)
     return CustomResponse.success(message="Reply Created", data=reply, status_code=201)
 
 
@@ -410,7 +483,7 @@ async def update_comment(request, slug: str, data: CommentInputSchema):
             status_code=401,
         )
     comment.text = data.text
-    await comment.asave()
+    await comment.asave(update_fields=["text", "updated_at"])
     return CustomResponse.success(message="Comment Updated", data=comment)
 
 
@@ -433,18 +506,8 @@ async def delete_comment(request, slug: str):
             status_code=401,
         )
 
-    # # Remove Comment Notification
-    notification = await Notification.objects.aget_or_none(
-        sender=user, ntype="COMMENT", comment_id=comment.id
-    )
-    if notification:
-        # Send to websocket and delete notification
-        await send_notification_in_socket(
-            request.is_secure(), request.get_host(), notification, status="DELETED"
-        )
-        await notification.adelete()
-
-    await comment.adelete()
+    # Delete it and take it off its notification, which is sent to socket
+    await withdraw_action("COMMENT", comment)
     return CustomResponse.success(message="Comment Deleted")
 
 
@@ -479,7 +542,7 @@ async def update_reply(request, slug: str, data: CommentInputSchema):
             status_code=401,
         )
     reply.text = data.text
-    await reply.asave()
+    await reply.asave(update_fields=["text", "updated_at"])
     return CustomResponse.success(message="Reply Updated", data=reply)
 
 
@@ -502,16 +565,6 @@ async def delete_reply(request, slug: str):
             status_code=401,
         )
 
-    # Remove Reply Notification
-    notification = await Notification.objects.aget_or_none(
-        sender=user, ntype="REPLY", reply_id=reply.id
-    )
-    if notification:
-        # Send to websocket and delete notification
-        await send_notification_in_socket(
-            request.is_secure(), request.get_host(), notification, status="DELETED"
-        )
-        await notification.adelete()
-
-    await reply.adelete()
+    # Delete it and take it off its notification, which is sent to socket
+    await withdraw_action("REPLY", reply)
     return CustomResponse.success(message="Reply Deleted")
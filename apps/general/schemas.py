@@ -1,3 +1,4 @@
+from typing import Dict
 from apps.common.schemas import Schema, ResponseSchema
 
 
@@ -15,3 +16,12 @@ class SiteDetailDataSchema(Schema):
 
 class SiteDetailResponseSchema(ResponseSchema):
     data: SiteDetailDataSchema
+
+
+# Metrics
+class MetricsDataSchema(Schema):
+    single_flight: Dict[str, Dict[str, int]]
+
+
+class MetricsResponseSchema(ResponseSchema):
+    data: MetricsDataSchema
@@ -1,12 +1,19 @@
 from django.test import TestCase
 from django.test.client import AsyncClient
+from apps.common.singleflight import SingleFlight
+from apps.common.utils import TestUtil
+import asyncio
 
 
 class TestGeneral(TestCase):
     sitedetail_url = "/api/v2/general/site-detail/"
+    metrics_url = "/api/v2/general/metrics/"
 
     def setUp(self) -> None:
         self.client = AsyncClient()
+        user = TestUtil.verified_user()
+        self.user = user
+        self.bearer = {"Authorization": f"Bearer {TestUtil.auth_token(user)}"}
 
     async def test_retrieve_sitedetail(self):
         response = await self.client.get(self.sitedetail_url)
@@ -16,3 +23,30 @@ class TestGeneral(TestCase):
         self.assertEqual(result["message"], "Site Details fetched")
         keys = ["name", "email", "phone", "address", "fb", "tw", "wh", "ig"]
         self.assertTrue(all(item in result["data"] for item in keys))
+
+    async def test_retrieve_metrics(self):
+        # Test for non staff user
+        response = await self.client.get(self.metrics_url, **self.bearer)
+        self.assertEqual(response.status_code, 403)
+
+        # Concurrent identical lookups share one call
+        calls = []
+
+        async def lookup(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return {"key": key}
+
+        flight = SingleFlight("test_lookups")
+        results = await asyncio.gather(*(flight.do("a", lookup, "a") for _ in range(3)))
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(results, [{"key": "a"}] * 3)
+
+        self.user.is_staff = True
+        await self.user.asave()
+        response = await self.client.get(self.metrics_url, **self.bearer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["data"]["single_flight"]["test_lookups"],
+            {"calls": 3, "coalesced": 2, "coalesced_shared": 0},
+        )
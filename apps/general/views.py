@@ -1,6 +1,11 @@
 from ninja import Router
+from apps.common.error import ErrorCode
+from apps.common.exceptions import RequestError
+from apps.common.singleflight import SingleFlight
+from apps.common.utils import AuthUser
 
 from .schemas import (
+    MetricsResponseSchema,
     SiteDetailResponseSchema,
 )
 from .models import SiteDetail
@@ -17,3 +22,25 @@ general_router = Router(tags=["General"])
 async def retrieve_site_details(request):
     sitedetail, created = await SiteDetail.objects.aget_or_create()
     return {"message": "Site Details fetched", "data": sitedetail}
+
+
+@general_router.get(
+    "/metrics/",
+    response=MetricsResponseSchema,
+    summary="Retrieve worker metrics",
+    description="""
+        This endpoint retrieves metrics of the worker process serving the request (staff only)
+        single_flight: lookups made and how many of them were coalesced into another's query
+    """,
+    auth=AuthUser(),
+)
+async def retrieve_metrics(request):
+    user = await request.auth
+    if not user.is_staff:
+        raise RequestError(
+            err_code=ErrorCode.NOT_ALLOWED,
+            err_msg="Staff only",
+            status_code=403,
+        )
+    data = {"single_flight": SingleFlight.get_metrics()}
+    return {"message": "Metrics fetched", "data": data}
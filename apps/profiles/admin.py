@@ -1,9 +1,10 @@
-import asyncio
 from django.contrib import admin
+from django.db import transaction
 from django.http.request import HttpRequest
 
+from apps.common.realtime import enqueue_many
 from apps.profiles.models import Friend, Notification
-from apps.profiles.utils import send_notification_in_socket
+from apps.profiles.utils import get_notification_events, get_notification_target
 
 
 class FriendAdmin(admin.ModelAdmin):
@@ -15,33 +16,27 @@ class NotificationAdmin(admin.ModelAdmin):
     list_display = ("id", "sender", "ntype", "created_at", "updated_at")
     list_filter = (
         "sender",
-        "receivers",
         "ntype",
-        "read_by",
         "created_at",
         "updated_at",
     )
 
-    readonly_fields = ("receivers", "read_by", "ntype", "comment", "reply", "sender")
+    readonly_fields = ("ntype", "comment", "reply", "sender")
 
     def save_model(self, request, obj, form, change):
         obj.from_admin_site = True
         obj.ntype = "ADMIN"
-        obj.host = request.get_host()
-        obj.secured = request.is_secure()
+        for field, value in get_notification_target(obj.post).items():
+            setattr(obj, field, value)
         super().save_model(request, obj, form, change)
 
     def delete_model(self, request: HttpRequest, obj: Notification) -> None:
-        # Send socket notification
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-
-        loop.run_until_complete(
-            send_notification_in_socket(
-                request.is_secure(), request.get_host(), obj, status="DELETED"
-            )
-        )
-        super().delete_model(request, obj)
+        # Send socket notification, with the deletion (the admin's transaction). It's
+        # taken off the unread counters as it's deleted (see uncount_notification).
+        receiver_ids = list(obj.receivers.values_list("id", flat=True))
+        with transaction.atomic():
+            enqueue_many(get_notification_events(obj, receiver_ids, status="DELETED"))
+            obj.delete()
 
 
 admin.site.register(Friend, FriendAdmin)
@@ -0,0 +1,271 @@
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from apps.common.realtime import enqueue_many
+from apps.feed.models import Comment, Reaction, Reply
+from apps.profiles.inbox import touch_inboxes
+from apps.profiles.models import Notification
+from apps.profiles.utils import (
+    get_badge_event,
+    get_notification_events,
+    get_notification_target,
+)
+import uuid
+
+# Reactions, comments and replies aren't notified one by one. The actions on the same
+# object (a post's comments, a comment's replies, an object's reactions) within a time
+# window (NOTIFICATION_COALESCE_WINDOW seconds, windows start at multiples of it) make
+# one notification for the object's author, "X and 12 others reacted to your post".
+# It keeps the latest actor as sender (and the latest comment or reply), the number of
+# actors and the most recent of them, and is upserted in one statement per action.
+
+RECENT_ACTORS = 3  # Most recent actors kept on a notification
+
+# Creates the group's notification of the window or adds the action to it, and puts it
+# back on top of the receiver's inbox as unread (counted if it wasn't unread already,
+# the inbox version is bumped either way). Returns its id, and the receiver's unread
+# count if it changed.
+NOTIFY_SQL = """
+    WITH notification AS (
+        INSERT INTO profiles_notification AS n (
+            id, created_at, updated_at, sender_id, ntype, {field}_id,
+            post_slug, comment_slug, reply_slug, target_text, audience,
+            group_key, window_start, actor_count, recent_actors
+        )
+        VALUES (
+            %(id)s, %(at)s, %(at)s, %(sender_id)s, %(ntype)s, %(obj_id)s,
+            %(post_slug)s, %(comment_slug)s, %(reply_slug)s, %(target_text)s, 'ALL',
+            %(group_key)s, %(window_start)s, 1, ARRAY[%(sender_id)s]::uuid[]
+        )
+        ON CONFLICT (group_key, window_start) DO UPDATE SET
+            updated_at = EXCLUDED.updated_at,
+            sender_id = EXCLUDED.sender_id,
+            {field}_id = EXCLUDED.{field}_id,
+            post_slug = EXCLUDED.post_slug,
+            comment_slug = EXCLUDED.comment_slug,
+            reply_slug = EXCLUDED.reply_slug,
+            target_text = EXCLUDED.target_text,
+            actor_count = n.actor_count + CASE
+                WHEN %(repeated)s OR %(sender_id)s = ANY(n.recent_actors) THEN 0
+                ELSE 1
+            END,
+            recent_actors = (
+                EXCLUDED.recent_actors || array_remove(n.recent_actors, %(sender_id)s)
+            )[1:{recent}]
+        RETURNING id
+    ),
+    previous AS (
+        SELECT NOT e.is_read AND (
+            u.notifications_read_at IS NULL OR e.created_at > u.notifications_read_at
+        ) AS unread
+        FROM profiles_inboxentry e JOIN accounts_user u ON u.id = e.user_id
+        WHERE e.notification_id IN (SELECT id FROM notification)
+            AND e.user_id = %(receiver_id)s
+    ),
+    entry AS (
+        INSERT INTO profiles_inboxentry (notification_id, user_id, created_at, is_read)
+        SELECT id, %(receiver_id)s, %(at)s, false FROM notification
+        ON CONFLICT (notification_id, user_id) DO UPDATE SET
+            created_at = EXCLUDED.created_at, is_read = false
+    ),
+    counter AS (
+        UPDATE accounts_user SET
+            unread_notifications = unread_notifications + CASE
+                WHEN EXISTS (SELECT 1 FROM previous WHERE unread) THEN 0 ELSE 1
+            END,
+            inbox_version = inbox_version + 1
+        WHERE id = %(receiver_id)s
+        RETURNING unread_notifications,
+            NOT EXISTS (SELECT 1 FROM previous WHERE unread) AS counted
+    )
+    SELECT id, (SELECT unread_notifications FROM counter WHERE counted)
+    FROM notification
+"""
+
+
+def get_group(ntype, obj):
+    # The object whose author is notified of obj (the reacted object, comment or reply)
+    if ntype == "COMMENT":
+        return obj.post
+    if ntype == "REPLY":
+        return obj.comment
+    return obj
+
+
+def get_group_key(ntype, group):
+    return f"{ntype}:{group.id}"
+
+
+def get_actions(ntype, group):
+    # The group's actions that are notified, and their actor field
+    if ntype == "COMMENT":
+        return Comment.objects.filter(post=group), "author_id"
+    if ntype == "REPLY":
+        return Reply.objects.filter(comment=group), "author_id"
+    field = type(group).__name__.lower()
+    return Reaction.objects.filter(**{field: group}), "user_id"
+
+
+def get_window(at):
+    # Start and end of the window of an action made at the given time
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    start = datetime.fromtimestamp(at.timestamp() // window * window, tz=at.tzinfo)
+    return start, start + timedelta(seconds=window)
+
+
+def notify(sender, ntype, obj, at):
+    """Notifies the author of obj's group of sender's action made at the given time,
+    obj being the reacted object, the comment or the reply (with their post and comment
+    loaded). Its socket events (CREATED or UPDATED, and the receiver's badge if it
+    changed) are queued in the same transaction, and squashed by the outbox worker when
+    several are pending (see apps/common/realtime.py). Returns the notification's id
+    and the receiver's new unread count (None if it didn't change)."""
+    group = get_group(ntype, obj)
+    window_start, _ = get_window(at)
+    repeated = False
+    if ntype != "REACTION":
+        # One reaction per user and object, but as many comments and replies
+        actions, actor = get_actions(ntype, group)
+        repeated = actions.filter(
+            created_at__gte=window_start, created_at__lt=at, **{actor: sender.id}
+        ).exists()
+    params = {
+        "id": uuid.uuid4(),
+        "at": at,
+        "sender_id": sender.id,
+        "ntype": ntype,
+        "obj_id": obj.id,
+        "group_key": get_group_key(ntype, group),
+        "window_start": window_start,
+        "repeated": repeated,
+        "receiver_id": group.author_id,
+        **get_notification_target(obj),
+    }
+    sql = NOTIFY_SQL.format(field=type(obj).__name__.lower(), recent=RECENT_ACTORS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        notification_id, unread = cursor.fetchone()
+        notification = Notification.objects.select_related(
+            "sender", "sender__avatar"
+        ).get(id=notification_id)
+        # The first action of a window makes it, the next ones update it
+        status = "CREATED"
+        if notification.updated_at != notification.created_at:
+            status = "UPDATED"
+        events = get_notification_events(notification, [group.author_id], status)
+        if unread is not None:
+            badges = {"notifications": unread}
+            events.insert(0, get_badge_event(group.author_id, badges))
+        enqueue_many(events)
+    return notification_id, unread
+
+
+def get_recent_actors(actions, actor):
+    recent = []
+    for actor_id in actions.values_list(actor, flat=True)[: RECENT_ACTORS * 5]:
+        if actor_id not in recent:
+            recent.append(actor_id)
+    return recent[:RECENT_ACTORS]
+
+
+def delete_notification(notification, receiver_id):
+    # Deletes the notification (off the unread counter, see uncount_notification) and
+    # tells its receiver's sockets, in the caller's transaction
+    notification.receiver_id = receiver_id
+    enqueue_many(get_notification_events(notification, [receiver_id], "DELETED"))
+    notification.delete()
+    return notification
+
+
+def withdraw(ntype, action):
+    """Takes an action being deleted (a reaction, comment or reply) off its
+    notification, recounted from the other actions of its window (deleted if none), with
+    its socket events queued in the same transaction. Returns the notification (None if
+    there's none, with its receiver_id set) and its new status (UPDATED or DELETED)."""
+    obj = action.targeted_obj if ntype == "REACTION" else action
+    if not obj:  # An orphan reaction, its notification went with its object
+        return None, None
+    group = get_group(ntype, obj)
+    actions, actor = get_actions(ntype, group)
+    actor_id = getattr(action, actor)
+    if actor_id == group.author_id:  # Not notified of their own
+        return None, None
+    window_start, window_end = get_window(action.created_at)
+    with transaction.atomic():
+        notification = (
+            Notification.objects.select_for_update()
+            .filter(group_key=get_group_key(ntype, group), window_start=window_start)
+            .first()
+        )
+        if not notification:
+            # Made before notifications were coalesced, one per action
+            notification = Notification.objects.filter(
+                group_key=None,
+                sender_id=actor_id,
+                ntype=ntype,
+                **{type(obj).__name__.lower(): obj},
+            ).first()
+            if not notification:
+                return None, None
+            return delete_notification(notification, group.author_id), "DELETED"
+
+        actions = (
+            actions.filter(created_at__gte=window_start, created_at__lt=window_end)
+            .exclude(id=action.id)
+            .exclude(**{actor: group.author_id})
+            .order_by("-created_at")
+        )
+        count = actions.aggregate(count=Count(actor, distinct=True))["count"]
+        if not count:
+            return delete_notification(notification, group.author_id), "DELETED"
+
+        if ntype == "COMMENT":
+            latest = actions.select_related("post").first()
+        elif ntype == "REPLY":
+            latest = actions.select_related("comment__post").first()
+        else:
+            latest = obj
+        for field, value in get_notification_target(latest).items():
+            setattr(notification, field, value)
+        setattr(notification, type(obj).__name__.lower(), latest)
+        notification.actor_count = count
+        notification.recent_actors = get_recent_actors(actions, actor)
+        notification.sender_id = notification.recent_actors[0]
+        notification.save()
+        touch_inboxes([group.author_id])
+        events = get_notification_events(notification, [group.author_id], "UPDATED")
+        enqueue_many(events)
+    notification.receiver_id = group.author_id
+    return notification, "UPDATED"
+
+
+def save_action(sender, ntype, action):
+    # Saves the action sender just made (a new comment or reply) and notifies it in one
+    # transaction, see notify. Returns the notification's id (None if not notified).
+    with transaction.atomic():
+        action.save()
+        if sender.id == get_group(ntype, action).author_id:
+            return None
+        notification_id, _ = notify(sender, ntype, action, action.created_at)
+    return notification_id
+
+
+async def notify_action(sender, ntype, action):
+    """Saves the action and notifies it, see save_action"""
+    return await sync_to_async(save_action)(sender, ntype, action)
+
+
+def delete_action(ntype, action):
+    # Deletes the action (a reaction, comment or reply) and takes it off its
+    # notification in one transaction, see withdraw
+    with transaction.atomic():
+        withdrawn = withdraw(ntype, action)
+        action.delete()
+    return withdrawn
+
+
+async def withdraw_action(ntype, action):
+    """Deletes the action and takes it off its notification, see delete_action"""
+    return await sync_to_async(delete_action)(ntype, action)
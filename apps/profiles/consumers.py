@@ -1,7 +1,6 @@
-from django.conf import settings
-from apps.accounts.models import User
 from apps.common.consumers import BaseConsumer
 from apps.common.error import ErrorCode
+from apps.profiles.utils import get_notification_group
 import json
 
 
@@ -10,42 +9,39 @@ class NotificationConsumer(BaseConsumer):
         err = self.scope["error"]
         await self.accept()
         self.room_name = "notifications"
-        self.room_group_name = "notifications"
+        self.notification_groups = []
 
         if err.get("message"):  # Check for auth errors
             await self.send_error_message(err)
             return await self.close(code=4001)
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        # The user's own notifications, and ADMIN ones which are for everyone
+        user_group = get_notification_group(self.scope["user"].id)
+        self.notification_groups = [user_group, "notifications"]
+        for group in self.notification_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        for group in self.notification_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
 
     async def receive(self, text_data):
-        user = self.scope["user"]
-        if user != settings.SOCKET_SECRET:
-            await self.send_error_message(
-                {
-                    "type": ErrorCode.NOT_ALLOWED,
-                    "message": "You're not allowed to send data",
-                }
-            )
-            return await self.close(code=1001)
-
-        data = json.loads(text_data)
-
-        # Send notification data
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {"type": "notification_message", "notification_data": data},
+        # Notifications are published by the app (see get_notification_events)
+        await self.send_error_message(
+            {
+                "type": ErrorCode.NOT_ALLOWED,
+                "message": "You're not allowed to send data",
+            }
         )
+        return await self.close(code=1001)
 
     async def notification_message(self, event):
-        notification_data = event["notification_data"]
+        # Only published to the groups of the notification's receivers, or to everyone
+        # for a broadcast, which may be for verified users only
         user = self.scope["user"]
+        if event.get("audience") == "VERIFIED" and not user.is_email_verified:
+            return
+        await self.send(text_data=json.dumps(event["notification_data"]))
 
-        if isinstance(user, User) and (
-            notification_data["ntype"] == "ADMIN"
-            or await user.notifications.filter(id=notification_data["id"]).aexists()
-        ):
-            # Ensure that only receivers of the notification can read it.
-            await self.send(text_data=json.dumps(notification_data))
+    async def badge_message(self, event):
+        # Changed unread counters of the user (see get_badge_event)
+        await self.send(text_data=json.dumps(event["badges"]))
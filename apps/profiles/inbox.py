@@ -0,0 +1,176 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.db.models.signals import pre_delete
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.profiles.models import InboxEntry, Notification
+from apps.profiles.utils import enqueue_badges
+
+# Each user's notifications are rows of their inbox (InboxEntry), listed by
+# (user, created_at). Reading is tracked per entry, plus a per user watermark
+# (notifications_read_at) so marking everything as read updates one row.
+# Broadcasts (ADMIN notifications) are stored once. They get into the inboxes of the
+# users that read theirs, since the broadcasts_synced_at watermark of the user.
+# The unread ones are counted in user.unread_notifications, moved along with the inbox.
+# Every change of the inbox (or its archive) bumps user.inbox_version, the version of
+# the notifications listings.
+
+SYNC_BROADCASTS_SQL = """
+    WITH synced AS (
+        INSERT INTO profiles_inboxentry (notification_id, user_id, created_at, is_read)
+        SELECT id, %(user_id)s, created_at, false FROM profiles_notification
+        WHERE ntype = 'ADMIN' AND created_at > %(since)s
+            AND audience = ANY(%(audiences)s)
+        ON CONFLICT DO NOTHING
+        RETURNING created_at
+    )
+    UPDATE accounts_user u SET
+        broadcasts_synced_at = (SELECT max(created_at) FROM synced),
+        inbox_version = u.inbox_version + 1,
+        unread_notifications = u.unread_notifications + (
+            SELECT count(*) FROM synced
+            WHERE u.notifications_read_at IS NULL
+                OR created_at > u.notifications_read_at
+        )
+    WHERE id = %(user_id)s AND EXISTS (SELECT 1 FROM synced)
+    RETURNING broadcasts_synced_at, unread_notifications
+"""
+
+ADD_UNREAD_SQL = """
+    UPDATE accounts_user
+    SET unread_notifications = greatest(unread_notifications + %(delta)s, 0),
+        inbox_version = inbox_version + 1
+    WHERE id = ANY(%(user_ids)s)
+    RETURNING id, unread_notifications
+"""
+
+# Takes the notification off the counters of the users it's unread for
+REMOVE_UNREAD_SQL = """
+    UPDATE accounts_user u
+    SET unread_notifications = greatest(u.unread_notifications - 1, 0)
+    FROM profiles_inboxentry e
+    WHERE e.notification_id = %(notification_id)s AND e.user_id = u.id
+        AND NOT e.is_read
+        AND (u.notifications_read_at IS NULL OR e.created_at > u.notifications_read_at)
+    RETURNING u.id, u.unread_notifications
+"""
+
+
+def get_audiences(user):
+    return ["ALL", "VERIFIED"] if user.is_email_verified else ["ALL"]
+
+
+def sync_broadcasts(user):
+    # Adds the broadcasts to the user's audience made since the last sync (or since the
+    # user joined) to their inbox. One statement, which inserts nothing most times.
+    # Older ones would be archived right away (see retention.py)
+    retained = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    params = {
+        "user_id": user.id,
+        "since": max(user.broadcasts_synced_at or user.created_at, retained),
+        "audiences": get_audiences(user),
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(SYNC_BROADCASTS_SQL, params)
+        row = cursor.fetchone()
+    if row:
+        user.broadcasts_synced_at, user.unread_notifications = row
+
+
+def add_unread(user_ids, delta=1):
+    # Moves the unread notifications counter of the users (and their inbox version),
+    # returns their new counts
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_UNREAD_SQL, {"user_ids": list(user_ids), "delta": delta})
+        return dict(cursor.fetchall())
+
+
+def touch_inboxes(user_ids):
+    # Bumps the inbox version of the users, for changes that don't move their counter
+    User.objects.filter(id__in=user_ids).update(inbox_version=F("inbox_version") + 1)
+
+
+def enqueue_unread(counts):
+    # Queues the users' new unread notification counts for their sockets
+    enqueue_badges({user_id: {"notifications": c} for user_id, c in counts.items()})
+
+
+def is_unread(user, entry):
+    if entry.is_read:
+        return False
+    read_at = user.notifications_read_at
+    return not read_at or entry.created_at > read_at
+
+
+def uncount_notification(sender, instance, **kwargs):
+    # Takes a notification being deleted (on its own, with its post, comment, reply or
+    # sender, or by a purge) off the counters of the users who hadn't read it, and their
+    # badges, and bumps the inbox version of all its receivers, in the deletion's
+    # transaction. Sent before its inbox entries go with it.
+    with connection.cursor() as cursor:
+        cursor.execute(REMOVE_UNREAD_SQL, {"notification_id": instance.id})
+        counts = dict(cursor.fetchall())
+    touch_inboxes(
+        InboxEntry.objects.filter(notification_id=instance.id).values("user_id")
+    )
+    if counts:
+        enqueue_unread(counts)
+
+
+def settle_entry(user, notification_id, dismiss=False):
+    # Reads the user's entry of the notification (or deletes it if dismissed), off the
+    # counter (and badge) if it was unread. Returns the changed counts, None if there's
+    # no entry.
+    with transaction.atomic():
+        entry = (
+            InboxEntry.objects.select_for_update()
+            .filter(user=user, notification_id=notification_id)
+            .first()
+        )
+        if not entry:
+            return None
+        unread = is_unread(user, entry)
+        if dismiss:
+            entry.delete()
+        elif not entry.is_read:
+            entry.is_read = True
+            entry.save(update_fields=["is_read"])
+        counts = add_unread([user.id], -1) if unread else {}
+        if dismiss and not unread:  # Not counted, but gone from the inbox
+            touch_inboxes([user.id])
+        enqueue_unread(counts)
+        return counts
+
+
+def get_inbox(user):
+    # The user's inbox entries, latest first, with their read state as is_read_now
+    read = Q(is_read=True)
+    if user.notifications_read_at:
+        read |= Q(created_at__lte=user.notifications_read_at)
+    return (
+        InboxEntry.objects.filter(user=user)
+        .select_related(
+            "notification", "notification__sender", "notification__sender__avatar"
+        )
+        .annotate(is_read_now=ExpressionWrapper(read, output_field=BooleanField()))
+        .order_by("-created_at")
+    )
+
+
+def mark_all_read(user):
+    now = timezone.now()
+    with transaction.atomic():
+        User.objects.filter(id=user.id).update(
+            notifications_read_at=now,
+            unread_notifications=0,
+            inbox_version=F("inbox_version") + 1,
+        )
+        enqueue_unread({user.id: 0})
+    user.notifications_read_at, user.unread_notifications = now, 0
+
+
+# Connected in ProfilesConfig.ready, inbox imports profiles models
+def connect_signals():
+    pre_delete.connect(uncount_notification, sender=Notification)
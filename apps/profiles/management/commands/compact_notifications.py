@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from apps.profiles.retention import compact_notifications
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Archives old inbox entries, deletes the notifications left in no inbox and drops expired archive months. Run it periodically (e.g daily)"
+
+    def handle(self, **options) -> None:
+        archived, deleted, dropped = compact_notifications()
+        logger.info(
+            f"Archived {archived} inbox entries, deleted {deleted} notification(s) "
+            f"and dropped {dropped} archive partition(s)"
+        )
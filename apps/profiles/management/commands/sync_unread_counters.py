@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, IntegerField
+from django.db.models.expressions import RawSQL
+from apps.accounts.models import User
+from apps.chat.models import ChatReadState
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# A user's inbox entries unread, on their own and past the read watermark
+UNREAD_NOTIFICATIONS_SQL = """
+    SELECT count(*) FROM profiles_inboxentry e
+    WHERE e.user_id = accounts_user.id AND NOT e.is_read
+        AND (accounts_user.notifications_read_at IS NULL
+            OR e.created_at > accounts_user.notifications_read_at)
+"""
+
+# The chat's messages from others since the member last read it
+UNREAD_MESSAGES_SQL = """
+    SELECT count(*) FROM chat_message m
+    WHERE m.chat_id = chat_chatreadstate.chat_id
+        AND m.sender_id <> chat_chatreadstate.user_id
+        AND (chat_chatreadstate.read_at IS NULL
+            OR m.created_at > chat_chatreadstate.read_at)
+"""
+
+# (model, counter field, SQL counting the source rows of the outer row)
+COUNTERS = [
+    (User, "unread_notifications", UNREAD_NOTIFICATIONS_SQL),
+    (ChatReadState, "unread", UNREAD_MESSAGES_SQL),
+]
+
+
+class Command(BaseCommand):
+    help = "Verifies (and rebuilds) the unread counters (badges) of notifications and chats"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report counters that don't match the source tables",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, **options) -> None:
+        check = options["check"]
+        batch_size = options["batch_size"]
+        mismatched_total = 0
+        for model, field, sql in COUNTERS:
+            actual = RawSQL(sql, [], output_field=IntegerField())
+            mismatched_ids = list(
+                model._base_manager.annotate(actual=actual)
+                .exclude(**{field: F("actual")})
+                .values_list("id", flat=True)
+            )
+            mismatched_total += len(mismatched_ids)
+            logger.info(
+                f"{model.__name__}.{field}: {len(mismatched_ids)} mismatched row(s)"
+            )
+            if check:
+                continue
+            for i in range(0, len(mismatched_ids), batch_size):
+                model._base_manager.filter(
+                    id__in=mismatched_ids[i : i + batch_size]
+                ).update(**{field: actual})
+
+        if check and mismatched_total:
+            raise SystemExit(1)
+        logger.info("Counters rebuilt" if not check else "Counters verified")
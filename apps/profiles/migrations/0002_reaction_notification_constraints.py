@@ -0,0 +1,57 @@
+# Generated by Django 4.2.3 on 2026-10-16 22:00
+
+from django.db import migrations, models
+
+# Keep only the first reaction notification of each sender and object
+DELETE_DUPLICATES_SQL = """
+CREATE TEMPORARY TABLE duplicate_notifications ON COMMIT DROP AS
+SELECT n.id FROM profiles_notification n
+WHERE n.ntype = 'REACTION' AND EXISTS (
+    SELECT 1 FROM profiles_notification d
+    WHERE d.ntype = 'REACTION' AND d.sender_id = n.sender_id
+        AND d.post_id IS NOT DISTINCT FROM n.post_id
+        AND d.comment_id IS NOT DISTINCT FROM n.comment_id
+        AND d.reply_id IS NOT DISTINCT FROM n.reply_id
+        AND (d.created_at, d.id) < (n.created_at, n.id)
+);
+DELETE FROM profiles_notification_receivers
+WHERE notification_id IN (SELECT id FROM duplicate_notifications);
+DELETE FROM profiles_notification_read_by
+WHERE notification_id IN (SELECT id FROM duplicate_notifications);
+DELETE FROM profiles_notification
+WHERE id IN (SELECT id FROM duplicate_notifications);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("profiles", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("ntype", "REACTION")),
+                fields=("sender", "post"),
+                name="unique_sender_post_reaction_notification",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("ntype", "REACTION")),
+                fields=("sender", "comment"),
+                name="unique_sender_comment_reaction_notification",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("ntype", "REACTION")),
+                fields=("sender", "reply"),
+                name="unique_sender_reply_reaction_notification",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+# Same excerpt as Truncator(text).chars(100)
+EXCERPT = "CASE WHEN length({text}) > 100 THEN left({text}, 99) || '…' ELSE {text} END"
+
+BACKFILL_SQL = f"""
+UPDATE profiles_notification n
+SET post_slug = p.slug, target_text = {EXCERPT.format(text="p.text")}
+FROM feed_post p WHERE n.post_id = p.id;
+
+UPDATE profiles_notification n
+SET post_slug = p.slug, comment_slug = c.slug,
+    target_text = {EXCERPT.format(text="c.text")}
+FROM feed_comment c JOIN feed_post p ON p.id = c.post_id
+WHERE n.comment_id = c.id;
+
+UPDATE profiles_notification n
+SET post_slug = p.slug, comment_slug = c.slug, reply_slug = r.slug,
+    target_text = {EXCERPT.format(text="r.text")}
+FROM feed_reply r
+    JOIN feed_comment c ON c.id = r.comment_id
+    JOIN feed_post p ON p.id = c.post_id
+WHERE n.reply_id = r.id;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("feed", "0009_post_deleted_at"),
+        ("profiles", "0002_reaction_notification_constraints"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="comment_slug",
+            field=models.CharField(
+                blank=True, editable=False, max_length=255, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="post_slug",
+            field=models.CharField(
+                blank=True, editable=False, max_length=255, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="reply_slug",
+            field=models.CharField(
+                blank=True, editable=False, max_length=255, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="target_text",
+            field=models.CharField(
+                blank=True, editable=False, max_length=100, null=True
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+# ADMIN notifications are broadcasts now, their receiver rows (one per user) go away
+DELETE_BROADCAST_RECEIVERS_SQL = """
+DELETE FROM profiles_notification_receivers r
+USING profiles_notification n
+WHERE r.notification_id = n.id AND n.ntype = 'ADMIN';
+"""
+
+# Django only uses the field's default to fill the existing rows, the column is left
+# without one. Raw INSERTs that leave audience out (e.g the reaction notifications
+# upsert) need it in the database.
+AUDIENCE_DEFAULT_SQL = (
+    "ALTER TABLE profiles_notification ALTER COLUMN audience SET DEFAULT 'ALL';"
+)
+AUDIENCE_NO_DEFAULT_SQL = (
+    "ALTER TABLE profiles_notification ALTER COLUMN audience DROP DEFAULT;"
+)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("profiles", "0003_notification_target_slugs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="audience",
+            field=models.CharField(
+                choices=[("ALL", "ALL"), ("VERIFIED", "VERIFIED")],
+                default="ALL",
+                max_length=20,
+            ),
+        ),
+        migrations.RunSQL(AUDIENCE_DEFAULT_SQL, AUDIENCE_NO_DEFAULT_SQL),
+        migrations.AddField(
+            model_name="notification",
+            name="dismissed_by",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="notifications_dismissed",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("ntype", "ADMIN")),
+                fields=["-created_at"],
+                name="broadcast_notification_idx",
+            ),
+        ),
+        migrations.RunSQL(DELETE_BROADCAST_RECEIVERS_SQL, migrations.RunSQL.noop),
+    ]
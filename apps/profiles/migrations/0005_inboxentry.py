@@ -0,0 +1,133 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# The receivers table becomes the inbox: it's renamed and gets the notification's
+# created_at (for listing by user and time) and the read state of read_by
+INBOX_SQL = """
+ALTER TABLE profiles_notification_receivers RENAME TO profiles_inboxentry;
+ALTER TABLE profiles_inboxentry
+    ADD COLUMN created_at timestamp with time zone,
+    ADD COLUMN is_read boolean NOT NULL DEFAULT false;
+UPDATE profiles_inboxentry e SET created_at = n.created_at
+FROM profiles_notification n WHERE n.id = e.notification_id;
+UPDATE profiles_inboxentry e SET is_read = true
+FROM profiles_notification_read_by r
+WHERE r.notification_id = e.notification_id AND r.user_id = e.user_id;
+ALTER TABLE profiles_inboxentry
+    ALTER COLUMN created_at SET NOT NULL,
+    ALTER COLUMN is_read DROP DEFAULT;
+CREATE INDEX inbox_user_created_idx ON profiles_inboxentry (user_id, created_at DESC);
+"""
+
+# Broadcasts someone read or dismissed get into inboxes now, so that state is kept.
+# Users who dismissed any have all theirs synced, so the dismissed ones stay out.
+BROADCAST_STATE_SQL = """
+INSERT INTO profiles_inboxentry (notification_id, user_id, created_at, is_read)
+SELECT n.id, r.user_id, n.created_at, true
+FROM profiles_notification_read_by r
+    JOIN profiles_notification n ON n.id = r.notification_id
+WHERE n.ntype = 'ADMIN'
+ON CONFLICT DO NOTHING;
+
+INSERT INTO profiles_inboxentry (notification_id, user_id, created_at, is_read)
+SELECT n.id, u.id, n.created_at, false
+FROM accounts_user u
+    JOIN profiles_notification n ON n.ntype = 'ADMIN' AND n.created_at > u.created_at
+        AND (n.audience = 'ALL' OR u.is_email_verified)
+WHERE u.id IN (SELECT user_id FROM profiles_notification_dismissed_by)
+    AND NOT EXISTS (
+        SELECT 1 FROM profiles_notification_dismissed_by d
+        WHERE d.user_id = u.id AND d.notification_id = n.id
+    )
+ON CONFLICT DO NOTHING;
+
+UPDATE accounts_user
+SET broadcasts_synced_at = (
+    SELECT max(created_at) FROM profiles_notification WHERE ntype = 'ADMIN'
+)
+WHERE id IN (SELECT user_id FROM profiles_notification_dismissed_by);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("accounts", "0004_user_inbox_watermarks"),
+        ("profiles", "0004_broadcast_notifications"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(INBOX_SQL, migrations.RunSQL.noop),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name="InboxEntry",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "created_at",
+                            models.DateTimeField(default=django.utils.timezone.now),
+                        ),
+                        ("is_read", models.BooleanField(default=False)),
+                        (
+                            "notification",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="inbox_entries",
+                                to="profiles.notification",
+                            ),
+                        ),
+                        (
+                            "user",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="inbox",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        "indexes": [
+                            models.Index(
+                                fields=["user", "-created_at"],
+                                name="inbox_user_created_idx",
+                            )
+                        ],
+                        "unique_together": {("notification", "user")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="notification",
+                    name="receivers",
+                    field=models.ManyToManyField(
+                        related_name="notifications",
+                        through="profiles.InboxEntry",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(BROADCAST_STATE_SQL, migrations.RunSQL.noop),
+        migrations.RemoveField(
+            model_name="notification",
+            name="dismissed_by",
+        ),
+        migrations.RemoveField(
+            model_name="notification",
+            name="read_by",
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.3 on 2026-10-16 23:55
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("profiles", "0005_inboxentry"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="notification",
+            name="unique_sender_post_reaction_notification",
+        ),
+        migrations.RemoveConstraint(
+            model_name="notification",
+            name="unique_sender_comment_reaction_notification",
+        ),
+        migrations.RemoveConstraint(
+            model_name="notification",
+            name="unique_sender_reply_reaction_notification",
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="actor_count",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="group_key",
+            field=models.CharField(
+                blank=True, editable=False, max_length=100, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="recent_actors",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.UUIDField(),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="window_start",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="notification",
+            constraint=models.UniqueConstraint(
+                fields=("group_key", "window_start"),
+                name="unique_notification_group_window",
+            ),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# Generated by Django 4.2.3 on 2026-10-17 00:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Partitioned by month of created_at, the retention job creates the partitions it
+# archives into and drops the ones past the horizon (see apps/profiles/retention.py)
+ARCHIVE_SQL = """
+CREATE TABLE profiles_archivedinboxentry (
+    id bigserial,
+    user_id uuid NOT NULL
+        REFERENCES accounts_user (id) DEFERRABLE INITIALLY DEFERRED,
+    notification_id uuid NOT NULL,
+    sender_id uuid NULL
+        REFERENCES accounts_user (id) DEFERRABLE INITIALLY DEFERRED,
+    ntype varchar(100) NOT NULL,
+    message varchar(255) NOT NULL,
+    post_slug varchar(255) NULL,
+    comment_slug varchar(255) NULL,
+    reply_slug varchar(255) NULL,
+    target_text varchar(100) NULL,
+    actor_count integer NOT NULL CHECK (actor_count >= 0),
+    is_read boolean NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX archive_user_created_idx
+    ON profiles_archivedinboxentry (user_id, created_at DESC);
+CREATE INDEX profiles_archivedinboxentry_sender_id
+    ON profiles_archivedinboxentry (sender_id);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("profiles", "0006_notification_coalescing"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="inboxentry",
+            index=models.Index(fields=["created_at"], name="inbox_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(fields=["created_at"], name="notification_created_idx"),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    ARCHIVE_SQL, "DROP TABLE profiles_archivedinboxentry CASCADE;"
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name="ArchivedInboxEntry",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        ("notification_id", models.UUIDField()),
+                        (
+                            "ntype",
+                            models.CharField(
+                                choices=[
+                                    ("REACTION", "REACTION"),
+                                    ("COMMENT", "COMMENT"),
+                                    ("REPLY", "REPLY"),
+                                    ("ADMIN", "ADMIN"),
+                                ],
+                                max_length=100,
+                            ),
+                        ),
+                        ("message", models.CharField(max_length=255)),
+                        (
+                            "post_slug",
+                            models.CharField(blank=True, max_length=255, null=True),
+                        ),
+                        (
+                            "comment_slug",
+                            models.CharField(blank=True, max_length=255, null=True),
+                        ),
+                        (
+                            "reply_slug",
+                            models.CharField(blank=True, max_length=255, null=True),
+                        ),
+                        (
+                            "target_text",
+                            models.CharField(blank=True, max_length=100, null=True),
+                        ),
+                        ("actor_count", models.PositiveIntegerField(default=1)),
+                        ("is_read", models.BooleanField(default=False)),
+                        ("created_at", models.DateTimeField()),
+                        (
+                            "sender",
+                            models.ForeignKey(
+                                blank=True,
+                                null=True,
+                                on_delete=django.db.models.deletion.SET_NULL,
+                                related_name="+",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                        (
+                            "user",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="archived_inbox",
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        "indexes": [
+                            models.Index(
+                                fields=["user", "-created_at"],
+                                name="archive_user_created_idx",
+                            )
+                        ],
+                    },
+                ),
+            ],
+        ),
+    ]
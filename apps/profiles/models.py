@@ -1,4 +1,5 @@
-import asyncio
+from functools import partial
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.db.models import (
     Q,
@@ -9,11 +10,22 @@ from django.db.models import (
 from django.db.models.functions import Least, Greatest
 from apps.accounts.models import User
 
+from apps.chat.models import Chat, ChatReadState, Message
 from apps.common.models import BaseModel
-from apps.feed.models import Comment, Post, Reply
+from apps.common.purge import register_purge_steps
+from apps.feed.models import (
+    Comment,
+    EngagementBucket,
+    Post,
+    Reaction,
+    Reply,
+    Timeline,
+)
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from apps.profiles.utils import get_notification_message, send_notification_in_socket
+from apps.common.realtime import enqueue_many
+from apps.profiles.utils import get_notification_events, get_notification_message
 from django.utils.safestring import mark_safe
 from django.db.models.signals import post_save
 
@@ -65,6 +77,12 @@ NOTIFICATION_TYPE_CHOICES = (
     ("ADMIN", "ADMIN"),
 )
 
+# Users an ADMIN notification is for
+NOTIFICATION_AUDIENCE_CHOICES = (
+    ("ALL", "ALL"),
+    ("VERIFIED", "VERIFIED"),
+)
+
 
 class Notification(BaseModel):
     """Notification model for notifications sent by system or other users."""
@@ -76,7 +94,9 @@ class Notification(BaseModel):
         on_delete=models.CASCADE,
         blank=True,
     )
-    receivers = models.ManyToManyField(User, related_name="notifications")
+    receivers = models.ManyToManyField(
+        User, related_name="notifications", through="InboxEntry"
+    )
     ntype = models.CharField(
         max_length=100,
         verbose_name=_("Type"),
@@ -92,10 +112,30 @@ class Notification(BaseModel):
         Reply, on_delete=models.CASCADE, null=True, blank=True
     )  # For replies and reactions
 
-    text = models.CharField(max_length=100, null=True)  # For admin notifications only
-    read_by = models.ManyToManyField(
-        User, related_name="notifications_read", blank=True
+    # Slugs of the notified object and of the objects it belongs to, and an excerpt of
+    # its text, set on creation (see get_notification_target) so lists don't join them
+    post_slug = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    comment_slug = models.CharField(
+        max_length=255, null=True, blank=True, editable=False
     )
+    reply_slug = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    target_text = models.CharField(
+        max_length=100, null=True, blank=True, editable=False
+    )
+
+    text = models.CharField(max_length=100, null=True)  # For admin notifications only
+    audience = models.CharField(
+        max_length=20, default="ALL", choices=NOTIFICATION_AUDIENCE_CHOICES
+    )  # For admin notifications only, they get to inboxes on read (see inbox.py)
+
+    # Reactions, comments and replies are coalesced per object and time window (see
+    # coalescing.py): the group and window of the notification, and its actors
+    group_key = models.CharField(max_length=100, null=True, blank=True, editable=False)
+    window_start = models.DateTimeField(null=True, blank=True, editable=False)
+    actor_count = models.PositiveIntegerField(default=1, editable=False)
+    recent_actors = ArrayField(
+        models.UUIDField(), default=list, blank=True, editable=False
+    )  # Latest first
 
     def __str__(self):
         return str(self.id)
@@ -107,18 +147,6 @@ class Notification(BaseModel):
             text = get_notification_message(self)
         return text
 
-    @property
-    def post_slug(self):
-        return self.post.slug if self.post else None
-
-    @property
-    def comment_slug(self):
-        return self.comment.slug if self.comment else None
-
-    @property
-    def reply_slug(self):
-        return self.reply.slug if self.reply else None
-    
     # Set constraints
     class Meta:
         _space = "&ensp;&ensp;&nbsp;&nbsp;&nbsp;&nbsp;"
@@ -156,26 +184,123 @@ class Notification(BaseModel):
                     """
                 ),
             ),
+            # One notification per group and window, so actions can be upserted to it
+            UniqueConstraint(
+                fields=["group_key", "window_start"],
+                name="unique_notification_group_window",
+            ),
+        ]
+
+        indexes = [
+            # Broadcasts are merged into every user's notifications at read time
+            models.Index(
+                fields=["-created_at"],
+                condition=Q(ntype="ADMIN"),
+                name="broadcast_notification_idx",
+            ),
+            # Old ones are deleted by the retention job (see retention.py)
+            models.Index(fields=["created_at"], name="notification_created_idx"),
+        ]
+
+
+class InboxEntry(models.Model):
+    """A notification in a user's inbox, i.e a receiver of the notification.
+    Listed by (user, created_at) without touching the notifications table."""
+
+    user = models.ForeignKey(User, related_name="inbox", on_delete=models.CASCADE)
+    notification = models.ForeignKey(
+        Notification, related_name="inbox_entries", on_delete=models.CASCADE
+    )
+    created_at = models.DateTimeField(default=timezone.now)  # The notification's
+    # Read on its own. Everything up to user.notifications_read_at is read too.
+    is_read = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} ------ {self.notification_id}"
+
+    class Meta:
+        unique_together = ("notification", "user")
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="inbox_user_created_idx"),
+            # Old ones are archived by the retention job (see retention.py)
+            models.Index(fields=["created_at"], name="inbox_created_idx"),
         ]
 
-        # Validations later to ensure the read_by users are part of the receivers
 
+class ArchivedInboxEntry(models.Model):
+    """An inbox entry older than NOTIFICATION_RETENTION_DAYS, moved out of the inbox
+    with a snapshot of its notification, which may be deleted then (see retention.py).
+    The table is partitioned by month of created_at, old months are dropped whole."""
+
+    user = models.ForeignKey(
+        User, related_name="archived_inbox", on_delete=models.CASCADE
+    )
+    notification_id = models.UUIDField()
+    sender = models.ForeignKey(
+        User, related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+    ntype = models.CharField(max_length=100, choices=NOTIFICATION_TYPE_CHOICES)
+    message = models.CharField(max_length=255)
+    post_slug = models.CharField(max_length=255, null=True, blank=True)
+    comment_slug = models.CharField(max_length=255, null=True, blank=True)
+    reply_slug = models.CharField(max_length=255, null=True, blank=True)
+    target_text = models.CharField(max_length=100, null=True, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField()  # The inbox entry's
 
-def set_receivers_m2m(sender, instance, created, *args, **kwargs):
-    if created and instance.ntype == "ADMIN":
-        instance.receivers.set(User.objects.all())
-        if hasattr(instance, "from_admin_site"):
-            # Send socket notification
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+    def __str__(self):
+        return f"{self.user_id} ------ {self.notification_id}"
 
-            loop.run_until_complete(
-                send_notification_in_socket(
-                    instance.secured,
-                    instance.host,
-                    instance,
-                )
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-created_at"], name="archive_user_created_idx"
             )
+        ]
+
+
+def publish_admin_notification(sender, instance, created, *args, **kwargs):
+    if created and hasattr(instance, "from_admin_site"):
+        # Send socket notification, with the save (the admin's transaction)
+        enqueue_many(get_notification_events(instance))
+
+
+post_save.connect(publish_admin_notification, sender=Notification)
+
 
+@register_purge_steps(User)
+def get_user_purge_steps(user):
+    # Everything of the user and on the user's posts, comments and replies.
+    # One step per relation so each batch is fetched through an index. Out of
+    # timelines first, where the user's posts are hidden but still take a page's place.
+    # The user's reactions, comments and replies on others' objects are taken off their
+    # notifications one by one, which stay for the other actors coalesced in them. The
+    # ones on the user's objects go with their notifications, which are the user's.
+    from apps.profiles.coalescing import delete_action  # It imports these models
 
-post_save.connect(set_receivers_m2m, sender=Notification)
+    return [
+        Timeline.objects.filter(post__author=user),
+        (Reaction.objects.filter(user=user), partial(delete_action, "REACTION")),
+        Reaction.objects.filter(reply__comment__post__author=user),
+        Reaction.objects.filter(reply__comment__author=user),
+        Reaction.objects.filter(reply__author=user),
+        Reaction.objects.filter(comment__post__author=user),
+        Reaction.objects.filter(comment__author=user),
+        Reaction.objects.filter(post__author=user),
+        Reply.objects.filter(comment__post__author=user),
+        Reply.objects.filter(comment__author=user),
+        (Reply.objects.filter(author=user), partial(delete_action, "REPLY")),
+        Comment.objects.filter(post__author=user),
+        (Comment.objects.filter(author=user), partial(delete_action, "COMMENT")),
+        Timeline.objects.filter(user=user),
+        EngagementBucket.objects.filter(post__author=user),
+        Post._base_manager.filter(author=user),  # Hidden from Post.objects already
+        InboxEntry.objects.filter(user=user),
+        ArchivedInboxEntry.objects.filter(user=user),
+        ChatReadState.objects.filter(chat__owner=user),
+        ChatReadState.objects.filter(user=user),
+        Message.objects.filter(chat__owner=user),
+        Message.objects.filter(sender=user),
+        Chat._base_manager.filter(owner=user),
+    ]
@@ -0,0 +1,148 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from apps.common.purge import PURGE_BATCH_SIZE
+from apps.profiles.inbox import add_unread, enqueue_unread, is_unread, touch_inboxes
+from apps.profiles.models import ArchivedInboxEntry, InboxEntry, Notification
+import re
+
+# Inbox entries older than NOTIFICATION_RETENTION_DAYS are moved to the archive with a
+# snapshot of their notification, so the inbox (read by every notifications list) only
+# holds recent ones, and notifications no inbox refers to anymore are deleted. The
+# archive is partitioned by month (in UTC), listing it by cursor only touches the months
+# paged back to, and months past NOTIFICATION_ARCHIVE_DAYS are dropped whole.
+
+ARCHIVE_TABLE = ArchivedInboxEntry._meta.db_table
+
+PARTITION_NAME = re.compile(rf"^{ARCHIVE_TABLE}_(\d{{4}})_(\d{{2}})$")
+
+LIST_PARTITIONS_SQL = """
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+"""
+
+TOUCH_PARTITION_USERS_SQL = """
+    UPDATE accounts_user SET inbox_version = inbox_version + 1
+    WHERE id IN (SELECT user_id FROM {name})
+"""
+
+
+def get_month(at):
+    return at.astimezone(dt_timezone.utc).replace(
+        day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def get_next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def get_partition_name(month):
+    return f"{ARCHIVE_TABLE}_{month:%Y_%m}"
+
+
+def create_partitions(months):
+    with connection.cursor() as cursor:
+        for month in months:
+            start, end = month.isoformat(), get_next_month(month).isoformat()
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {get_partition_name(month)} "
+                f"PARTITION OF {ARCHIVE_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"
+            )
+
+
+def archive(entry):
+    notification = entry.notification
+    return ArchivedInboxEntry(
+        user_id=entry.user_id,
+        notification_id=notification.id,
+        sender_id=notification.sender_id,
+        ntype=notification.ntype,
+        message=notification.message,
+        post_slug=notification.post_slug,
+        comment_slug=notification.comment_slug,
+        reply_slug=notification.reply_slug,
+        target_text=notification.target_text,
+        actor_count=notification.actor_count,
+        is_read=not is_unread(entry.user, entry),
+        created_at=entry.created_at,
+    )
+
+
+def archive_inbox(cutoff):
+    # Moves the inbox entries made before cutoff to the archive, a batch per
+    # transaction, off the unread counters (and badges), bumping the inbox versions.
+    # Returns the number of entries moved.
+    entries = InboxEntry.objects.filter(created_at__lt=cutoff).select_related(
+        "user", "notification", "notification__sender"
+    )
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(entries[:PURGE_BATCH_SIZE])
+            if not batch:
+                break
+            create_partitions({get_month(entry.created_at) for entry in batch})
+            ArchivedInboxEntry.objects.bulk_create([archive(e) for e in batch])
+            InboxEntry.objects.filter(id__in=[e.id for e in batch]).delete()
+
+            # Users by the number of their unread entries archived
+            unread = Counter(e.user_id for e in batch if is_unread(e.user, e))
+            users_by_count = defaultdict(list)
+            for user_id, count in unread.items():
+                users_by_count[count].append(user_id)
+            for count, user_ids in users_by_count.items():
+                enqueue_unread(add_unread(user_ids, -count))
+            touch_inboxes({e.user_id for e in batch} - unread.keys())
+        archived += len(batch)
+    return archived
+
+
+def delete_notifications(cutoff):
+    # Deletes the notifications last changed before cutoff that are in no inbox
+    notifications = Notification.objects.filter(
+        created_at__lt=cutoff, updated_at__lt=cutoff, inbox_entries=None
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(notifications.values_list("id", flat=True)[:PURGE_BATCH_SIZE])
+            if not ids:
+                break
+            count, _ = Notification.objects.filter(id__in=ids).delete()
+        deleted += count
+    return deleted
+
+
+def drop_archive_partitions(cutoff):
+    # Drops the archive's months that ended before cutoff, bumping the inbox version of
+    # the users who had entries in them
+    dropped = 0
+    with connection.cursor() as cursor:
+        cursor.execute(LIST_PARTITIONS_SQL, [ARCHIVE_TABLE])
+        for (name,) in cursor.fetchall():
+            match = PARTITION_NAME.match(name)
+            if not match:  # Not a month (e.g a default partition added by hand)
+                continue
+            month = datetime(*map(int, match.groups()), 1, tzinfo=dt_timezone.utc)
+            if get_next_month(month) <= cutoff:
+                cursor.execute(TOUCH_PARTITION_USERS_SQL.format(name=name))
+                cursor.execute(f"DROP TABLE {name}")
+                dropped += 1
+    return dropped
+
+
+def compact_notifications():
+    """Runs the notifications retention (see above). Returns the number of inbox entries
+    archived, of notifications deleted and of archive months dropped."""
+    now = timezone.now()
+    cutoff = now - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    archived = archive_inbox(cutoff)
+    deleted = delete_notifications(cutoff)
+    dropped = 0
+    if settings.NOTIFICATION_ARCHIVE_DAYS:
+        archive_cutoff = now - timedelta(days=settings.NOTIFICATION_ARCHIVE_DAYS)
+        dropped = drop_archive_partitions(archive_cutoff)
+    return archived, deleted, dropped
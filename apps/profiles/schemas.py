@@ -108,8 +108,15 @@ class NotificationSchema(Schema):
     post_slug: Optional[str]
     comment_slug: Optional[str]
     reply_slug: Optional[str]
+    target_text: Optional[str] = Field(None, example="This is a nice new platform")
+    actor_count: int = Field(1, example=13)
     is_read: bool = False
 
+    @staticmethod
+    def resolve_id(obj):
+        # Archived ones (see apps/profiles/retention.py) keep their notification's id
+        return getattr(obj, "notification_id", obj.id)
+
 
 class ReadNotificationSchema(Schema):
     mark_all_as_read: bool
@@ -128,3 +135,17 @@ class NotificationsResponseDataSchema(PaginatedResponseDataSchema):
 
 class NotificationsResponseSchema(ResponseSchema):
     data: NotificationsResponseDataSchema
+
+
+class ChatBadgeSchema(Schema):
+    chat_id: UUID
+    unread: int = Field(..., example=2)
+
+
+class BadgesSchema(Schema):
+    notifications: int = Field(..., example=3)
+    chats: List[ChatBadgeSchema]
+
+
+class BadgesResponseSchema(ResponseSchema):
+    data: BadgesSchema
@@ -1,16 +1,35 @@
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
 from django.test.client import AsyncClient
 from unittest import mock
 from apps.accounts.models import User
 from apps.common.utils import TestUtil
 from apps.common.error import ErrorCode
-from apps.profiles.models import Friend, Notification
+from apps.profiles.inbox import settle_entry, sync_broadcasts
+from apps.profiles.models import Friend, InboxEntry, Notification
+from apps.profiles.retention import (
+    ARCHIVE_TABLE,
+    compact_notifications,
+    create_partitions,
+    drop_archive_partitions,
+    get_month,
+    get_next_month,
+)
 from cities_light.models import City, Country, Region
 from django.utils.text import slugify
-import uuid
+from apps.common.models import Purge
+from apps.feed.models import Comment, Post, Reaction
+from apps.feed.utils import react
+import uuid, os
 
 
 class TestProfile(TestCase):
+    os.environ["ENVIRONMENT"] = "TESTING"
     cities_url = "/api/v2/profiles/cities/"
     profile_url = "/api/v2/profiles/profile/"
     friends_url = "/api/v2/profiles/friends/"
@@ -185,6 +204,17 @@ class TestProfile(TestCase):
             },
         )
 
+        user = self.verified_user
+        post = await Post.objects.acreate(author=user, text="Soon gone")
+
+        # The user's reaction is the latest of a notification coalescing another one
+        other_user = await sync_to_async(TestUtil.new_user)()
+        other_post = await Post.objects.acreate(
+            author=self.friend.requestee, text="Stays"
+        )
+        await sync_to_async(react)(other_user, other_post, "LIKE")
+        await sync_to_async(react)(user, other_post, "LIKE")
+
         # Test for valid response for valid entry
         user_data["password"] = "testpassword"
         response = await self.client.post(
@@ -202,6 +232,46 @@ class TestProfile(TestCase):
             },
         )
 
+        # The account is logged out and hidden right away, then purged
+        response = await self.client.get(self.friends_url, **self.bearer)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(await User.objects.filter(id=user.id).aexists())
+        purge = await Purge.objects.aget(target_id=user.id)
+        self.assertIsNotNone(purge.completed_at)
+        self.assertFalse(await User._base_manager.filter(id=user.id).aexists())
+        self.assertFalse(await Post._base_manager.filter(id=post.id).aexists())
+
+        # Taken off the notification, which stays in its receiver's inbox
+        notification = await Notification.objects.aget(post=other_post)
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.sender_id, other_user.id)
+        receiver = await User.objects.aget(id=other_post.author_id)
+        self.assertEqual(receiver.unread_notifications, 1)
+
+    async def test_delete_profile_with_orphan_reaction(self):
+        user = self.verified_user
+        other_user = self.friend.requestee
+        post = await Post.objects.acreate(author=other_user, text="Stays")
+        comment = await Comment.objects.acreate(
+            author=other_user, post=post, text="Soon gone"
+        )
+        reaction, _, _ = await sync_to_async(react)(user, comment, "LIKE")
+
+        # Left without a target, like reactions were before they cascaded
+        await Reaction.objects.filter(id=reaction.id).aupdate(comment=None)
+        await comment.adelete()
+
+        response = await self.client.post(
+            self.profile_url,
+            {"password": "testpassword"},
+            content_type=self.content_type,
+            **self.bearer,
+        )
+        self.assertEqual(response.status_code, 200)
+        purge = await Purge.objects.aget(target_id=user.id)
+        self.assertIsNotNone(purge.completed_at)
+        self.assertFalse(await Reaction.objects.filter(id=reaction.id).aexists())
+
     async def test_retrieve_friends(self):
         friend = self.friend.requestee
 
@@ -219,6 +289,9 @@ class TestProfile(TestCase):
                     "per_page": 20,
                     "current_page": 1,
                     "last_page": 1,
+                    "last_page_estimated": False,
+                    "next_cursor": None,
+                    "prev_cursor": None,
                     "users": [
                         {
                             "first_name": friend.first_name,
@@ -322,7 +395,6 @@ class TestProfile(TestCase):
         notification = await Notification.objects.acreate(
             ntype="ADMIN", text="A new update is coming!"
         )
-        await notification.receivers.aadd(self.verified_user)
 
         # Test for valid response
         response = await self.client.get(
@@ -338,6 +410,9 @@ class TestProfile(TestCase):
                     "per_page": 50,
                     "current_page": 1,
                     "last_page": 1,
+                    "last_page_estimated": False,
+                    "next_cursor": None,
+                    "prev_cursor": None,
                     "notifications": [
                         {
                             "id": str(notification.id),
@@ -347,6 +422,8 @@ class TestProfile(TestCase):
                             "post_slug": None,
                             "comment_slug": None,
                             "reply_slug": None,
+                            "target_text": None,
+                            "actor_count": 1,
                             "is_read": False,
                         }
                     ],
@@ -358,7 +435,6 @@ class TestProfile(TestCase):
         notification = await Notification.objects.acreate(
             ntype="ADMIN", text="A new update is coming!"
         )
-        await notification.receivers.aadd(self.verified_user)
 
         data = {"id": uuid.uuid4(), "mark_all_as_read": False}
 
@@ -391,3 +467,222 @@ class TestProfile(TestCase):
         self.assertEqual(
             response.json(), {"status": "success", "message": "Notification read"}
         )
+
+    async def test_mark_all_notifications_read(self):
+        notifications = [
+            await Notification.objects.acreate(ntype="ADMIN", text=f"Update {i}")
+            for i in range(2)
+        ]
+        data = {"mark_all_as_read": True}
+        response = await self.client.post(
+            self.notifications_url,
+            data,
+            content_type=self.content_type,
+            **self.bearer,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"status": "success", "message": "Notifications read"}
+        )
+
+        # Only the read watermark moved, newer notifications are unread
+        user = await User.objects.aget(id=self.verified_user.id)
+        self.assertIsNotNone(user.notifications_read_at)
+        self.assertFalse(await InboxEntry.objects.filter(is_read=True).aexists())
+        newer = await Notification.objects.acreate(ntype="ADMIN", text="Update 2")
+        response = await self.client.get(self.notifications_url, **self.bearer)
+        self.assertEqual(
+            [
+                (n["id"], n["is_read"])
+                for n in response.json()["data"]["notifications"]
+            ],
+            [
+                (str(newer.id), False),
+                (str(notifications[1].id), True),
+                (str(notifications[0].id), True),
+            ],
+        )
+
+    async def test_broadcast_notifications(self):
+        unverified_user = await User.objects.acreate_user(
+            first_name="Unverified",
+            last_name="User",
+            email="unverifieduser@example.com",
+            password="unverifieduser123",
+        )
+        verified_only = await Notification.objects.acreate(
+            ntype="ADMIN", text="For verified users", audience="VERIFIED"
+        )
+        for_all = await Notification.objects.acreate(ntype="ADMIN", text="For all")
+        later_user = await User.objects.acreate_user(
+            first_name="Later",
+            last_name="User",
+            email="lateruser@example.com",
+            password="lateruser123",
+        )
+
+        # Stored once, brought into the inboxes of its audience when they're read
+        self.assertFalse(await InboxEntry.objects.aexists())
+        for user, expected in (
+            (self.verified_user, {verified_only.id, for_all.id}),
+            (unverified_user, {for_all.id}),
+            (later_user, set()),
+        ):
+            await sync_to_async(sync_broadcasts)(user)
+            inbox = InboxEntry.objects.filter(user=user)
+            self.assertEqual({e.notification_id async for e in inbox}, expected)
+
+        # Dismissing removes it from that user's inbox only, for good
+        url = f"{self.notifications_url}{for_all.id}/"
+        response = await self.client.delete(url, **self.bearer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"status": "success", "message": "Notification dismissed"}
+        )
+        response = await self.client.get(self.notifications_url, **self.bearer)
+        self.assertEqual(
+            [n["id"] for n in response.json()["data"]["notifications"]],
+            [str(verified_only.id)],
+        )
+        self.assertTrue(
+            await InboxEntry.objects.filter(
+                user=unverified_user, notification=for_all
+            ).aexists()
+        )
+        response = await self.client.delete(url, **self.bearer)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_retrieve_notifications_conditionally(self):
+        response = await self.client.get(self.notifications_url, **self.bearer)
+        etag = response["ETag"]
+
+        # A new broadcast changes the version, without the poll bringing it in
+        await Notification.objects.acreate(ntype="ADMIN", text="A new update")
+        headers = {"If-None-Match": etag, **self.bearer}
+        response = await self.client.get(self.notifications_url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["data"]["notifications"]), 1)
+
+        # That ETag was of the inbox before the broadcast came in, then polls get 304s
+        for status_code in (200, 304, 304):
+            headers["If-None-Match"] = response["ETag"]
+            response = await self.client.get(self.notifications_url, **headers)
+            self.assertEqual(response.status_code, status_code)
+        self.assertEqual(await InboxEntry.objects.acount(), 1)
+
+        # Dismissing a read entry leaves the unread counter as is, not the version
+        notification = await Notification.objects.aget(ntype="ADMIN")
+        await sync_to_async(settle_entry)(self.verified_user, notification.id)
+        response = await self.client.get(self.notifications_url, **headers)
+        self.assertEqual(response.status_code, 200)
+        headers["If-None-Match"] = response["ETag"]
+        url = f"{self.notifications_url}{notification.id}/"
+        response = await self.client.delete(url, **self.bearer)
+        self.assertEqual(response.status_code, 200)
+        response = await self.client.get(self.notifications_url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["notifications"], [])
+
+    async def test_retrieve_badges(self):
+        badges_url = "/api/v2/profiles/badges/"
+        chats_url = "/api/v2/chats/"
+        await Notification.objects.acreate(ntype="ADMIN", text="A new update")
+
+        # A message from the other user makes a chat with one unread message
+        data = {"username": self.verified_user.username, "text": "Hello"}
+        response = await self.client.post(
+            chats_url, data, content_type=self.content_type, **self.other_user_bearer
+        )
+        self.assertEqual(response.status_code, 201)
+        chat_id = response.json()["data"]["chat_id"]
+
+        response = await self.client.get(badges_url, **self.bearer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "status": "success",
+                "message": "Badges fetched",
+                "data": {
+                    "notifications": 1,
+                    "chats": [{"chat_id": chat_id, "unread": 1}],
+                },
+            },
+        )
+
+        # Reading clears them, the sender's message isn't unread for the sender
+        await self.client.get(f"{chats_url}{chat_id}/", **self.bearer)
+        await self.client.post(
+            self.notifications_url,
+            {"mark_all_as_read": True},
+            content_type=self.content_type,
+            **self.bearer,
+        )
+        response = await self.client.get(badges_url, **self.bearer)
+        self.assertEqual(response.json()["data"], {"notifications": 0, "chats": []})
+        response = await self.client.get(badges_url, **self.other_user_bearer)
+        self.assertEqual(response.json()["data"]["chats"], [])
+
+    async def test_compact_notifications(self):
+        notification = await Notification.objects.acreate(
+            ntype="ADMIN", text="An old update"
+        )
+        await sync_to_async(sync_broadcasts)(self.verified_user)
+
+        # Past the retention, the entry is archived and the notification deleted
+        old = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS + 1)
+        await InboxEntry.objects.aupdate(created_at=old)
+        await Notification.objects.aupdate(created_at=old, updated_at=old)
+        compacted = await sync_to_async(compact_notifications)()
+        self.assertEqual(compacted, (1, 1, 0))
+        self.assertFalse(await Notification.objects.aexists())
+        user = await User.objects.aget(id=self.verified_user.id)
+        self.assertEqual(user.unread_notifications, 0)
+
+        response = await self.client.get(self.notifications_url, **self.bearer)
+        self.assertEqual(response.json()["data"]["notifications"], [])
+        response = await self.client.get(
+            self.notifications_url, {"archived": True}, **self.bearer
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["data"]["notifications"],
+            [
+                {
+                    "id": str(notification.id),
+                    "sender": None,
+                    "ntype": "ADMIN",
+                    "message": "An old update",
+                    "post_slug": None,
+                    "comment_slug": None,
+                    "reply_slug": None,
+                    "target_text": None,
+                    "actor_count": 1,
+                    "is_read": False,
+                }
+            ],
+        )
+
+    def test_sync_unread_counters(self):
+        Notification.objects.create(ntype="ADMIN", text="A new update")
+        sync_broadcasts(self.verified_user)
+        call_command("sync_unread_counters", "--check")
+
+        # Rebuild counters that drifted from the inboxes
+        User.objects.filter(id=self.verified_user.id).update(unread_notifications=5)
+        with self.assertRaises(SystemExit):
+            call_command("sync_unread_counters", "--check")
+        call_command("sync_unread_counters")
+        user = User.objects.get(id=self.verified_user.id)
+        self.assertEqual(user.unread_notifications, 1)
+
+    def test_drop_archive_partitions(self):
+        month = get_month(timezone.now() - timedelta(days=400))
+        create_partitions([month])
+        sql = f"CREATE TABLE {ARCHIVE_TABLE}_x PARTITION OF {ARCHIVE_TABLE} DEFAULT"
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+        # Only month partitions are dropped, others are left alone
+        self.assertEqual(drop_archive_partitions(get_next_month(month)), 1)
+        self.assertEqual(drop_archive_partitions(timezone.now()), 0)
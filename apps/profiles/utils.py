@@ -1,59 +1,88 @@
-from django.conf import settings
-import json, os, websockets
+from django.utils.text import Truncator
+from apps.common.realtime import enqueue_many
+from apps.feed.models import Comment, Reply
 from apps.profiles.schemas import NotificationSchema
 
+# Length of the notified object's text excerpt stored on a notification
+TARGET_TEXT_LENGTH = 100
+
 
 def get_notification_message(obj):
     """This function returns a notification message"""
     ntype = obj.ntype
-    message = f"{obj.sender.full_name} reacted to your post"
+    # The latest actor, and how many others acted too (see apps/profiles/coalescing.py)
+    actors = obj.sender.full_name
+    others = obj.actor_count - 1
+    if others:
+        actors = f"{actors} and {others} other{'s' if others > 1 else ''}"
+    message = f"{actors} reacted to your post"
     if ntype == "REACTION":
         if obj.comment_id:
-            message = f"{obj.sender.full_name} reacted to your comment"
+            message = f"{actors} reacted to your comment"
         elif obj.reply_id:
-            message = f"{obj.sender.full_name} reacted to your reply"
+            message = f"{actors} reacted to your reply"
     elif ntype == "COMMENT":
-        message = f"{obj.sender.full_name} commented on your post"
+        message = f"{actors} commented on your post"
     elif ntype == "REPLY":
-        message = f"{obj.sender.full_name} replied your comment"
+        message = f"{actors} replied your comment"
     return message
 
 
-async def sort_notification_slugs(notification):
-    if notification.post_id:
-        notification.post_slug = notification.post.slug
-    elif notification.comment_id:
-        notification.comment_slug = notification.comment.slug
-        notification.post_slug = notification.comment.post.slug
-    elif notification.reply_id:
-        notification.reply_slug = notification.reply.slug
-        notification.comment_slug = notification.reply.comment.slug
-        notification.post_slug = notification.reply.comment.post.slug
-    return notification
+def get_notification_target(obj):
+    """Returns the fields stored on a notification of obj (a post, comment, reply or
+    None): the slugs of obj and of the objects it belongs to, and an excerpt of its
+    text. A comment's post and a reply's comment and comment.post must be loaded."""
+    target = {"post_slug": None, "comment_slug": None, "reply_slug": None}
+    if isinstance(obj, Reply):
+        target["reply_slug"] = obj.slug
+        target["comment_slug"] = obj.comment.slug
+        target["post_slug"] = obj.comment.post.slug
+    elif isinstance(obj, Comment):
+        target["comment_slug"] = obj.slug
+        target["post_slug"] = obj.post.slug
+    elif obj:
+        target["post_slug"] = obj.slug
+    target["target_text"] = None
+    if obj:
+        target["target_text"] = Truncator(obj.text).chars(TARGET_TEXT_LENGTH)
+    return target
+
 
+def get_notification_group(user_id):
+    # Each user's sockets listen on their own group (see NotificationConsumer)
+    return f"notifications_{user_id}"
 
-# Send notification in websocket
-async def send_notification_in_socket(
-    secured: bool, host: str, notification: object, status: str = "CREATED"
+
+def get_notification_events(
+    notification: object, receiver_ids=(), status: str = "CREATED"
 ):
-    if os.environ.get("ENVIRONMENT") == "TESTING":
-        return
-    websocket_scheme = "wss://" if secured else "ws://"
-    uri = f"{websocket_scheme}{host}/api/v2/ws/notifications/"
+    # The socket events of the notification for its receivers, or for every user for an
+    # ADMIN notification (which is received by all). UPDATED: a coalesced one changed.
     notification_data = {
         "id": str(notification.id),
         "status": status,
         "ntype": notification.ntype,
     }
-    if status == "CREATED":
-        notification = await sort_notification_slugs(notification)
+    if status in ("CREATED", "UPDATED"):
         notification_data = notification_data | NotificationSchema.from_orm(
             notification
         ).dict(exclude={"id", "ntype"})
-    headers = [
-        ("Authorization", settings.SOCKET_SECRET),
-    ]
-    async with websockets.connect(uri, extra_headers=headers) as websocket:
-        # Send a notification to the WebSocket server
-        await websocket.send(json.dumps(notification_data))
-        await websocket.close()
+    event = {"type": "notification_message", "notification_data": notification_data}
+    if notification.ntype == "ADMIN":
+        event["audience"] = notification.audience
+        return [("notifications", event)]
+    return [(get_notification_group(user_id), event) for user_id in receiver_ids]
+
+
+def get_badge_event(user_id, badges: dict):
+    # The user's changed badge counters (notifications and/or chats, as in the badges
+    # endpoint) for their notification sockets
+    event = {"type": "badge_message", "badges": {"status": "BADGES"} | badges}
+    return get_notification_group(user_id), event
+
+
+def enqueue_badges(badges_by_user: dict):
+    # Queues the badge events of the users (by id), in the caller's transaction
+    enqueue_many(
+        [get_badge_event(user_id, badges) for user_id, badges in badges_by_user.items()]
+    )
@@ -5,26 +5,41 @@ from django.db.models import (
     When,
     Value,
     BooleanField,
-    CharField,
-    Exists,
-    OuterRef,
+    Max,
 )
-from django.db.models.functions import Coalesce
+from django.utils import timezone
 from ninja.router import Router
 from apps.accounts.models import User
 from apps.common.error import ErrorCode
 from apps.common.exceptions import RequestError
 from apps.common.models import File
 from apps.common.paginators import CustomPagination
+from apps.common.etags import conditional, get_auth_user
+from apps.common.microcache import cache_anonymous
+from apps.common.purge import tombstone
 from apps.common.responses import CustomResponse
 from apps.common.schemas import ResponseSchema
+from apps.common.singleflight import SingleFlight
 from apps.common.utils import AuthUser, set_dict_attr
 from apps.common.file_types import ALLOWED_IMAGE_TYPES
 from asgiref.sync import sync_to_async
-from apps.profiles.models import Friend, Notification
+from apps.chat.models import ChatReadState
+from apps.profiles.inbox import (
+    get_audiences,
+    get_inbox,
+    mark_all_read,
+    settle_entry,
+    sync_broadcasts,
+)
+from apps.profiles.models import (
+    ArchivedInboxEntry,
+    Friend,
+    Notification,
+)
 
 from apps.profiles.schemas import (
     AcceptFriendRequestSchema,
+    BadgesResponseSchema,
     CitiesResponseSchema,
     DeleteUserSchema,
     ProfileResponseSchema,
@@ -36,12 +51,16 @@ from apps.profiles.schemas import (
     ReadNotificationSchema,
 )
 from cities_light.models import City
+from uuid import UUID
 import re
 
 profiles_router = Router(tags=["Profiles"])
 
 paginator = CustomPagination()
 
+# Concurrent identical profile lookups share one query
+profile_lookups = SingleFlight("profile_lookups")
+
 
 def get_users_queryset(current_user):
     users = User.objects.annotate(city_name=F("city__name")).select_related("avatar")
@@ -121,7 +140,13 @@ async def retrieve_cities(request, name: str = None):
     description="This endpoint retrieves a particular user profile",
     response=ProfileResponseSchema,
 )
+@cache_anonymous
 async def retrieve_user_profile(request, username: str):
+    user = await profile_lookups.do(username, get_user_profile, username)
+    return CustomResponse.success(message="User details fetched", data=user)
+
+
+async def get_user_profile(username):
     user = (
         await User.objects.annotate(city_name=F("city__name"))
         .select_related("avatar")
@@ -133,7 +158,7 @@ async def retrieve_user_profile(request, username: str):
             err_msg="No user with that username",
             status_code=404,
         )
-    return CustomResponse.success(message="User details fetched", data=user)
+    return user
 
 
 @profiles_router.patch(
@@ -203,8 +228,17 @@ async def delete_user(request, data: DeleteUserSchema):
             data={"password": "Incorrect password"},
         )
 
-    # Delete user
-    await user.adelete()
+    # Delete user. Logged out and hidden right away, the account and everything
+    # of it are purged in the background. The username is released now, as new
+    # usernames are only checked against accounts that aren't deleted. Its updated_at
+    # is bumped for the posts lists' ETags, which its posts leave.
+    await sync_to_async(tombstone)(
+        user,
+        access=None,
+        refresh=None,
+        username=f"deleted-{user.id}",
+        updated_at=timezone.now(),
+    )
     return CustomResponse.success(message="User deleted")
 
 
@@ -358,52 +392,25 @@ async def accept_or_reject_friend_request(request, data: AcceptFriendRequestSche
     return CustomResponse.success(message=f"Friend Request {msg}", status_code=200)
 
 
+async def notifications_version(request, page=1, cursor=None, archived=False):
+    # The user's inbox_version is bumped by every change of their inbox or archive (see
+    # apps/profiles/inbox.py), it's on the row already loaded by the auth
+    user = await get_auth_user(request)
+    if archived:
+        return [user.id, "archived", user.inbox_version]
+    # Broadcasts are brought into the inbox by the view, not here, so polls that get
+    # a 304 write nothing. A new one changes the version through its created_at.
+    broadcasts = await Notification.objects.filter(
+        ntype="ADMIN", audience__in=get_audiences(user)
+    ).aaggregate(created_at=Max("created_at"))
+    return [user.id, user.inbox_version, broadcasts]
+
+
 async def get_notifications_queryset(current_user):
-    current_user_id = current_user.id
-    # Fetch current user notifications and set and post_slug, comment_slug is_read attribute for each notifications
-    notifications = (
-        Notification.objects.filter(receivers__id=current_user_id)
-        .select_related(
-            "sender",
-            "sender__avatar",
-        )
-        .annotate(
-            is_read=Exists(
-                Notification.objects.filter(id=OuterRef("pk"), read_by=current_user)
-            ),
-            post_slug=Coalesce(
-                Case(
-                    When(post__isnull=False, then=F("post__slug")),
-                    When(comment__isnull=False, then=F("comment__post__slug")),
-                    When(reply__isnull=False, then=F("reply__comment__post__slug")),
-                    default=None,
-                    output_field=CharField(),
-                ),
-                Value(None, output_field=CharField()),  # If none of the relations exist
-            ),
-            comment_slug=Coalesce(
-                Case(
-                    When(comment__isnull=False, then=F("comment__slug")),
-                    When(reply__isnull=False, then=F("reply__comment__slug")),
-                    default=None,
-                    output_field=CharField(),
-                ),
-                Value(None, output_field=CharField()),  # If none of the relations exist
-            ),
-            reply_slug=Coalesce(
-                Case(
-                    When(reply__isnull=False, then=F("reply__slug")),
-                    default=None,
-                    output_field=CharField(),
-                ),
-                Value(
-                    None, output_field=CharField()
-                ),  # If 'reply' relation does not exist
-            ),
-        )
-        .order_by("-created_at")
-    )
-    return notifications
+    # The current user's inbox, after bringing in the broadcasts made since they last
+    # looked. Slugs are stored on the notification, so only the sender is joined.
+    await sync_to_async(sync_broadcasts)(current_user)
+    return get_inbox(current_user)
 
 
 @profiles_router.get(
@@ -415,17 +422,39 @@ async def get_notifications_queryset(current_user):
             - Use post slug to navigate to the post.
             - Use comment slug to navigate to the comment.
             - Use reply slug to navigate to the reply.
+            - Pass the next_cursor or prev_cursor of a response as the cursor param to page by cursor (page is ignored then)
+            - Send the ETag of a previous response as If-None-Match to get a 304 if nothing changed
+            - Pass archived as true to list the notifications archived from the inbox after NOTIFICATION_RETENTION_DAYS (they're read-only). It's a separate listing: the inbox's cursors don't continue into it, page it from its first page
     """,
     response=NotificationsResponseSchema,
     auth=AuthUser(),
 )
-async def retrieve_user_notifications(request, page: int = 1):
+@conditional(notifications_version)
+async def retrieve_user_notifications(
+    request, page: int = 1, cursor: str = None, archived: bool = False
+):
     paginator.page_size = 50
     user = await request.auth
-    notifications = await get_notifications_queryset(user)
+    if archived:
+        # Archived entries hold a snapshot of their notification
+        archive = (
+            ArchivedInboxEntry.objects.filter(user=user)
+            .select_related("sender", "sender__avatar")
+            .order_by("-created_at")
+        )
+        paginated_data = await paginator.paginate_queryset(archive, page, cursor)
+        return CustomResponse.success(
+            message="Notifications fetched", data=paginated_data
+        )
 
-    # Return paginated data
-    paginated_data = await paginator.paginate_queryset(notifications, page)
+    inbox = await get_notifications_queryset(user)
+
+    # Return paginated data, the notifications of the inbox entries
+    paginated_data = await paginator.paginate_queryset(inbox, page, cursor)
+    paginated_data["items"] = [
+        set_dict_attr(entry.notification, {"is_read": entry.is_read_now})
+        for entry in paginated_data["items"]
+    ]
     return CustomResponse.success(message="Notifications fetched", data=paginated_data)
 
 
@@ -444,23 +473,64 @@ async def read_notification(request, data: ReadNotificationSchema):
     mark_all_as_read = data.mark_all_as_read
 
     resp_message = "Notifications read"
+    await sync_to_async(sync_broadcasts)(user)
     if mark_all_as_read:
-        # Mark all notifications as read
-        notifications = await sync_to_async(list)(
-            Notification.objects.filter(receivers__id=user.id)
-        )
-        await user.notifications_read.aadd(*notifications)
+        # Mark all notifications as read, by moving the user's read watermark
+        await sync_to_async(mark_all_read)(user)
     elif id:
         # Mark single notification as read
-        notification = await Notification.objects.filter(
-            receivers__id=user.id
-        ).aget_or_none(id=id)
-        if not notification:
+        counts = await sync_to_async(settle_entry)(user, id)
+        if counts is None:
             raise RequestError(
                 err_code=ErrorCode.NON_EXISTENT,
                 err_msg="User has no notification with that ID",
                 status_code=404,
             )
-        await notification.read_by.aadd(user)
         resp_message = "Notification read"
     return CustomResponse.success(message=resp_message)
+
+
+@profiles_router.delete(
+    "/notifications/{id}/",
+    summary="Dismiss Notification",
+    description="""
+        This endpoint removes a notification from the auth user's notifications
+    """,
+    response=ResponseSchema,
+    auth=AuthUser(),
+)
+async def dismiss_notification(request, id: UUID):
+    user = await request.auth
+    await sync_to_async(sync_broadcasts)(user)
+    counts = await sync_to_async(settle_entry)(user, id, dismiss=True)
+    if counts is None:
+        raise RequestError(
+            err_code=ErrorCode.NON_EXISTENT,
+            err_msg="User has no notification with that ID",
+            status_code=404,
+        )
+    return CustomResponse.success(message="Notification dismissed")
+
+
+@profiles_router.get(
+    "/badges/",
+    summary="Retrieve Auth User Badges",
+    description="""
+        This endpoint retrieves the auth user's unread counters: unread notifications and unread messages per chat (chats with none are left out)
+        Changes are also sent to the notification socket, with status "BADGES" and the changed counters only
+    """,
+    response=BadgesResponseSchema,
+    auth=AuthUser(),
+)
+async def retrieve_badges(request):
+    user = await request.auth
+    # Counts the broadcasts made since the user last looked too
+    await sync_to_async(sync_broadcasts)(user)
+    chats = ChatReadState.objects.filter(
+        user=user, unread__gt=0, chat__deleted_at=None
+    ).values("chat_id", "unread")
+    data = {
+        "notifications": user.unread_notifications,
+        "chats": [chat async for chat in chats],
+    }
+    return CustomResponse.success(message="Badges fetched", data=data)
@@ -127,6 +127,21 @@ CHANNEL_LAYERS = {
             "symmetric_encryption_keys": [SECRET_KEY],
         },
     },
+    # Used by tests (ENVIRONMENT=TESTING) instead, see apps/common/realtime.py
+    "testing": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+# CACHES
+# "shared" (Redis) is shared by all workers, e.g for pre-serialized response fragments
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config("REDIS_URL"),
+        "KEY_PREFIX": "socialnet",
+    },
 }
 
 # Password validation
@@ -348,7 +363,41 @@ FIRST_CLIENT_PASSWORD = config("FIRST_CLIENT_PASSWORD")
 CLOUDINARY_CLOUD_NAME = config("CLOUDINARY_CLOUD_NAME")
 CLOUDINARY_API_KEY = config("CLOUDINARY_API_KEY")
 CLOUDINARY_API_SECRET = config("CLOUDINARY_API_SECRET")
-SOCKET_SECRET = config("SOCKET_SECRET")
+
+# Number of an author's recent posts copied into a new friend's timeline
+TIMELINE_BACKFILL_SIZE = 200
+# Authors with this many friends have their posts pulled into timelines at read time
+# instead of being fanned out to every friend on write
+TIMELINE_FANOUT_THRESHOLD = 5000
+
+# Coalesce concurrent identical lookups across workers too (with a lock in the shared cache)
+SINGLE_FLIGHT_SHARED = config("SINGLE_FLIGHT_SHARED", default=False, cast=bool)
+
+# Seconds anonymous responses of public reads are cached for (0 turns it off), and for
+# how long after that a stale one is still served while it's being refreshed
+ANONYMOUS_CACHE_TIMEOUT = config("ANONYMOUS_CACHE_TIMEOUT", default=2, cast=int)
+ANONYMOUS_CACHE_STALE = config("ANONYMOUS_CACHE_STALE", default=10, cast=int)
+
+# Reactions, comments and replies on an object within windows of this many seconds are
+# notified as one ("X and 12 others reacted to your post")
+NOTIFICATION_COALESCE_WINDOW = config(
+    "NOTIFICATION_COALESCE_WINDOW", default=3600, cast=int
+)
+
+# Days notifications stay in inboxes before they're archived, and days the archive
+# keeps them (0 keeps them for good). See apps/profiles/retention.py
+NOTIFICATION_RETENTION_DAYS = config(
+    "NOTIFICATION_RETENTION_DAYS", default=90, cast=int
+)
+NOTIFICATION_ARCHIVE_DAYS = config("NOTIFICATION_ARCHIVE_DAYS", default=365, cast=int)
+
+# Socket events outbox (see apps/common/realtime.py): events sent per batch, seconds the
+# drain_outbox worker waits for new ones once caught up, and seconds before a failed
+# send is first retried (doubling after) and sends tried before giving up on an event
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=100, cast=int)
+OUTBOX_POLL_INTERVAL = config("OUTBOX_POLL_INTERVAL", default=0.2, cast=float)
+OUTBOX_RETRY_DELAY = config("OUTBOX_RETRY_DELAY", default=1, cast=int)
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", default=10, cast=int)
 
 # TODO
 # You can set a file limit to your cloudinary so that the presigned data can only accept a particular file size range to upload image. You can also add file type validations